@@ -1,11 +1,160 @@
 #!/usr/bin/env python3
 # coding=utf-8
 
+import argparse
+import hashlib
+import io
 import json
+import marshal
+import multiprocessing
+import os
+import pickle
+import re
 import sqlite3
+import struct
+import tempfile
+import zipfile
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
+from json.decoder import WHITESPACE
+from multiprocessing.connection import Connection, wait
 from pathlib import Path
-from typing import Callable, Dict, List
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+# number of characters read from a JSON file at a time
+JSON_CHUNK_SIZE = 1 << 20
+# characters a number can go on with up to the end of the buffer
+NUMBER_TAIL = re.compile(r'[-+.eE0-9]*\Z')
+# number of foods whose rows are inserted together
+BATCH_SIZE = 1000
+# page cache used while building the database, in KiB
+BULK_LOAD_CACHE_SIZE_KIB = 64 * 1024
+# number of bytes read at a time when computing checksums
+CHECKSUM_CHUNK_SIZE = 1 << 20
+# length prefix of the row batches passed between processes
+SPOOL_RECORD_HEADER = struct.Struct('<Q')
+
+
+def file_sha256(path: Path) -> str:
+    sha256 = hashlib.sha256()
+    with path.open('rb') as f:
+        while chunk := f.read(CHECKSUM_CHUNK_SIZE):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class JsonStreamReader:
+    """
+    Reads JSON values one at a time from a file, keeping only the current value and a buffer in memory.
+    """
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file: TextIO, chunk_size: int = JSON_CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """
+        Reads more of the file into the buffer, dropping what has already been consumed. Returns False at the end of
+        the file.
+        """
+        if self.eof:
+            return False
+        # read at least as much as is left in the buffer, so values spanning many chunks aren't decoded over and over
+        chunk = self.file.read(max(self.chunk_size, len(self.buffer) - self.pos))
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Skips whitespace and returns the next character without consuming it, or an empty string at the end of the
+        file.
+        """
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str):
+        next_char = self.peek()
+        if next_char != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}, got {next_char!r}", self.buffer, self.pos)
+        self.pos += 1
+
+    def skip(self, char: str) -> bool:
+        """
+        Consumes the next character if it is `char` and returns whether it was.
+        """
+        if self.peek() == char:
+            self.pos += 1
+            return True
+        return False
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number at the end of the buffer might continue in the next chunk, even after what was decoded, as
+                # in '0' of '0.1'
+                is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+                if self.eof or not (is_number and NUMBER_TAIL.match(self.buffer, end)):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def iter_array_in_object(self, key: str) -> Iterator[Any]:
+        """
+        Yields the items of the array under `key` in a top-level JSON object, one at a time. Other members of the
+        object are parsed as a whole and skipped.
+        """
+        self.expect("{")
+        if self.skip("}"):
+            return
+        while True:
+            member_key = self.value()
+            self.expect(":")
+            if member_key == key:
+                self.expect("[")
+                if not self.skip("]"):
+                    while True:
+                        yield self.value()
+                        if not self.skip(","):
+                            break
+                    self.expect("]")
+            else:
+                self.value()
+            if not self.skip(","):
+                break
+        self.expect("}")
 
 
 @dataclass
@@ -14,11 +163,73 @@ class FoodDataFile:
     list_name: str
     food_id_key: str
     description_lambda: Callable[[Dict], str]
+    # the archive as downloaded, containing `file_path`
+    zip_path: Optional[str] = None
+    # SHA-256 checksum the archive (or JSON file) has to have, if pinned. FoodData Central publishes no checksums for
+    # its downloads, so none of the datasets below pins one and the zip CRCs are all that is verified about them.
+    sha256: Optional[str] = None
+
+    def source_path(self) -> Path:
+        """
+        Path of the archive if it is there, otherwise of the extracted JSON file. Both are looked for in the directory
+        given by the FOODDATA_DIR environment variable, or else the current directory.
+        """
+        directory = Path(os.environ.get('FOODDATA_DIR') or '.')
+        if self.zip_path is not None and (directory / self.zip_path).is_file():
+            return directory / self.zip_path
+        return directory / self.file_path
+
+    def checksum(self) -> str:
+        """
+        Computes the checksum of the source file, verifying it against the pinned one if there is one. Without a pinned
+        checksum this only tells whether the file changed since the last import, not whether it is the published one.
+        """
+        path = self.source_path()
+        sha256 = file_sha256(path)
+        if self.sha256 is not None and sha256 != self.sha256:
+            raise ValueError(f"Checksum mismatch for '{path}': expected {self.sha256}, got {sha256}")
+        return sha256
+
+    @contextmanager
+    def open(self) -> Iterator[TextIO]:
+        """
+        Opens the JSON file, streaming it straight out of the archive if there is one.
+        """
+        path = self.source_path()
+        if path.suffix != '.zip':
+            with path.open('r', encoding='utf-8') as file:
+                yield file
+            return
+        with zipfile.ZipFile(path) as archive:
+            # the member's CRC is checked once it has been read completely
+            with archive.open(self._find_member(archive)) as member:
+                yield io.TextIOWrapper(member, encoding='utf-8')
+
+    def _find_member(self, archive: zipfile.ZipFile) -> str:
+        names = [name for name in archive.namelist() if not name.endswith('/')]
+        matching_names = [name for name in names if Path(name).name == Path(self.file_path).name]
+        if len(matching_names) != 1:
+            # fall back to the only JSON file in the archive, in case it was renamed
+            matching_names = [name for name in names if name.endswith('.json')]
+        if len(matching_names) != 1:
+            raise ValueError(f"Can't find '{self.file_path}' in '{archive.filename}'")
+        return matching_names[0]
 
-    def load_data(self) -> List[Dict]:
-        with open(self.file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        return data.get(self.list_name, [])
+    def iter_items(self) -> Iterator[Dict]:
+        """
+        Yields the foods in the file one at a time, without loading the whole file.
+        """
+        with self.open() as file:
+            yield from JsonStreamReader(file).iter_array_in_object(self.list_name)
+
+
+# module-level functions rather than lambdas, so that FoodDataFile objects can be pickled and sent to worker processes
+def get_wweia_food_category_description(item: Dict) -> str:
+    return item.get('wweiaFoodCategory', {}).get('wweiaFoodCategoryDescription')
+
+
+def get_food_category_description(item: Dict) -> str:
+    return item.get('foodCategory', {}).get('description')
 
 
 # Define file paths and data extraction methods
@@ -26,49 +237,60 @@ class FoodDataFile:
 # https://fdc.nal.usda.gov/fdc-datasets/FoodData_Central_survey_food_json_2022-10-28.zip
 SURVEY_FOOD = FoodDataFile(
     file_path='FoodData_Central_survey_food_json_2022-10-28.json',
+    zip_path='FoodData_Central_survey_food_json_2022-10-28.zip',
     list_name='SurveyFoods',
     food_id_key='foodCode',
-    description_lambda=lambda item: item.get('wweiaFoodCategory', {}).get('wweiaFoodCategoryDescription'),
+    description_lambda=get_wweia_food_category_description,
 )
 
 # SR Legacy 4/2018
 # https://fdc.nal.usda.gov/fdc-datasets/FoodData_Central_sr_legacy_food_json_2018-04.zip
 SR_LEGACY_FOOD = FoodDataFile(
     file_path='FoodData_Central_sr_legacy_food_json_2021-10-28.json',
+    zip_path='FoodData_Central_sr_legacy_food_json_2018-04.zip',
     list_name='SRLegacyFoods',
     food_id_key='ndbNumber',
-    description_lambda=lambda item: item.get('foodCategory', {}).get('description'),
+    description_lambda=get_food_category_description,
 )
 
 # Foundation Foods 04/2024
 # https://fdc.nal.usda.gov/fdc-datasets/FoodData_Central_foundation_food_json_2024-04-18.zip
 FOUNDATION_FOOD = FoodDataFile(
     file_path='foundationDownload.json',
+    zip_path='FoodData_Central_foundation_food_json_2024-04-18.zip',
     list_name='FoundationFoods',
     food_id_key='ndbNumber',
-    description_lambda=lambda item: item.get('foodCategory', {}).get('description'),
+    description_lambda=get_food_category_description,
 )
+FOOD_DATA_FILES = [SURVEY_FOOD, SR_LEGACY_FOOD, FOUNDATION_FOOD]
 DATABASE_PATH = 'food_data.db'
 
-# Clean old database first
-db_file = Path(DATABASE_PATH)
-if db_file.is_file():
-    try:
-        db_file.unlink()
-        print(f"Database file '{DATABASE_PATH}' has been deleted.")
-    except Exception as e:
-        print(f"An error occurred while trying to delete the file '{DATABASE_PATH}': {e}")
-        exit(1)
-
-# Create a new SQLite database (or connect to an existing one)
-print("Opening Database")
-conn = sqlite3.connect(DATABASE_PATH)
-cursor = conn.cursor()
-
-# Create tables
-print("Start Database population")
-cursor.execute(
-    '''
+
+def create_database(database_path: str) -> sqlite3.Connection:
+    # Clean old database first
+    db_file = Path(database_path)
+    if db_file.is_file():
+        try:
+            db_file.unlink()
+            print(f"Database file '{database_path}' has been deleted.")
+        except Exception as e:
+            print(f"An error occurred while trying to delete the file '{database_path}': {e}")
+            exit(1)
+
+    # Create a new SQLite database (or connect to an existing one)
+    print("Opening Database")
+    conn = sqlite3.connect(database_path)
+    # The database is built from scratch and simply built again if that fails, so there is no need for a rollback
+    # journal or for syncing to disk while loading. Neither setting is stored in the database.
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    conn.execute(f'PRAGMA cache_size = -{BULK_LOAD_CACHE_SIZE_KIB}')
+    cursor = conn.cursor()
+
+    # Create tables
+    print("Start Database population")
+    cursor.execute('''
 CREATE TABLE IF NOT EXISTS Food (
     food_id INTEGER PRIMARY KEY,
     fdc_id INTEGER,
@@ -76,11 +298,9 @@ CREATE TABLE IF NOT EXISTS Food (
     category TEXT,
     diet_category TEXT
 )
-'''
-)
+''')
 
-cursor.execute(
-    '''
+    cursor.execute('''
 CREATE TABLE IF NOT EXISTS FoodNutrition (
     food_id INTEGER,
     nutrition_id INTEGER,
@@ -88,93 +308,493 @@ CREATE TABLE IF NOT EXISTS FoodNutrition (
     FOREIGN KEY (food_id) REFERENCES Food(id),
     FOREIGN KEY (nutrition_id) REFERENCES Nutritions(id)
 )
-'''
-)
+''')
 
-cursor.execute(
-    '''
+    cursor.execute('''
 CREATE TABLE IF NOT EXISTS FoodIngredients (
     food_id INTEGER,
     ingredient_id INTEGER,
     amount REAL,
     FOREIGN KEY (food_id) REFERENCES Food(id)
 )
-'''
-)
+''')
 
-cursor.execute(
-    '''
+    cursor.execute('''
 CREATE TABLE IF NOT EXISTS Nutritions (
     nutrition_id INTEGER PRIMARY KEY,
     name TEXT,
     rank INTEGER,
     unitName TEXT
 )
-'''
+''')
+
+    # what each food looked like when it was imported, to only update foods that changed with --upsert
+    cursor.execute('''
+CREATE TABLE IF NOT EXISTS FoodImportState (
+    food_id INTEGER PRIMARY KEY,
+    fdc_id INTEGER,
+    content_hash BLOB
 )
+''')
 
-# Create indexes for faster searching
-cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_category ON Food (category)')
-cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_ingredients_food_id ON FoodIngredients (food_id)')
-cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_diet_category ON Food (diet_category)')
+    # foods changed by --upsert since their diet categories were last computed
+    cursor.execute('''
+CREATE TABLE IF NOT EXISTS ChangedFoods (
+    food_id INTEGER PRIMARY KEY
+)
+''')
 
+    return conn
 
-# Function to insert data into the Food table
-def insert_food_data(food_file: FoodDataFile):
 
-    cursor.execute('SELECT food_id FROM Food')
-    existing_food_ids = {row[0] for row in cursor.fetchall()}
+def read_imported_checksums(database_path: str) -> Dict[str, str]:
+    """
+    Returns the checksums of the files the existing database was built from, by list name.
+    """
+    if not Path(database_path).is_file():
+        return {}
+    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        return dict(conn.execute('SELECT list_name, sha256 FROM ImportedArchives'))
+    except sqlite3.DatabaseError:
+        # built before checksums were recorded
+        return {}
+    finally:
+        conn.close()
 
-    food_data = food_file.load_data()
-    for item in food_data:
-        food_id = item.get(food_file.food_id_key)
 
-        if food_id in existing_food_ids:
-            continue  # Skip this item if food_id already exists
+def find_changed_files(imported_checksums: Dict[str, str], checksums: Dict[str, str]) -> List[str]:
+    """
+    Returns the list names of the files that were imported before but whose checksum changed since.
+    """
+    return [
+        list_name
+        for list_name, sha256 in checksums.items()
+        if list_name in imported_checksums and imported_checksums[list_name] != sha256
+    ]
 
+
+def record_imported_checksums(cursor: sqlite3.Cursor, checksums: Dict[str, str]):
+    cursor.execute('CREATE TABLE IF NOT EXISTS ImportedArchives (list_name TEXT PRIMARY KEY, sha256 TEXT)')
+    cursor.execute('DELETE FROM ImportedArchives')
+    cursor.executemany('INSERT INTO ImportedArchives (list_name, sha256) VALUES (?, ?)', checksums.items())
+
+
+def create_indexes(cursor: sqlite3.Cursor):
+    # Create indexes for faster searching
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_category ON Food (category)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_ingredients_food_id ON FoodIngredients (food_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_food_diet_category ON Food (diet_category)')
+
+
+class RowBatch(NamedTuple):
+    """
+    Rows for all tables, shaped from a batch of foods.
+    """
+
+    foods: List[Tuple]
+    food_nutritions: List[Tuple]
+    food_ingredients: List[Tuple]
+    # the first row seen for each nutrition in the batch
+    nutritions: Dict[int, Tuple]
+    # food ID, FDC ID and content hash of each food, to tell which foods changed between imports
+    import_states: List[Tuple]
+
+
+def hash_food_rows(food: Tuple, food_nutritions: Sequence[Tuple], food_ingredients: Sequence[Tuple]) -> bytes:
+    # marshal is much faster than repr, and unlike later versions, version 2 doesn't depend on object identities
+    rows = marshal.dumps((food, food_nutritions, food_ingredients), 2)
+    return hashlib.blake2b(rows, digest_size=16).digest()
+
+
+def iter_row_batches(food_file: FoodDataFile, batch_size: int = BATCH_SIZE) -> Iterator[RowBatch]:
+    """
+    Reads the foods of a file and turns them into batches of rows for up to `batch_size` foods each.
+    """
+    batch = RowBatch([], [], [], {}, [])
+    for item in food_file.iter_items():
+        food_id = item.get(food_file.food_id_key)
         fdc_id = item.get('fdcId')
         description = item.get('description')
         category = food_file.description_lambda(item)
+        food = (food_id, fdc_id, description, category)
+        batch.foods.append(food)
 
-        cursor.execute(
-            'INSERT INTO Food (food_id, fdc_id, description, category) VALUES (?, ?, ?, ?)',
-            (food_id, fdc_id, description, category),
-        )
-
+        food_nutritions_start = len(batch.food_nutritions)
         for nutrient in item.get('foodNutrients', []):
             nutrition_id = nutrient['nutrient']['id']
-            nutrition_name = nutrient['nutrient']['name']
-            nutrition_rank = nutrient['nutrient']['rank']
-            nutrition_unit = nutrient['nutrient']['unitName']
+            if nutrition_id not in batch.nutritions:
+                nutrition_name = nutrient['nutrient']['name']
+                nutrition_rank = nutrient['nutrient']['rank']
+                nutrition_unit = nutrient['nutrient']['unitName']
+                batch.nutritions[nutrition_id] = (nutrition_id, nutrition_name, nutrition_rank, nutrition_unit)
             amount = nutrient.get('amount', 0.0)
+            batch.food_nutritions.append((food_id, nutrition_id, amount))
 
-            cursor.execute(
-                'INSERT OR IGNORE INTO Nutritions (nutrition_id, name, rank, unitName) VALUES (?, ?, ?, ?)',
-                (nutrition_id, nutrition_name, nutrition_rank, nutrition_unit),
-            )
-            cursor.execute(
-                'INSERT INTO FoodNutrition (food_id, nutrition_id, amount) VALUES (?, ?, ?)',
-                (food_id, nutrition_id, amount),
-            )
-
+        food_ingredients_start = len(batch.food_ingredients)
         for ingredient in item.get('inputFoods', []):
             ingredient_id = ingredient.get('ingredientCode')
             if ingredient_id is None:
                 continue
             amount = ingredient.get('amount', 0.0)
-            cursor.execute(
-                'INSERT INTO FoodIngredients (food_id, ingredient_id, amount) VALUES (?, ?, ?)',
-                (food_id, ingredient_id, amount),
+            batch.food_ingredients.append((food_id, ingredient_id, amount))
+
+        content_hash = hash_food_rows(
+            food,
+            batch.food_nutritions[food_nutritions_start:],
+            batch.food_ingredients[food_ingredients_start:],
+        )
+        batch.import_states.append((food_id, fdc_id, content_hash))
+
+        if len(batch.foods) >= batch_size:
+            yield batch
+            batch = RowBatch([], [], [], {}, [])
+    if batch.foods:
+        yield batch
+
+
+def write_row_batch(cursor: sqlite3.Cursor, batch: RowBatch, nutrition_ids: Set[int], upsert: bool = False):
+    """
+    Inserts a batch of rows. Nutritions whose ID is in `nutrition_ids` are already in the database and are skipped,
+    new ones are added to it.
+
+    With `upsert`, foods that are already in the database are updated instead and their diet category is reset. Their
+    old nutrition and ingredient rows are left for `upsert_row_batches` to delete.
+    """
+    if upsert:
+        cursor.executemany(
+            '''
+INSERT INTO Food (food_id, fdc_id, description, category) VALUES (?, ?, ?, ?)
+ON CONFLICT (food_id) DO UPDATE SET
+    fdc_id = excluded.fdc_id,
+    description = excluded.description,
+    category = excluded.category,
+    diet_category = NULL
+''',
+            batch.foods,
+        )
+    else:
+        cursor.executemany('INSERT INTO Food (food_id, fdc_id, description, category) VALUES (?, ?, ?, ?)', batch.foods)
+    new_nutritions = [row for nutrition_id, row in batch.nutritions.items() if nutrition_id not in nutrition_ids]
+    cursor.executemany(
+        'INSERT INTO Nutritions (nutrition_id, name, rank, unitName) VALUES (?, ?, ?, ?)',
+        new_nutritions,
+    )
+    nutrition_ids.update(row[0] for row in new_nutritions)
+    cursor.executemany(
+        'INSERT INTO FoodNutrition (food_id, nutrition_id, amount) VALUES (?, ?, ?)',
+        batch.food_nutritions,
+    )
+    cursor.executemany(
+        'INSERT INTO FoodIngredients (food_id, ingredient_id, amount) VALUES (?, ?, ?)',
+        batch.food_ingredients,
+    )
+    cursor.executemany(
+        'INSERT OR REPLACE INTO FoodImportState (food_id, fdc_id, content_hash) VALUES (?, ?, ?)',
+        batch.import_states,
+    )
+
+
+def drop_foods(batch: RowBatch, food_ids: Container[int]) -> RowBatch:
+    """
+    Returns the batch without the rows of the given foods.
+    """
+    foods = [row for row in batch.foods if row[0] not in food_ids]
+    if len(foods) == len(batch.foods):
+        return batch
+    food_nutritions = [row for row in batch.food_nutritions if row[0] not in food_ids]
+    food_ingredients = [row for row in batch.food_ingredients if row[0] not in food_ids]
+    # nutritions only seen in dropped foods are dropped too (all rows of a nutrition are the same)
+    remaining_nutrition_ids = {row[1] for row in food_nutritions}
+    nutritions = {
+        nutrition_id: row for nutrition_id, row in batch.nutritions.items() if nutrition_id in remaining_nutrition_ids
+    }
+    import_states = [row for row in batch.import_states if row[0] not in food_ids]
+    return RowBatch(foods, food_nutritions, food_ingredients, nutritions, import_states)
+
+
+def drop_repeated_foods(indexed_batches: Iterable[Tuple[int, RowBatch]]) -> Iterator[RowBatch]:
+    """
+    Drops foods that were already in an earlier file from batches tagged with the index of their file, so that the
+    first file containing a food wins.
+    """
+    earlier_food_ids: Set[int] = set()
+    current_food_ids: Set[int] = set()
+    current_index = 0
+    for index, batch in indexed_batches:
+        if index != current_index:
+            earlier_food_ids |= current_food_ids
+            current_food_ids = set()
+            current_index = index
+        batch = drop_foods(batch, earlier_food_ids)
+        current_food_ids.update(row[0] for row in batch.foods)
+        yield batch
+
+
+def send_row_batches(food_file: FoodDataFile, connection: Connection):
+    """
+    Worker process reading a file and sending its row batches to the writer, followed by an empty message.
+    """
+    for batch in iter_row_batches(food_file):
+        connection.send_bytes(pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL))
+    connection.send_bytes(b'')
+    connection.close()
+
+
+def read_spooled_row_batches(spool: IO[bytes]) -> Iterator[RowBatch]:
+    spool.seek(0)
+    while header := spool.read(SPOOL_RECORD_HEADER.size):
+        (size,) = SPOOL_RECORD_HEADER.unpack(header)
+        yield pickle.loads(spool.read(size))
+
+
+def iter_row_batches_in_parallel(food_files: Sequence[FoodDataFile], jobs: int) -> Iterator[Tuple[int, RowBatch]]:
+    """
+    Like reading each file in turn, but reads up to `jobs` files at the same time in worker processes. Batches are
+    tagged with the index of their file.
+
+    Batches still come in the same order, so whatever is written from them ends up exactly the same. Batches of files
+    whose turn hasn't come yet are spooled to temporary files in the meantime, so the workers never have to wait for
+    each other.
+    """
+    processes: Dict[int, multiprocessing.Process] = {}
+    connections: Dict[Connection, int] = {}
+    spools = [tempfile.TemporaryFile() for _ in food_files]
+    finished = [False] * len(food_files)
+    next_to_start = 0
+    current = 0
+
+    try:
+        while current < len(food_files):
+            while next_to_start < len(food_files) and len(processes) < jobs:
+                receiver, sender = multiprocessing.Pipe(duplex=False)
+                process = multiprocessing.Process(
+                    target=send_row_batches,
+                    args=(food_files[next_to_start], sender),
+                    daemon=True,
+                )
+                process.start()
+                sender.close()
+                processes[next_to_start] = process
+                connections[receiver] = next_to_start
+                next_to_start += 1
+
+            for connection in wait(list(connections)):
+                index = connections[connection]
+                try:
+                    data = connection.recv_bytes()
+                except EOFError:
+                    raise RuntimeError(f"Reading '{food_files[index].source_path()}' failed") from None
+                if not data:
+                    finished[index] = True
+                    del connections[connection]
+                    connection.close()
+                    processes.pop(index).join()
+                elif index == current:
+                    yield index, pickle.loads(data)
+                else:
+                    spools[index].write(SPOOL_RECORD_HEADER.pack(len(data)))
+                    spools[index].write(data)
+
+            # the next file continues with what was spooled while it waited, before reading any more from its worker
+            while current < len(food_files) and finished[current]:
+                current += 1
+                if current < len(food_files):
+                    for batch in read_spooled_row_batches(spools[current]):
+                        yield current, batch
+                    spools[current].close()
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.join()
+        for connection in connections:
+            connection.close()
+        for spool in spools:
+            spool.close()
+
+
+def iter_imported_row_batches(food_files: Sequence[FoodDataFile], jobs: int = 1) -> Iterator[RowBatch]:
+    """
+    Yields the row batches of all files in order, reading them in `jobs` processes, without foods of earlier files.
+    """
+    if jobs > 1:
+        print(f"Reading {len(food_files)} files using up to {jobs} processes")
+        indexed_batches = iter_row_batches_in_parallel(food_files, jobs)
+    else:
+        indexed_batches = (
+            (index, batch) for index, food_file in enumerate(food_files) for batch in iter_row_batches(food_file)
+        )
+    with closing(indexed_batches):
+        yield from drop_repeated_foods(indexed_batches)
+
+
+def has_import_state(database_path: str) -> bool:
+    if not Path(database_path).is_file():
+        return False
+    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'FoodImportState'").fetchone() is not None
+    finally:
+        conn.close()
+
+
+def upsert_row_batches(cursor: sqlite3.Cursor, batches: Iterable[RowBatch]) -> Tuple[int, int, int]:
+    """
+    Brings the database in line with the given batches, which have to contain all foods. Only foods whose content
+    changed are written, foods that are gone are deleted. Computed diet categories of all other foods are kept.
+
+    Nutritions whose name, rank or unit changed are updated, no matter if any food using them changed. Changed foods
+    and foods containing deleted ones are added to the ChangedFoods table, for `food-categorizer generate
+    --incremental` to recategorize. Returns the number of inserted, updated and deleted foods.
+    """
+    cursor.execute('SELECT food_id, fdc_id, content_hash FROM FoodImportState')
+    previous_states = {food_id: (fdc_id, content_hash) for food_id, fdc_id, content_hash in cursor.fetchall()}
+    cursor.execute('SELECT nutrition_id, name, rank, unitName FROM Nutritions')
+    previous_nutritions = {row[0]: row for row in cursor.fetchall()}
+    # nutritions seen in this import, only the first row of each counts, as when building from scratch
+    nutrition_ids: Set[int] = set()
+    # rows after these are the ones written now, so older rows of updated foods can be told apart and deleted at once
+    cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM FoodNutrition')
+    (last_food_nutrition_rowid,) = cursor.fetchone()
+    cursor.execute('SELECT COALESCE(MAX(rowid), 0) FROM FoodIngredients')
+    (last_food_ingredient_rowid,) = cursor.fetchone()
+
+    cursor.execute('CREATE TEMP TABLE UpdatedFoods (food_id INTEGER PRIMARY KEY)')
+    cursor.execute('CREATE TEMP TABLE DeletedFoods (food_id INTEGER PRIMARY KEY)')
+    imported_food_ids: Set[int] = set()
+    n_inserted = n_updated = 0
+    for batch in batches:
+        imported_food_ids.update(row[0] for row in batch.foods)
+        # the content hash only covers a food's own rows, so nutritions are compared before unchanged foods are dropped
+        changed_nutritions = [
+            row
+            for nutrition_id, row in batch.nutritions.items()
+            if nutrition_id not in nutrition_ids and previous_nutritions.get(nutrition_id) != row
+        ]
+        nutrition_ids.update(batch.nutritions)
+        cursor.executemany(
+            '''
+INSERT INTO Nutritions (nutrition_id, name, rank, unitName) VALUES (?, ?, ?, ?)
+ON CONFLICT (nutrition_id) DO UPDATE SET
+    name = excluded.name,
+    rank = excluded.rank,
+    unitName = excluded.unitName
+''',
+            changed_nutritions,
+        )
+        unchanged_food_ids = {
+            food_id
+            for food_id, fdc_id, content_hash in batch.import_states
+            if previous_states.get(food_id) == (fdc_id, content_hash)
+        }
+        batch = drop_foods(batch, unchanged_food_ids)
+        if not batch.foods:
+            continue
+        updated_food_ids = [(row[0],) for row in batch.foods if row[0] in previous_states]
+        n_updated += len(updated_food_ids)
+        n_inserted += len(batch.foods) - len(updated_food_ids)
+        cursor.executemany('INSERT INTO temp.UpdatedFoods (food_id) VALUES (?)', updated_food_ids)
+        cursor.executemany('INSERT OR IGNORE INTO ChangedFoods (food_id) VALUES (?)', [row[:1] for row in batch.foods])
+        write_row_batch(cursor, batch, nutrition_ids, upsert=True)
+
+    deleted_food_ids = [(food_id,) for food_id in previous_states if food_id not in imported_food_ids]
+    cursor.executemany('INSERT INTO temp.DeletedFoods (food_id) VALUES (?)', deleted_food_ids)
+    for table in ['Food', 'FoodNutrition', 'FoodIngredients', 'FoodImportState', 'ChangedFoods']:
+        cursor.execute(f'DELETE FROM {table} WHERE food_id IN (SELECT food_id FROM temp.DeletedFoods)')
+    # foods containing deleted foods keep their rows, but their category might not hold anymore
+    cursor.execute('''
+INSERT OR IGNORE INTO ChangedFoods (food_id)
+SELECT food_id FROM FoodIngredients WHERE ingredient_id IN (SELECT food_id FROM temp.DeletedFoods)
+''')
+    # a single pass over each table, no matter how many foods changed
+    cursor.execute(
+        'DELETE FROM FoodNutrition WHERE rowid <= ? AND food_id IN (SELECT food_id FROM temp.UpdatedFoods)',
+        (last_food_nutrition_rowid,),
+    )
+    cursor.execute(
+        'DELETE FROM FoodIngredients WHERE rowid <= ? AND food_id IN (SELECT food_id FROM temp.UpdatedFoods)',
+        (last_food_ingredient_rowid,),
+    )
+    if n_updated or deleted_food_ids:
+        cursor.execute('DELETE FROM Nutritions WHERE nutrition_id NOT IN (SELECT nutrition_id FROM FoodNutrition)')
+    cursor.execute('DROP TABLE temp.UpdatedFoods')
+    cursor.execute('DROP TABLE temp.DeletedFoods')
+    return n_inserted, n_updated, len(deleted_food_ids)
+
+
+def main(force: bool = False, jobs: int = 1, upsert: bool = False):
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+
+    checksums = {food_file.list_name: food_file.checksum() for food_file in FOOD_DATA_FILES}
+    imported_checksums = read_imported_checksums(DATABASE_PATH)
+    if not force:
+        if imported_checksums == checksums:
+            # the precedence between datasets makes them depend on each other, so it's all or nothing
+            print(f"Database '{DATABASE_PATH}' is up to date, none of the food data files changed")
+            return
+        # there are no published checksums to tell a new release from a corrupted or tampered download
+        changed_files = find_changed_files(imported_checksums, checksums)
+        if changed_files:
+            print(
+                f"The food data files of {', '.join(changed_files)} differ from the ones '{DATABASE_PATH}' was built "
+                "from, use --force to import them anyway"
             )
+            exit(1)
+
+    batches = iter_imported_row_batches(FOOD_DATA_FILES, jobs)
+    if upsert and has_import_state(DATABASE_PATH):
+        print(f"Updating Database '{DATABASE_PATH}'")
+        conn = sqlite3.connect(DATABASE_PATH)
+        conn.execute(f'PRAGMA cache_size = -{BULK_LOAD_CACHE_SIZE_KIB}')
+        cursor = conn.cursor()
+        n_inserted, n_updated, n_deleted = upsert_row_batches(cursor, batches)
+        print(f"{n_inserted} foods inserted, {n_updated} updated, {n_deleted} deleted")
+    else:
+        if upsert:
+            print(f"Database '{DATABASE_PATH}' has no import state to compare to, building it from scratch")
+        conn = create_database(DATABASE_PATH)
+        cursor = conn.cursor()
+
+        # Insert data into the database
+        nutrition_ids: Set[int] = set()
+        for batch in batches:
+            write_row_batch(cursor, batch, nutrition_ids)
+
+        # Indexes are much cheaper to build once all data is in than to keep up to date while inserting
+        create_indexes(cursor)
+    record_imported_checksums(cursor, checksums)
 
+    # Commit the changes and close the connection
+    conn.commit()
+    conn.close()
 
-# Insert data into the database
-insert_food_data(SURVEY_FOOD)
-insert_food_data(SR_LEGACY_FOOD)
-insert_food_data(FOUNDATION_FOOD)
+    print("Database population completed successfully")
 
-# Commit the changes and close the connection
-conn.commit()
-conn.close()
 
-print("Database population completed successfully")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the food database from FoodData Central downloads")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help=(
+            "import the food data files even if none of them changed since the database was last built, or if some of "
+            "them changed"
+        ),
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to read the food data files with, 0 to use all CPUs (default: 1)",
+    )
+    parser.add_argument(
+        "--upsert",
+        action="store_true",
+        help=(
+            "update the existing database in place, only writing foods that changed and keeping the diet categories of "
+            "all others (these foods are recategorized by `food-categorizer generate --incremental`)"
+        ),
+    )
+    main(**vars(parser.parse_args()))
@@ -0,0 +1,24 @@
+from pathlib import Path
+from typing import Optional
+
+from food_categorizer.description_based_categorizer import (
+    TOKEN_FINDER,
+    categories_to_tokens,
+    nullification_mappings,
+)
+from food_categorizer.lexicon import (
+    compile_lexicon,
+    default_artifact_dir,
+    save_lexicon_artifact,
+    save_lexicon_file,
+)
+
+
+def main(export: Optional[Path] = None):
+    if export is not None:
+        save_lexicon_file(categories_to_tokens, export)
+        print(f"Built-in lexicon exported to {export}")
+    print("Compiling lexicon... ", end="")
+    lexicon = compile_lexicon(categories_to_tokens, nullification_mappings, TOKEN_FINDER)
+    path = save_lexicon_artifact(lexicon, default_artifact_dir())
+    print(f"written to {path}")
@@ -0,0 +1,37 @@
+import json
+import sys
+from contextlib import redirect_stdout
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Union
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.evaluation import Evaluation, evaluate_reference_samples
+from food_categorizer.food_database import DEFAULT_DB_PATH, load_food_data
+from food_categorizer.reference_samples import open_reference_samples
+from food_categorizer.utils import StageTimings
+
+
+def run_evaluation(
+    database_path: Union[PathLike, str] = DEFAULT_DB_PATH,
+    reference_samples_path: Optional[Union[PathLike, str]] = None,
+) -> Evaluation:
+    timings = StageTimings()
+    # progress messages would get mixed up with the JSON otherwise
+    with redirect_stdout(sys.stderr):
+        with timings.stage("load_foods"):
+            food_store = load_food_data(str(database_path))
+        with open_reference_samples(reference_samples_path) as ref_store:
+            with timings.stage("load_reference_samples"):
+                categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+            return evaluate_reference_samples(categorizer, timings)
+
+
+def main(output: Optional[Path] = None):
+    evaluation = run_evaluation()
+    evaluation_json = json.dumps(evaluation.as_dict(), indent=2)
+    if output is None:
+        print(evaluation_json)
+    else:
+        output.write_text(evaluation_json + "\n", encoding="utf-8")
+        print(f"accuracy: {evaluation.accuracy}, evaluation written to {output}", file=sys.stderr)
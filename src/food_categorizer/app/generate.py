@@ -1,69 +1,138 @@
+import json
+import os
 from collections import defaultdict
+from pathlib import Path
+from typing import Collection, Dict, Iterable, List, Mapping, Optional, Tuple
 
 from food_categorizer.categorizer import Categorizer
 from food_categorizer.food_database import (
     DEFAULT_DB_PATH,
     load_food_data,
+    read_changed_food_ids,
     update_diet_category,
 )
 from food_categorizer.models import DietCategory, Food
-from food_categorizer.reference_samples_csv import DEFAULT_RS_PATH, ReferenceSamplesCsv
-from food_categorizer.utils import print_as_table, select_n_random
+from food_categorizer.parallel import categorize_all_in_parallel
+from food_categorizer.reference_samples import open_reference_samples
+from food_categorizer.utils import (
+    ProgressReporter,
+    ReservoirSampler,
+    StageTimings,
+    print_as_table,
+)
 
 
-def main():
-    food_store = load_food_data(DEFAULT_DB_PATH)
-    foods = list(food_store.values())
+def categorize_all_foods(categorizer: Categorizer, food_store: Mapping[int, Food]):
+    print("categorizing foods... ", end="", flush=True)
+    progress = ProgressReporter(len(food_store))
+    # ingredients come first, so each food is categorized exactly once
+    for i, food in enumerate(categorizer.foods_in_dependency_order()):
+        progress.update(i)
+        food.diet_category = categorizer.categorize(food)
+    progress.finish()
+    print("done")
 
-    # go through all foods and assign categories
-    print("categorizing foods... ", end="")
-    foods_in_categories = {category: [] for category in DietCategory}
-    fdc_categories_to_foods_in_diet_categories = defaultdict(
-        lambda: {veg_category: [] for veg_category in DietCategory}
+
+def categorize_all_foods_in_parallel(categorizer: Categorizer, food_store: Mapping[int, Food], jobs: int):
+    print(f"categorizing foods using {jobs} processes... ", end="", flush=True)
+    progress = ProgressReporter(len(food_store))
+    categories_by_id = categorize_all_in_parallel(categorizer, jobs, progress)
+    for food in food_store.values():
+        food.diet_category = categories_by_id[food.food_id]
+    progress.finish()
+    print("done")
+
+
+def collect_stats(
+    foods: Iterable[Food], n_samples: int
+) -> Tuple[Dict[DietCategory, int], Dict[str, Dict[DietCategory, int]], Dict[DietCategory, ReservoirSampler[Food]]]:
+    """
+    Counts foods per diet category, overall and per FDC category, and samples foods from each diet category.
+
+    This is a single pass that keeps nothing but the counts and samples, so `foods` can be a stream.
+    """
+    n_foods_in_categories = {category: 0 for category in DietCategory}
+    n_foods_by_fdc_category = defaultdict(lambda: {veg_category: 0 for veg_category in DietCategory})
+    category_samplers = {category: ReservoirSampler(n_samples) for category in DietCategory}
+    for food in foods:
+        n_foods_in_categories[food.diet_category] += 1
+        n_foods_by_fdc_category[food.category][food.diet_category] += 1
+        category_samplers[food.diet_category].add(food)
+    return n_foods_in_categories, n_foods_by_fdc_category, category_samplers
+
+
+def recategorize_changed_foods(
+    categorizer: Categorizer,
+    food_store: Mapping[int, Food],
+    imported_changed_ids: Collection[int] = (),
+) -> List[Food]:
+    """
+    Recategorizes only foods that have no category yet, whose reference sample disagrees with their category or that
+    are in `imported_changed_ids`, along with all foods containing them. Returns the foods whose category changed.
+    """
+    previous_categories_by_id = {
+        food_id: food.diet_category for food_id, food in food_store.items() if food.diet_category is not None
+    }
+    changed_ids = {food_id for food_id, food in food_store.items() if food.diet_category is None}
+    # changed by an upsert import, which includes foods containing deleted foods
+    changed_ids.update(food_id for food_id in imported_changed_ids if food_id in food_store)
+    changed_ids.update(
+        food_id
+        for food_id, ref in categorizer.reference_samples_by_id.items()
+        if food_id in food_store and previous_categories_by_id.get(food_id) != ref.expected_diet_category
     )
 
-    with ReferenceSamplesCsv.from_path(DEFAULT_RS_PATH, create=True) as ref_store:
-        categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
-        print("    ", end="")
-        for i, food in enumerate(foods):
-            print(f"\b\b\b\b{i/len(foods)*100:>3.0f}%", end="")
-            categorization = categorizer.categorize(food)
-            food.diet_category = DietCategory(categorization)
-            foods_in_categories[categorization].append(food)
-            fdc_categories_to_foods_in_diet_categories[food.category][categorization].append(food)
-        print("done")
-
-    # update
-    update_diet_category(DEFAULT_DB_PATH, foods)
-
-    # stats
+    print(f"recategorizing {len(changed_ids)} changed foods and the foods containing them... ", end="")
+    changed_foods = []
+    for food_id, category in categorizer.recategorize(changed_ids, previous_categories_by_id).items():
+        food = food_store[food_id]
+        if food.diet_category != category:
+            food.diet_category = category
+            changed_foods.append(food)
+    print(f"done, {len(changed_foods)} categories changed")
+    return changed_foods
+
+
+def write_metrics(path: Path, timings: StageTimings, incremental: bool, jobs: int, n_foods: int):
+    """
+    Writes the timings and throughput of each stage to a JSON file, for tracking performance across runs.
+    """
+    metrics = {
+        "incremental": incremental,
+        "jobs": jobs,
+        "n_foods": n_foods,
+        "total_seconds": sum(timings.seconds.values()),
+        "stages": timings.as_dict(),
+    }
+    path.write_text(json.dumps(metrics, indent=2) + "\n", encoding="utf-8")
+
+
+def print_stats(
+    n_foods_in_categories: Mapping[DietCategory, int],
+    n_foods_by_fdc_category: Mapping[str, Mapping[DietCategory, int]],
+):
     print("numbers:")
     for category in DietCategory:
-        n_foods = len(foods_in_categories[category])
+        n_foods = n_foods_in_categories[category]
         print(f"{n_foods} {category.name}.")
     print("\n")
 
     # stats per FDC category
     print("numbers by FDC category:\n")
-    for fdc_category, veg_categories_items in sorted(
-        fdc_categories_to_foods_in_diet_categories.items(), key=lambda x: x[0]
-    ):
+    for fdc_category, veg_categories_counts in sorted(n_foods_by_fdc_category.items(), key=lambda x: x[0]):
         print(f"  {fdc_category}")
-        for veg_category, items in veg_categories_items.items():
-            n_foods = len(items)
+        for veg_category, n_foods in veg_categories_counts.items():
             if not n_foods:
                 continue
             print(f"    {n_foods} {veg_category.name}.")
         print("")
     print("")
 
-    # output sample
+
+def print_samples(category_samplers: Mapping[DietCategory, ReservoirSampler[Food]]):
     print("sample:")
-    n_samples = 10
     category_samples = {
-        category: select_n_random(
-            foods_in_categories[category],
-            n_samples,
+        category: category_samplers[category].select(
             pad=lambda: Food(
                 food_id=-1,
                 fdc_id=-1,
@@ -85,3 +154,51 @@ def main():
             for descs in zip(*(category_samples[category] for category in DietCategory))
         ]
     )
+
+
+def main(incremental: bool = False, jobs: int = 1, metrics_json: Optional[Path] = None):
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    timings = StageTimings()
+
+    with timings.stage("load"):
+        food_store = load_food_data(DEFAULT_DB_PATH)
+        imported_changed_ids = read_changed_food_ids(DEFAULT_DB_PATH)
+    timings.add_items("load", len(food_store))
+
+    # go through all foods and assign categories
+    with open_reference_samples(create=True) as ref_store:
+        with timings.stage("load"):
+            categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+        with timings.stage("categorize"):
+            if incremental:
+                # affected subgraphs are usually small, so these run serially regardless of `jobs`
+                recategorize_changed_foods(categorizer, food_store, imported_changed_ids)
+            elif jobs > 1:
+                categorize_all_foods_in_parallel(categorizer, food_store, jobs)
+            else:
+                categorize_all_foods(categorizer, food_store)
+        if not incremental:
+            timings.add_items("categorize", len(food_store))
+        if categorizer.cycles:
+            print(f"found {len(categorizer.cycles)} ingredient cycles, their members were categorized together")
+
+    # update, which only writes the categories that changed
+    with timings.stage("write_back"):
+        n_changes = update_diet_category(DEFAULT_DB_PATH, food_store, imported_changed_ids)
+    timings.add_items("write_back", n_changes)
+
+    n_samples = 10
+    with timings.stage("stats"):
+        n_foods_in_categories, n_foods_by_fdc_category, category_samplers = collect_stats(
+            food_store.values(), n_samples
+        )
+        print_stats(n_foods_in_categories, n_foods_by_fdc_category)
+    timings.add_items("stats", len(food_store))
+
+    with timings.stage("sample"):
+        print_samples(category_samplers)
+    timings.add_items("sample", sum(len(sampler.items) for sampler in category_samplers.values()))
+
+    if metrics_json is not None:
+        write_metrics(metrics_json, timings, incremental, jobs, len(food_store))
@@ -1,9 +1,11 @@
+import math
 import random
-from typing import Dict
+from typing import List, Tuple
 
 from food_categorizer.food_database import DEFAULT_DB_PATH, load_food_data
+from food_categorizer.food_store import FoodStore
 from food_categorizer.models import DietCategory, Food, ReferenceSample
-from food_categorizer.reference_samples_csv import DEFAULT_RS_PATH, ReferenceSamplesCsv
+from food_categorizer.reference_samples import open_reference_samples
 from food_categorizer.utils import get_fdc_app_details_url
 
 shortcut_to_category = {
@@ -17,24 +19,43 @@ shortcut_to_category = {
 }
 
 
-def print_ingredients(food_store: Dict[int, Food], food: Food, indent=1):
-    for ingredient_id in food.ingredients:
-        assert ingredient_id != food.food_id
+def print_ingredients(food_store: FoodStore, food: Food, indent=1):
+    """
+    Prints the ingredients of a food along with theirs, one level of indentation per level. An ingredient that the
+    food it is listed under is itself made of is marked as a cycle instead of being listed again.
+    """
+    # ingredients still to print, next one last, each with the foods above it
+    stack: List[Tuple[int, float, int, Tuple[int, ...]]] = []
+
+    def push_ingredients(food_id: int, indent: int, parent_ids: Tuple[int, ...]):
+        ingredients = list(food_store.ingredients_with_amounts(food_id))
+        stack.extend((ingredient_id, amount, indent, parent_ids) for ingredient_id, amount in reversed(ingredients))
+
+    push_ingredients(food.food_id, indent, (food.food_id,))
+    while stack:
+        ingredient_id, amount, indent, parent_ids = stack.pop()
         input_food = food_store.get(ingredient_id)
-        if input_food is not None:
-            print(f"{'  '*indent}{input_food.description} ", end="")
-            print(f"(FDC ID: {input_food.fdc_id})")
-            print_ingredients(food_store, input_food, indent + 1)
-        else:
+        if input_food is None:
             print(f'Ingredient with id {ingredient_id} could not be found!')
+            continue
+        print(f"{'  '*indent}{input_food.description} ", end="")
+        if math.isnan(amount):
+            print(f"(FDC ID: {input_food.fdc_id})", end="")
+        else:
+            print(f"(FDC ID: {input_food.fdc_id}, amount: {amount:g})", end="")
+        if ingredient_id in parent_ids:
+            print(" [ingredient cycle]")
+        else:
+            print()
+            push_ingredients(ingredient_id, indent + 1, parent_ids + (ingredient_id,))
 
 
 def main():
-    with ReferenceSamplesCsv.from_path(DEFAULT_RS_PATH, create=True) as ref_store:
+    # every label is typed by hand, so each one is synced to disk right away
+    with open_reference_samples(create=True, fsync=True) as ref_store:
         food_store = load_food_data(DEFAULT_DB_PATH)
 
-        ids_with_ref = set(ref_store.get_all_ids())
-        ids_without_ref = [food_id for food_id in food_store if food_id not in ids_with_ref]
+        ids_without_ref = [food_id for food_id in food_store if food_id not in ref_store]
 
         while ids_without_ref:
             food_id = random.choice(ids_without_ref)
@@ -69,7 +90,6 @@ def main():
             )
             print("Appending...", end="")
             ref_store.append_reference_sample(reference_sample)
-            ids_with_ref.add(food_id)
             ids_without_ref.remove(food_id)
             print("\n")
         print("no items without reference data remain")
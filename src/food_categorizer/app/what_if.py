@@ -0,0 +1,66 @@
+import json
+import sys
+from contextlib import redirect_stdout
+from os import PathLike
+from pathlib import Path
+from typing import Optional, Union
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.description_based_categorizer import (
+    TOKEN_FINDER,
+    get_compiled_lexicon,
+    nullification_mappings,
+)
+from food_categorizer.food_database import DEFAULT_DB_PATH, load_food_data
+from food_categorizer.lexicon import (
+    LexiconDiff,
+    compile_lexicon,
+    get_categories_to_tokens,
+    load_lexicon_diff_file,
+)
+from food_categorizer.lexicon_impact import (
+    LexiconImpact,
+    find_lexicon_impact,
+    load_or_build_token_index,
+)
+from food_categorizer.reference_samples import open_reference_samples
+from food_categorizer.utils import StageTimings
+
+
+def run_what_if(
+    lexicon_diff: LexiconDiff,
+    database_path: Union[PathLike, str] = DEFAULT_DB_PATH,
+    reference_samples_path: Optional[Union[PathLike, str]] = None,
+) -> LexiconImpact:
+    timings = StageTimings()
+    # progress messages would get mixed up with the JSON otherwise
+    with redirect_stdout(sys.stderr):
+        with timings.stage("load_foods"):
+            food_store = load_food_data(str(database_path))
+        lexicon = get_compiled_lexicon()
+        with timings.stage("load_token_index"):
+            token_index = load_or_build_token_index(str(database_path), food_store, lexicon)
+        with timings.stage("compile_lexicon"):
+            # not saved as an artifact, which would push out the artifacts of lexicons that are actually used
+            changed_lexicon = compile_lexicon(
+                lexicon_diff.apply(get_categories_to_tokens(lexicon.token_masks)), nullification_mappings, TOKEN_FINDER
+            )
+        with open_reference_samples(reference_samples_path) as ref_store:
+            with timings.stage("load_reference_samples"):
+                categorizer = Categorizer(
+                    ref_store=ref_store,
+                    food_store=food_store,
+                    lexicon=changed_lexicon,
+                    ingredient_graph=token_index.ingredient_graph,
+                )
+            return find_lexicon_impact(categorizer, token_index, lexicon, timings)
+
+
+def main(diff: Path, output: Optional[Path] = None):
+    impact = run_what_if(load_lexicon_diff_file(diff))
+    impact_json = json.dumps(impact.as_dict(), indent=2)
+    if output is None:
+        print(impact_json)
+    else:
+        output.write_text(impact_json + "\n", encoding="utf-8")
+        print(f"{len(impact.changes)} categories would change, impact written to {output}", file=sys.stderr)
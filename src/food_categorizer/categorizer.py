@@ -1,21 +1,184 @@
 # from food_categorizer.combined_heuristic
 import logging
-from typing import Dict, Set
+from typing import Dict, Iterable, List, Mapping, Optional
 
+from food_categorizer.category_masks import INPUT_FOOD_MASK_TO_DIET_CATEGORY
 from food_categorizer.description_based_categorizer import (
     description_based_heuristic_categorize,
 )
+from food_categorizer.ingredient_graph import IngredientGraph
+from food_categorizer.lexicon import CompiledLexicon
 from food_categorizer.models import DietCategory, Food
-from food_categorizer.reference_samples_csv import ReferenceSamplesCsv
+from food_categorizer.reference_sample_store import ReferenceSampleStore
 
 
 class Categorizer:
-    def __init__(self, ref_store: ReferenceSamplesCsv, food_store: Dict[int, Food]):
+    def __init__(
+        self,
+        ref_store: ReferenceSampleStore,
+        food_store: Mapping[int, Food],
+        lexicon: Optional[CompiledLexicon] = None,
+        ingredient_graph: Optional[IngredientGraph] = None,
+    ):
+        """
+        The description-based heuristic uses `lexicon` if given, otherwise the lexicon in use. An ingredient graph that
+        was already built from `food_store` can be passed in to save building it again.
+        """
         self.ref_store = ref_store
         self.reference_samples_by_id = self.ref_store.get_all_mapped_by_ids()
         self.food_store = food_store
+        self.lexicon = lexicon
+        self.categories_by_id: Dict[int, DietCategory] = {}
+        self.cycles: List[List[int]] = []
+        self._ingredient_graph = ingredient_graph
+        # masks of the categories in `categories_by_id` by position in the ingredient graph, 0 if not known here
+        self._category_masks: Optional[bytearray] = None
+
+    @property
+    def ingredient_graph(self) -> IngredientGraph:
+        if self._ingredient_graph is None:
+            self._ingredient_graph = IngredientGraph(self.food_store)
+        return self._ingredient_graph
+
+    @property
+    def category_masks(self) -> bytearray:
+        if self._category_masks is None:
+            # every diet category's mask fits in a byte
+            self._category_masks = bytearray(len(self.ingredient_graph))
+        return self._category_masks
+
+    def _set_category(self, food_id: int, category: DietCategory):
+        self.categories_by_id[food_id] = category
+        self.category_masks[self.ingredient_graph.position(food_id)] = category.mask
+
+    def foods_in_dependency_order(self) -> List[Food]:
+        """
+        Returns all foods ordered so that every food comes after its ingredients.
+
+        Categorizing foods in this order means that the categories of all ingredients are already cached when a food
+        is categorized. Members of an ingredient cycle come right after each other.
+        """
+        components = self.ingredient_graph.strongly_connected_components(self.food_store)
+        return [self.food_store[food_id] for component in components for food_id in component]
+
+    def categorize_all(self) -> Dict[int, DietCategory]:
+        self._categorize_reachable(self.food_store)
+        return self.categories_by_id
+
+    def categorize_many(self, food_ids: Iterable[int]):
+        """
+        Categorizes the given foods and everything they are made of in a single pass, ingredients first. Foods that
+        aren't in the food store are ignored.
+        """
+        self._categorize_reachable(food_id for food_id in food_ids if food_id in self.ingredient_graph)
+
+    def recategorize(
+        self,
+        changed_ids: Iterable[int],
+        previous_categories_by_id: Mapping[int, DietCategory],
+    ) -> Dict[int, DietCategory]:
+        """
+        Recategorizes only the given foods and the foods containing them.
+
+        All other foods keep their previous category, which is used as-is whenever they are an ingredient of an
+        affected food. Returns the new categories of all affected foods.
+        """
+        affected_ids = self.ingredient_graph.dependents(changed_ids)
+        self.categories_by_id = {
+            food_id: category
+            for food_id, category in previous_categories_by_id.items()
+            if food_id not in affected_ids and food_id in self.ingredient_graph
+        }
+        # filled in again from the previous categories whenever they are needed
+        self._category_masks = None
+        self._categorize_reachable(affected_ids)
+        return {food_id: self.categories_by_id[food_id] for food_id in affected_ids}
 
     def categorize(self, food: Food) -> DietCategory:
+        category = self.categories_by_id.get(food.food_id)
+        if category is None:
+            if food.food_id not in self.ingredient_graph:
+                return self._categorize_uncached(food)
+            self._categorize_reachable([food.food_id])
+            category = self.categories_by_id[food.food_id]
+        return category
+
+    def _categorize_reachable(self, food_ids: Iterable[int]):
+        """
+        Categorizes the given foods and everything they are made of that isn't categorized yet.
+        """
+        components = self.ingredient_graph.strongly_connected_components(food_ids, skip_ids=self.categories_by_id)
+        for component in components:
+            if self.ingredient_graph.is_cycle(component):
+                self._categorize_cycle(component)
+            else:
+                food = self.food_store[component[0]]
+                self._set_category(food.food_id, self._categorize_uncached(food))
+
+    def categorize_ignoring_reference_sample(self, food: Food) -> DietCategory:
+        """
+        Categorizes a food as if only its own reference sample didn't exist.
+
+        Everything else is categorized as usual. A food in an ingredient cycle is categorized together with the rest of
+        the cycle, as the other members' categories might otherwise be derived from the ignored sample.
+        """
+        if food.food_id not in self.ingredient_graph:
+            return self.combined_heuristic_categorize(food)
+        self._categorize_reachable([food.food_id])
+        for component in self.cycles:
+            if food.food_id in component:
+                return self._cycle_categories(component, ignored_sample_id=food.food_id)[food.food_id]
+        return self.combined_heuristic_categorize(food)
+
+    def _categorize_cycle(self, component: List[int]):
+        """
+        Categorizes the members of an ingredient cycle as one unit.
+        """
+        logging.warning(
+            "Ingredient cycle between foods with ids %s",
+            ", ".join(str(food_id) for food_id in component),
+        )
+        self.cycles.append(component)
+        for food_id, category in self._cycle_categories(component).items():
+            self._set_category(food_id, category)
+
+    def _cycle_categories(
+        self, component: List[int], ignored_sample_id: Optional[int] = None
+    ) -> Dict[int, DietCategory]:
+        """
+        Returns the categories of the members of an ingredient cycle, whose ingredients outside of the cycle must be
+        categorized already.
+
+        The cycle is treated like a single food made of all ingredients its members have outside of the cycle (and of
+        those members that have a reference sample). Members without a reference sample fall back to their own
+        description if that doesn't suffice. The reference sample of `ignored_sample_id` is treated as if it didn't
+        exist.
+        """
+        member_ids = set(component)
+        input_food_mask = 0
+        for food_id in component:
+            ref = self.reference_samples_by_id.get(food_id) if food_id != ignored_sample_id else None
+            if ref is not None:
+                input_food_mask |= ref.expected_diet_category.mask
+            for ingredient_id in self.ingredient_graph.ingredients(food_id):
+                if ingredient_id not in member_ids:
+                    input_food_mask |= self.categories_by_id[ingredient_id].mask
+        cycle_category = INPUT_FOOD_MASK_TO_DIET_CATEGORY[input_food_mask]
+
+        categories_by_id = {}
+        for food_id in component:
+            food = self.food_store[food_id]
+            ref = self.reference_samples_by_id.get(food_id) if food_id != ignored_sample_id else None
+            if ref is not None:
+                category = ref.expected_diet_category
+            elif cycle_category == DietCategory.UNCATEGORIZED:
+                category = description_based_heuristic_categorize(food.description, lexicon=self.lexicon)
+            else:
+                category = cycle_category
+            categories_by_id[food_id] = category
+        return categories_by_id
+
+    def _categorize_uncached(self, food: Food) -> DietCategory:
         ref = self.reference_samples_by_id.get(food.food_id)
         if ref is not None:
             # Force Category from reference
@@ -25,49 +188,48 @@ class Categorizer:
     def combined_heuristic_categorize(self, food: Food) -> DietCategory:
         ingredient_based_category = self.ingredient_based_heuristic_categorize(food)
         if ingredient_based_category == DietCategory.UNCATEGORIZED:
-            return description_based_heuristic_categorize(food.description)
+            return description_based_heuristic_categorize(food.description, lexicon=self.lexicon)
         return ingredient_based_category
 
-    def ingredient_based_heuristic_categorize(self, food: Food):
+    def ingredient_based_heuristic_categorize(self, food: Food) -> DietCategory:
         logging.debug(
             "Begin ingredient-based heuristic for %r (fdc ID: %s)",
             food.description,
             food.food_id,
         )
+        ingredient_graph = self.ingredient_graph
+        position = ingredient_graph.position(food.food_id)
+        if position is None:
+            return self._ingredient_based_heuristic_categorize_unknown_food(food)
 
-        input_food_categories: Set[DietCategory] = set()
+        # walks the ingredient graph's arrays directly, as this runs for every food
+        category_masks = self.category_masks
+        ingredient_positions = ingredient_graph.ingredient_positions
+        input_food_mask = 0
+        for i in range(
+            ingredient_graph.ingredient_offsets[position], ingredient_graph.ingredient_offsets[position + 1]
+        ):
+            ingredient_position = ingredient_positions[i]
+            if ingredient_position == position:
+                # a food can't tell anything about itself, this is handled as an ingredient cycle instead
+                continue
+            mask = category_masks[ingredient_position]
+            if not mask:
+                # not categorized yet, or categorized elsewhere (e.g. in another process)
+                mask = self.categorize(self.food_store[ingredient_graph.food_ids[ingredient_position]]).mask
+            input_food_mask |= mask
+        return INPUT_FOOD_MASK_TO_DIET_CATEGORY[input_food_mask]
+
+    def _ingredient_based_heuristic_categorize_unknown_food(self, food: Food) -> DietCategory:
+        """
+        Like `ingredient_based_heuristic_categorize`, for a food that isn't in the food store (and so not in the
+        ingredient graph).
+        """
+        input_food_mask = 0
         for ingredient_id in food.ingredients:
             input_food = self.food_store.get(ingredient_id)
             if input_food is None:
                 logging.debug("No food data entry found for input food with id %r", ingredient_id)
                 continue
-
-            assert ingredient_id != food.food_id
-            logging.debug("Processing input food  %r with id %r", ingredient_id, input_food.description)
-
-            input_food_category = self.categorize(input_food)
-            logging.debug("input food categorized as %s", input_food_category.name)
-
-            input_food_categories.add(input_food_category)
-
-        if DietCategory.OMNI in input_food_categories:
-            return DietCategory.OMNI
-        if DietCategory.VEGETARIAN_OR_OMNI in input_food_categories:
-            return DietCategory.VEGETARIAN_OR_OMNI
-        if DietCategory.VEGAN_VEGETARIAN_OR_OMNI in input_food_categories:
-            if DietCategory.VEGETARIAN in input_food_categories:
-                return DietCategory.VEGETARIAN_OR_OMNI
-            return DietCategory.VEGAN_VEGETARIAN_OR_OMNI
-        if DietCategory.VEGAN_OR_OMNI in input_food_categories:
-            if DietCategory.VEGETARIAN in input_food_categories:
-                return DietCategory.VEGETARIAN_OR_OMNI
-            return DietCategory.VEGAN_OR_OMNI
-        if DietCategory.VEGETARIAN in input_food_categories:
-            return DietCategory.VEGETARIAN
-        if DietCategory.VEGAN_OR_VEGETARIAN in input_food_categories:
-            return DietCategory.VEGAN_OR_VEGETARIAN
-        if DietCategory.VEGETARIAN in input_food_categories:
-            return DietCategory.VEGETARIAN
-        if DietCategory.VEGAN in input_food_categories:
-            return DietCategory.VEGAN
-        return DietCategory.UNCATEGORIZED
+            input_food_mask |= self.categorize(input_food).mask
+        return INPUT_FOOD_MASK_TO_DIET_CATEGORY[input_food_mask]
@@ -0,0 +1,81 @@
+from typing import Iterable, List, Set, Type, TypeVar
+
+from food_categorizer.models import DietCategory, TokenCategory
+from food_categorizer.utils import BitMaskEnum
+
+E = TypeVar("E", bound=BitMaskEnum)
+
+
+def mask_of(categories: Iterable[BitMaskEnum]) -> int:
+    mask = 0
+    for category in categories:
+        mask |= category.mask
+    return mask
+
+
+def members_of(enum_cls: Type[E], mask: int) -> Set[E]:
+    return {category for category in enum_cls if category.mask & mask}
+
+
+def _combine_input_food_categories(input_food_categories: Set[DietCategory]) -> DietCategory:
+    if DietCategory.OMNI in input_food_categories:
+        return DietCategory.OMNI
+    if DietCategory.VEGETARIAN_OR_OMNI in input_food_categories:
+        return DietCategory.VEGETARIAN_OR_OMNI
+    if DietCategory.VEGAN_VEGETARIAN_OR_OMNI in input_food_categories:
+        if DietCategory.VEGETARIAN in input_food_categories:
+            return DietCategory.VEGETARIAN_OR_OMNI
+        return DietCategory.VEGAN_VEGETARIAN_OR_OMNI
+    if DietCategory.VEGAN_OR_OMNI in input_food_categories:
+        if DietCategory.VEGETARIAN in input_food_categories:
+            return DietCategory.VEGETARIAN_OR_OMNI
+        return DietCategory.VEGAN_OR_OMNI
+    if DietCategory.VEGETARIAN in input_food_categories:
+        return DietCategory.VEGETARIAN
+    if DietCategory.VEGAN_OR_VEGETARIAN in input_food_categories:
+        return DietCategory.VEGAN_OR_VEGETARIAN
+    if DietCategory.VEGETARIAN in input_food_categories:
+        return DietCategory.VEGETARIAN
+    if DietCategory.VEGAN in input_food_categories:
+        return DietCategory.VEGAN
+    return DietCategory.UNCATEGORIZED
+
+
+def _combine_token_categories(found_token_categories: Set[TokenCategory]) -> DietCategory:
+    if TokenCategory.SUGGESTS_OMNI in found_token_categories:
+        return DietCategory.OMNI
+    if TokenCategory.SUGGESTS_VEGETARIAN_OR_OMNI in found_token_categories:
+        return DietCategory.VEGETARIAN_OR_OMNI
+    if TokenCategory.SUGGESTS_VEGAN_VEGETARIAN_OR_OMNI in found_token_categories:
+        if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
+            return DietCategory.VEGETARIAN_OR_OMNI
+        return DietCategory.VEGAN_VEGETARIAN_OR_OMNI
+    if TokenCategory.SUGGESTS_VEGAN_OR_OMNI in found_token_categories:
+        if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
+            return DietCategory.VEGETARIAN_OR_OMNI
+        return DietCategory.VEGAN_OR_OMNI
+    if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
+        return DietCategory.VEGETARIAN
+    if TokenCategory.SUGGESTS_VEGAN_OR_VEGETARIAN in found_token_categories:
+        return DietCategory.VEGAN_OR_VEGETARIAN
+    if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
+        return DietCategory.VEGETARIAN
+    if TokenCategory.SUGGESTS_VEGAN in found_token_categories:
+        return DietCategory.VEGAN
+    return DietCategory.UNCATEGORIZED
+
+
+# The ingredient decision chain above, precomputed for every possible combination of categories. Combining categories
+# is then just OR-ing their masks and looking the result up here.
+INPUT_FOOD_MASK_TO_DIET_CATEGORY: List[DietCategory] = [
+    _combine_input_food_categories(members_of(DietCategory, mask)) for mask in range(1 << len(DietCategory))
+]
+
+
+def build_token_mask_to_diet_category() -> List[DietCategory]:
+    """
+    Precomputes the token decision chain above for every possible combination of token categories.
+
+    This is only needed when compiling a lexicon (see `food_categorizer.lexicon`), so it isn't done at import time.
+    """
+    return [_combine_token_categories(members_of(TokenCategory, mask)) for mask in range(1 << len(TokenCategory))]
@@ -1,8 +1,17 @@
-from functools import reduce
-from typing import Dict, Set
+from os import environ
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
 
+from food_categorizer.lexicon import (
+    DEFAULT_TOKEN_FINDER,
+    CompiledLexicon,
+    LexiconFileWatcher,
+    get_token_masks,
+    load_lexicon_file,
+    load_or_compile_lexicon,
+)
 from food_categorizer.models import DietCategory, TokenCategory
-from food_categorizer.utils import MaxiMunchTokenFinder
+from food_categorizer.utils import TokenFinder
 
 categories_to_tokens: Dict[TokenCategory, Set[str]] = {
     # the only purpose of these is to block false positives in actual categories,
@@ -450,53 +459,91 @@ nullification_mappings = {
     },
 }
 
-all_tokens: Set[str] = reduce(lambda x, y: x | y, categories_to_tokens.values(), set())
 
-all_tokens_finder = MaxiMunchTokenFinder(all_tokens)
+# inverted index of `categories_to_tokens`
+token_masks: Dict[str, int] = get_token_masks(categories_to_tokens)
+all_tokens: Set[str] = set(token_masks)
 
+TOKEN_FINDER = environ.get("FOOD_CATEGORIZER_TOKEN_FINDER", DEFAULT_TOKEN_FINDER)
 
-def description_based_heuristic_categorize(description: str) -> DietCategory:
-    names_in_desc = all_tokens_finder.find_all(description.lower())
+# the lexicon in use; replaced as a whole when reloading, so calls in progress keep using the one they started with
+_compiled_lexicon: Optional[CompiledLexicon] = None
 
-    found_token_categories = {
-        category for category, tokens in categories_to_tokens.items() if any(name in tokens for name in names_in_desc)
+
+def get_compiled_lexicon() -> CompiledLexicon:
+    """
+    Returns the compiled lexicon, loading it from its on-disk artifact (or compiling it) on first use.
+
+    The lexicon is read from the JSON/TOML file at $FOOD_CATEGORIZER_LEXICON if that is set, otherwise
+    `categories_to_tokens` is used.
+    """
+    global _compiled_lexicon
+    if _compiled_lexicon is None:
+        lexicon_path = environ.get("FOOD_CATEGORIZER_LEXICON")
+        lexicon_categories_to_tokens = load_lexicon_file(Path(lexicon_path)) if lexicon_path else categories_to_tokens
+        _compiled_lexicon = load_or_compile_lexicon(lexicon_categories_to_tokens, nullification_mappings, TOKEN_FINDER)
+    return _compiled_lexicon
+
+
+def set_compiled_lexicon(lexicon: CompiledLexicon):
+    global _compiled_lexicon
+    _compiled_lexicon = lexicon
+
+
+def use_lexicon_file(path: Path, watch: bool = False, interval: float = 1.0) -> Optional[LexiconFileWatcher]:
+    """
+    Switches to the lexicon in the given JSON/TOML file.
+
+    With `watch`, the file is also watched for changes in the background and the lexicon is replaced as soon as a
+    changed version is compiled. The returned watcher can be stopped with `stop()`.
+    """
+    set_compiled_lexicon(load_or_compile_lexicon(load_lexicon_file(path), nullification_mappings, TOKEN_FINDER))
+    if not watch:
+        return None
+    watcher = LexiconFileWatcher(path, set_compiled_lexicon, nullification_mappings, TOKEN_FINDER, interval=interval)
+    watcher.start()
+    return watcher
+
+
+def normalize_description(description: str) -> str:
+    """
+    Normalizes a description without changing which tokens are found in it.
+    """
+    # no token begins or ends with whitespace, so stripping it can't change what is found
+    return description.lower().strip()
+
+
+def description_based_heuristic_categorize(
+    description: str,
+    token_finder: Optional[TokenFinder] = None,
+    lexicon: Optional[CompiledLexicon] = None,
+) -> DietCategory:
+    """
+    Categorizes a description with the given lexicon, or the one in use if there is none.
+    """
+    normalized_description = normalize_description(description)
+    if lexicon is None:
+        lexicon = get_compiled_lexicon()
+    if token_finder is not None:
+        return lexicon.mask_to_diet_category[token_finder.find_mask(normalized_description)]
+    return lexicon.categorize_cached(normalized_description)
+
+
+def description_based_heuristic_categorize_many(descriptions: Iterable[str]) -> List[DietCategory]:
+    """
+    Categorizes many descriptions at once, matching each distinct normalized description only once.
+    """
+    lexicon = get_compiled_lexicon()
+    normalized_descriptions = [normalize_description(description) for description in descriptions]
+    categories_by_description = {
+        normalized_description: lexicon.categorize_cached(normalized_description)
+        for normalized_description in dict.fromkeys(normalized_descriptions)
     }
+    return [categories_by_description[normalized_description] for normalized_description in normalized_descriptions]
 
-    for nullification_category in [TokenCategory.NULLIFIES_OMNI, TokenCategory.NULLIFIES_OMNI_AND_VEGETARIAN]:
-        if nullification_category not in found_token_categories:
-            continue
-        nullification_mapping = nullification_mappings[nullification_category]
-        found_token_categories = {
-            token_category
-            for token_category in {
-                (
-                    token_category
-                    if token_category not in nullification_mapping
-                    else nullification_mapping[token_category]
-                )
-                for token_category in found_token_categories
-            }
-            if token_category is not None
-        }
 
-    if TokenCategory.SUGGESTS_OMNI in found_token_categories:
-        return DietCategory.OMNI
-    if TokenCategory.SUGGESTS_VEGETARIAN_OR_OMNI in found_token_categories:
-        return DietCategory.VEGETARIAN_OR_OMNI
-    if TokenCategory.SUGGESTS_VEGAN_VEGETARIAN_OR_OMNI in found_token_categories:
-        if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
-            return DietCategory.VEGETARIAN_OR_OMNI
-        return DietCategory.VEGAN_VEGETARIAN_OR_OMNI
-    if TokenCategory.SUGGESTS_VEGAN_OR_OMNI in found_token_categories:
-        if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
-            return DietCategory.VEGETARIAN_OR_OMNI
-        return DietCategory.VEGAN_OR_OMNI
-    if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
-        return DietCategory.VEGETARIAN
-    if TokenCategory.SUGGESTS_VEGAN_OR_VEGETARIAN in found_token_categories:
-        return DietCategory.VEGAN_OR_VEGETARIAN
-    if TokenCategory.SUGGESTS_VEGETARIAN in found_token_categories:
-        return DietCategory.VEGETARIAN
-    if TokenCategory.SUGGESTS_VEGAN in found_token_categories:
-        return DietCategory.VEGAN
-    return DietCategory.UNCATEGORIZED
+def description_cache_info():
+    """
+    Returns the hits, misses and size of the current lexicon's description cache as a `functools._CacheInfo`.
+    """
+    return get_compiled_lexicon().categorize_cached.cache_info()
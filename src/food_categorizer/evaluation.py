@@ -0,0 +1,113 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.models import DietCategory
+from food_categorizer.utils import StageTimings
+
+
+@dataclass
+class Mismatch:
+    food_id: int
+    fdc_id: int
+    description: str
+    expected_diet_category: DietCategory
+    predicted_diet_category: DietCategory
+
+
+@dataclass
+class Evaluation:
+    """
+    How well the heuristics reproduce the reference samples.
+    """
+
+    n_samples: int = 0
+    n_correct: int = 0
+    # expected category to predicted category to number of samples
+    confusion_matrix: Dict[DietCategory, Dict[DietCategory, int]] = field(
+        default_factory=lambda: {expected: {predicted: 0 for predicted in DietCategory} for expected in DietCategory}
+    )
+    mismatches: List[Mismatch] = field(default_factory=list)
+    # reference samples of foods that aren't in the food store, which aren't counted
+    missing_food_ids: List[int] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def accuracy(self) -> Optional[float]:
+        return self.n_correct / self.n_samples if self.n_samples else None
+
+    def as_dict(self) -> Dict:
+        """
+        Returns the evaluation in a form that can be dumped as JSON.
+        """
+        return {
+            "n_samples": self.n_samples,
+            "n_correct": self.n_correct,
+            "accuracy": self.accuracy,
+            "confusion_matrix": {
+                expected.name: {predicted.name: n for predicted, n in row.items()}
+                for expected, row in self.confusion_matrix.items()
+            },
+            "mismatches": [
+                {
+                    "food_id": mismatch.food_id,
+                    "fdc_id": mismatch.fdc_id,
+                    "description": mismatch.description,
+                    "expected_diet_category": mismatch.expected_diet_category.name,
+                    "predicted_diet_category": mismatch.predicted_diet_category.name,
+                }
+                for mismatch in self.mismatches
+            ],
+            "missing_food_ids": self.missing_food_ids,
+            "timings": self.timings,
+        }
+
+
+def evaluate_reference_samples(categorizer: Categorizer, timings: Optional[StageTimings] = None) -> Evaluation:
+    """
+    Categorizes every reference sample's food with the combined heuristic, as if the sample didn't exist, and compares
+    the result to the sample.
+
+    Only the evaluated food's own sample is bypassed. Ingredients are categorized just like when generating, so an
+    ingredient with a reference sample counts as its expected category. Foods in ingredient cycles are evaluated along
+    with the rest of their cycle, so their own sample can't find its way back to them through another member. All
+    ingredients of all samples are categorized up front in one pass, which also shares the work between samples made of
+    the same foods.
+    """
+    if timings is None:
+        timings = StageTimings()
+    evaluation = Evaluation(timings=timings.seconds)
+    food_store = categorizer.food_store
+    samples = sorted(categorizer.reference_samples_by_id.values(), key=lambda sample: sample.food_id)
+
+    with timings.stage("categorize_ingredients"):
+        categorizer.categorize_many(
+            ingredient_id
+            for sample in samples
+            if sample.food_id in food_store
+            for ingredient_id in categorizer.ingredient_graph.ingredients(sample.food_id)
+        )
+
+    with timings.stage("categorize_samples"):
+        for sample in samples:
+            food = food_store.get(sample.food_id)
+            if food is None:
+                evaluation.missing_food_ids.append(sample.food_id)
+                continue
+            predicted = categorizer.categorize_ignoring_reference_sample(food)
+            expected = sample.expected_diet_category
+            evaluation.n_samples += 1
+            evaluation.confusion_matrix[expected][predicted] += 1
+            if predicted == expected:
+                evaluation.n_correct += 1
+            else:
+                evaluation.mismatches.append(
+                    Mismatch(
+                        food_id=food.food_id,
+                        fdc_id=food.fdc_id,
+                        description=food.description,
+                        expected_diet_category=expected,
+                        predicted_diet_category=predicted,
+                    )
+                )
+    return evaluation
@@ -1,71 +1,232 @@
+import hashlib
+import logging
+import os
 import sqlite3
-from typing import Dict, List
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterator, List, Optional, Set, Tuple
 
-from food_categorizer.models import Food
+from food_categorizer.food_store import FoodStore
+from food_categorizer.models import DietCategory, Food
+from food_categorizer.utils import default_cache_dir
 
 DEFAULT_DB_PATH = 'food_data.db'
-
-
-def load_food_data(database_path: str) -> Dict[int, Food]:
+# number of rows fetched from the database at a time when streaming
+DEFAULT_CHUNK_SIZE = 10_000
+
+# both sorted by food ID, so that ingredients can be merged with their foods as they are read
+FOOD_QUERY = 'SELECT food_id, fdc_id, description, category, diet_category FROM Food ORDER BY food_id'
+INGREDIENTS_QUERY = 'SELECT food_id, ingredient_id, amount FROM FoodIngredients ORDER BY food_id, rowid'
+
+
+def _fetch_in_chunks(cursor: sqlite3.Cursor, chunk_size: int) -> Iterator[tuple]:
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def snapshot_path(database_path: str) -> Path:
+    """
+    Path of the snapshot of the food store loaded from a database, in the cache directory.
+    """
+    path_hash = hashlib.sha256(str(Path(database_path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return default_cache_dir() / f"food-store-{path_hash}.snapshot"
+
+
+def _snapshot_key(database_path: str) -> Dict[str, Any]:
+    stat = os.stat(database_path)
+    # modification times can be too coarse to tell two quick writes apart, so also use SQLite's file change counter,
+    # which is incremented by every transaction that changes the database
+    with open(database_path, "rb") as f:
+        change_counter = int.from_bytes(f.read(100)[24:28], "big")
+    return {
+        "path": str(Path(database_path).resolve()),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "change_counter": change_counter,
+    }
+
+
+def save_snapshot(database_path: str, food_store: FoodStore):
+    """
+    Saves a snapshot of a food store that matches the current contents of the database it was loaded from.
+    """
+    path = snapshot_path(database_path)
+    try:
+        food_store.write_snapshot(path, _snapshot_key(database_path))
+    except (OSError, ValueError) as e:
+        # not being able to cache it is no reason to fail, but an outdated snapshot must not stay around
+        logging.debug("Could not save food store snapshot: %s", e)
+        path.unlink(missing_ok=True)
+
+
+def load_food_data(
+    database_path: str,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    use_snapshot: bool = True,
+) -> FoodStore:
     """Function to load all entries in the Food table along with their ingredients"""
 
+    if use_snapshot:
+        food_store = FoodStore.read_snapshot(snapshot_path(database_path), _snapshot_key(database_path))
+        if food_store is not None:
+            print("Loaded all foods from snapshot")
+            return food_store
+
     print("Loading all foods from Database... ", end="")
 
     # Connect to the SQLite database
     conn = sqlite3.connect(database_path)
-    cursor = conn.cursor()
 
-    # Fetch all entries from the Food table
-    cursor.execute('SELECT food_id, fdc_id, description, category, diet_category FROM Food')
-    food_records = cursor.fetchall()
-
-    # Fetch all ingredients from the FoodIngredients table
-    cursor.execute('SELECT food_id, ingredient_id FROM FoodIngredients')
-    ingredients_records = cursor.fetchall()
+    # Fetch all entries from the Food table and all ingredients from the FoodIngredients table and merge them into the
+    # food store as they are read
+    food_store = FoodStore.from_records(
+        _fetch_in_chunks(conn.execute(FOOD_QUERY), chunk_size),
+        _fetch_in_chunks(conn.execute(INGREDIENTS_QUERY), chunk_size),
+    )
 
     # Close the database connection
     conn.close()
 
-    # Map food_id to Food dataclass instances
-    food_map = {}
-    for food_id, fdc_id, description, category, diet_category in food_records:
-        food_map[food_id] = Food(
-            food_id=food_id,
-            fdc_id=fdc_id,
-            description=description,
-            category=category,
-            diet_category=diet_category,
-            ingredients=[],
-        )
+    print("done")
+    if use_snapshot:
+        save_snapshot(database_path, food_store)
+    return food_store
 
-    # Map ingredients to corresponding Food objects
-    for food_id, ingredient_id in ingredients_records:
-        if food_id in food_map:
-            food_map[food_id].ingredients.append(ingredient_id)
 
-    print("done")
-    return food_map
+def iter_food_chunks(database_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List[Food]]:
+    """
+    Yields all foods along with their ingredients in lists of up to `chunk_size` foods, in ascending order of IDs.
+
+    Foods and ingredients are read in a single ordered scan, so only about one chunk is held in memory at a time.
+    """
+    conn = sqlite3.connect(database_path)
+    try:
+        ingredient_records = _fetch_in_chunks(conn.execute(INGREDIENTS_QUERY), chunk_size)
+        ingredient_record = next(ingredient_records, None)
+        chunk = []
+        for food_id, fdc_id, description, category, diet_category in _fetch_in_chunks(
+            conn.execute(FOOD_QUERY), chunk_size
+        ):
+            ingredients = []
+            while ingredient_record is not None and ingredient_record[0] <= food_id:
+                if ingredient_record[0] == food_id:
+                    ingredients.append(ingredient_record[1])
+                ingredient_record = next(ingredient_records, None)
+            chunk.append(
+                Food(
+                    food_id=food_id,
+                    fdc_id=fdc_id,
+                    description=description,
+                    category=category,
+                    diet_category=DietCategory(diet_category) if diet_category is not None else None,
+                    ingredients=ingredients,
+                )
+            )
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        conn.close()
+
+
+def iter_foods(database_path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[Food]:
+    for chunk in iter_food_chunks(database_path, chunk_size):
+        yield from chunk
+
+
+def count_foods_by_diet_category(database_path: str) -> Dict[Optional[DietCategory], int]:
+    conn = sqlite3.connect(database_path)
+    rows = conn.execute('SELECT diet_category, COUNT(*) FROM Food GROUP BY diet_category').fetchall()
+    conn.close()
+    return {DietCategory(diet_category) if diet_category is not None else None: n for diet_category, n in rows}
+
 
+def iter_foods_in_diet_category(
+    database_path: str,
+    diet_category: DietCategory,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Tuple[int, str]]:
+    """
+    Yields the FDC IDs and descriptions of all foods in a diet category, sorted by description.
+    """
+    conn = sqlite3.connect(database_path)
+    try:
+        cursor = conn.execute(
+            'SELECT fdc_id, description FROM Food WHERE diet_category = ? ORDER BY description, food_id',
+            (diet_category.value,),
+        )
+        yield from _fetch_in_chunks(cursor, chunk_size)
+    finally:
+        conn.close()
 
-def update_diet_category(database_path: str, foods: List[Food]):
+
+def read_changed_food_ids(database_path: str) -> Set[int]:
+    """
+    Returns the IDs of foods that `create_sqllite_db.py --upsert` changed since diet categories were last written back.
+    """
+    conn = sqlite3.connect(database_path)
+    try:
+        return {row[0] for row in conn.execute('SELECT food_id FROM ChangedFoods')}
+    except sqlite3.OperationalError:
+        # built before upserts were supported
+        return set()
+    finally:
+        conn.close()
+
+
+def update_diet_category(
+    database_path: str,
+    food_store: FoodStore,
+    recategorized_changed_food_ids: Collection[int] = (),
+) -> int:
+    """
+    Writes back all diet categories that changed since they were loaded and returns how many rows were updated.
+
+    The given IDs from `read_changed_food_ids` are removed from the changed foods in the same transaction, as their
+    categories are now up to date.
+    """
     print("Updateing diet categories")
+    changed_rows = [
+        (diet_category.value if diet_category is not None else None, food_id)
+        for food_id, diet_category in food_store.changed_diet_categories()
+    ]
+    if not changed_rows and not recategorized_changed_food_ids:
+        # switching journal modes below changes the file, which would invalidate the snapshot for nothing
+        print("Diet categories updated successfully (0 changed)")
+        return 0
+
     # Connect to the SQLite database
+    # The database also holds the import state of upserts, which can't be regenerated, so the write has to survive a
+    # crash. In WAL mode that only takes syncing at checkpoints, not on every commit.
     conn = sqlite3.connect(database_path)
-    cursor = conn.cursor()
-
-    # Update the diet_category for each food entry
-    for food in foods:
-        cursor.execute(
-            '''
-            UPDATE Food
-            SET diet_category = ?
-            WHERE food_id = ?
-        ''',
-            (food.diet_category.value, food.food_id),
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+
+    # Update the changed diet categories in a single transaction
+    with conn:
+        n_changes = conn.total_changes
+        conn.executemany(
+            'UPDATE Food SET diet_category = ? WHERE food_id = ? AND diet_category IS NOT ?',
+            ((diet_category, food_id, diet_category) for diet_category, food_id in changed_rows),
         )
-
-    # Commit the changes and close the connection
-    conn.commit()
+        n_changes = conn.total_changes - n_changes
+        if recategorized_changed_food_ids:
+            conn.executemany(
+                'DELETE FROM ChangedFoods WHERE food_id = ?',
+                ((food_id,) for food_id in recategorized_changed_food_ids),
+            )
+    # WAL mode is stored in the database, switch back so that read-only connections and copies of the file don't need
+    # the WAL files. This checkpoints the changes into the database file and bumps its change counter, which snapshots
+    # are keyed by and which commits in WAL mode don't.
+    conn.execute('PRAGMA journal_mode = DELETE')
     conn.close()
+    food_store.mark_diet_categories_saved()
+    # the database changed, so the snapshot (if any) would be invalid anyway
+    save_snapshot(database_path, food_store)
 
-    print("Diet categories updated successfully")
+    print(f"Diet categories updated successfully ({n_changes} changed)")
+    return n_changes
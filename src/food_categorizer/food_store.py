@@ -0,0 +1,338 @@
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from food_categorizer.models import DietCategory, Food
+
+DIET_CATEGORIES: List[DietCategory] = list(DietCategory)
+DIET_CATEGORY_CODES: Dict[DietCategory, int] = {category: code for code, category in enumerate(DIET_CATEGORIES)}
+# diet category code of foods that haven't been categorized yet
+NO_DIET_CATEGORY = -1
+# amount of ingredients whose amount isn't known
+NO_AMOUNT = float("nan")
+# FDC ID of foods that have none (the column is nullable)
+NO_FDC_ID = -1
+
+SNAPSHOT_MAGIC = b"FCSTORE\0"
+# Bump this whenever the snapshot layout or the meaning of any column changes
+SNAPSHOT_VERSION = 1
+# array columns in the order they are stored in snapshots, the diet categories being the saved ones
+SNAPSHOT_COLUMNS = [
+    "food_ids",
+    "fdc_ids",
+    "category_codes",
+    "saved_diet_category_codes",
+    "ingredient_offsets",
+    "ingredient_ids",
+    "ingredient_amounts",
+]
+
+
+class FoodView:
+    """
+    Lightweight stand-in for a `Food` that reads from (and writes its diet category to) a `FoodStore`.
+
+    Pickling a view turns it into a regular `Food`, so it can be sent to other processes without the whole store.
+    """
+
+    __slots__ = ("store", "position")
+
+    def __init__(self, store: "FoodStore", position: int):
+        self.store = store
+        self.position = position
+
+    @property
+    def food_id(self) -> int:
+        return self.store.food_ids[self.position]
+
+    @property
+    def fdc_id(self) -> Optional[int]:
+        fdc_id = self.store.fdc_ids[self.position]
+        return None if fdc_id == NO_FDC_ID else fdc_id
+
+    @property
+    def description(self) -> str:
+        return self.store.descriptions[self.position]
+
+    @property
+    def category(self) -> Optional[str]:
+        return self.store.categories[self.store.category_codes[self.position]]
+
+    @property
+    def diet_category(self) -> Optional[DietCategory]:
+        code = self.store.diet_category_codes[self.position]
+        return None if code == NO_DIET_CATEGORY else DIET_CATEGORIES[code]
+
+    @diet_category.setter
+    def diet_category(self, diet_category: Optional[DietCategory]):
+        self.store.diet_category_codes[self.position] = (
+            NO_DIET_CATEGORY if diet_category is None else DIET_CATEGORY_CODES[diet_category]
+        )
+
+    @property
+    def ingredients(self) -> List[int]:
+        offsets = self.store.ingredient_offsets
+        return self.store.ingredient_ids[offsets[self.position] : offsets[self.position + 1]].tolist()
+
+    def as_food(self) -> Food:
+        return Food(
+            food_id=self.food_id,
+            fdc_id=self.fdc_id,
+            description=self.description,
+            category=self.category,
+            diet_category=self.diet_category,
+            ingredients=self.ingredients,
+        )
+
+    def __reduce__(self):
+        return Food, tuple(getattr(self, name) for name in Food.__dataclass_fields__)
+
+    def __eq__(self, other):
+        if isinstance(other, FoodView):
+            return self.store is other.store and self.position == other.position
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((id(self.store), self.position))
+
+    def __repr__(self):
+        return f"FoodView({self.as_food()!r})"
+
+
+class FoodStore(Mapping[int, FoodView]):
+    """
+    Columnar, read-mostly store of foods, usable wherever a `Dict[int, Food]` is.
+
+    Instead of one object per food, each attribute is kept in its own compact array, category strings are only stored
+    once and diet categories are stored as one-byte codes. Foods are kept sorted by ID, so they are looked up by
+    bisection. `Food`-like views are created on demand.
+    """
+
+    def __init__(self):
+        self.food_ids = array("q")
+        self.fdc_ids = array("q")
+        self.descriptions: List[str] = []
+        self.categories: List[Optional[str]] = []
+        self._category_codes_by_name: Dict[Optional[str], int] = {}
+        self.category_codes = array("H")
+        self.diet_category_codes = array("b")
+        # diet categories as they are in the database, to tell which ones need to be written back
+        self.saved_diet_category_codes = array("b")
+        # ingredients in compressed sparse row form: the ingredients of the food at position i (and their amounts) are
+        # ingredient_ids[ingredient_offsets[i]:ingredient_offsets[i + 1]]
+        self.ingredient_offsets = array("q", [0])
+        self.ingredient_ids = array("q")
+        self.ingredient_amounts = array("d")
+
+    @classmethod
+    def from_records(
+        cls,
+        food_records: Iterable[Tuple[int, int, str, Optional[str], Optional[str]]],
+        ingredient_records: Iterable[Tuple[int, int, Optional[float]]],
+    ) -> "FoodStore":
+        """
+        Builds a store from `(food_id, fdc_id, description, category, diet_category)` rows and `(food_id,
+        ingredient_id, amount)` rows, both sorted by food ID.
+
+        Both are consumed in a single pass, so they can be database cursors. Ingredients of foods that aren't in
+        `food_records` are left out.
+        """
+        store = cls()
+        ingredient_records = iter(ingredient_records)
+        ingredient_record = next(ingredient_records, None)
+        for food_id, fdc_id, description, category, diet_category in food_records:
+            while ingredient_record is not None and ingredient_record[0] <= food_id:
+                if ingredient_record[0] == food_id:
+                    _, ingredient_id, amount = ingredient_record
+                    store.ingredient_ids.append(ingredient_id)
+                    store.ingredient_amounts.append(NO_AMOUNT if amount is None else amount)
+                ingredient_record = next(ingredient_records, None)
+            # its ingredients have already been appended above
+            store.append(
+                food_id,
+                fdc_id,
+                description,
+                category,
+                DietCategory(diet_category) if diet_category is not None else None,
+            )
+        return store
+
+    def append(
+        self,
+        food_id: int,
+        fdc_id: Optional[int],
+        description: str,
+        category: Optional[str],
+        diet_category: Optional[DietCategory],
+        ingredients: Iterable[int] = (),
+        amounts: Optional[Iterable[float]] = None,
+    ):
+        if self.food_ids and food_id <= self.food_ids[-1]:
+            raise ValueError(
+                f"foods must be appended in ascending order of their IDs, got {food_id} after {self.food_ids[-1]}"
+            )
+        self.food_ids.append(food_id)
+        self.fdc_ids.append(NO_FDC_ID if fdc_id is None else fdc_id)
+        self.descriptions.append(description)
+        category_code = self._category_codes_by_name.get(category)
+        if category_code is None:
+            category_code = self._category_codes_by_name[category] = len(self.categories)
+            self.categories.append(category)
+        self.category_codes.append(category_code)
+        diet_category_code = NO_DIET_CATEGORY if diet_category is None else DIET_CATEGORY_CODES[diet_category]
+        self.diet_category_codes.append(diet_category_code)
+        self.saved_diet_category_codes.append(diet_category_code)
+        n_ingredients = len(self.ingredient_ids)
+        self.ingredient_ids.extend(ingredients)
+        if amounts is None:
+            self.ingredient_amounts.extend(NO_AMOUNT for _ in range(len(self.ingredient_ids) - n_ingredients))
+        else:
+            self.ingredient_amounts.extend(amounts)
+        if len(self.ingredient_amounts) != len(self.ingredient_ids):
+            raise ValueError(f"food {food_id} needs exactly one amount per ingredient")
+        self.ingredient_offsets.append(len(self.ingredient_ids))
+
+    def position(self, food_id: int) -> Optional[int]:
+        i = bisect_left(self.food_ids, food_id)
+        if i < len(self.food_ids) and self.food_ids[i] == food_id:
+            return i
+        return None
+
+    def changed_diet_categories(self) -> Iterator[Tuple[int, Optional[DietCategory]]]:
+        """
+        Yields the IDs and diet categories of all foods whose diet category changed since it was loaded or last saved.
+        """
+        for position, (code, saved_code) in enumerate(zip(self.diet_category_codes, self.saved_diet_category_codes)):
+            if code != saved_code:
+                yield self.food_ids[position], None if code == NO_DIET_CATEGORY else DIET_CATEGORIES[code]
+
+    def mark_diet_categories_saved(self):
+        self.saved_diet_category_codes = array("b", self.diet_category_codes)
+
+    def ingredients_with_amounts(self, food_id: int) -> Iterator[Tuple[int, float]]:
+        """
+        Yields the IDs and amounts of the ingredients of a food, including ingredients that aren't in the store.
+
+        The amount of an ingredient is NaN if it isn't known.
+        """
+        position = self.position(food_id)
+        if position is None:
+            raise KeyError(food_id)
+        for i in range(self.ingredient_offsets[position], self.ingredient_offsets[position + 1]):
+            yield self.ingredient_ids[i], self.ingredient_amounts[i]
+
+    def __getitem__(self, food_id: int) -> FoodView:
+        position = self.position(food_id)
+        if position is None:
+            raise KeyError(food_id)
+        return FoodView(self, position)
+
+    def __contains__(self, food_id) -> bool:
+        return self.position(food_id) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.food_ids)
+
+    def __len__(self) -> int:
+        return len(self.food_ids)
+
+    def values(self) -> Iterator[FoodView]:  # type: ignore[override]
+        return (FoodView(self, position) for position in range(len(self.food_ids)))
+
+    def items(self) -> Iterator[Tuple[int, FoodView]]:  # type: ignore[override]
+        return ((food_id, FoodView(self, position)) for position, food_id in enumerate(self.food_ids))
+
+    def write_snapshot(self, path: Path, key: Mapping[str, Any]):
+        """
+        Writes the store to a snapshot file that `read_snapshot` can load quickly, if given the same key.
+
+        The file consists of a JSON header followed by the raw contents of each column, each 8-byte aligned, so the
+        file can be memory-mapped. Diet categories are written as they were last saved, not as they are now.
+        """
+        blobs = [getattr(self, name).tobytes() for name in SNAPSHOT_COLUMNS]
+        if any("\0" in description for description in self.descriptions):
+            raise ValueError("descriptions containing null characters can't be written to snapshots")
+        blobs.append("\0".join(self.descriptions).encode("utf-8"))
+        header = json.dumps(
+            {
+                "version": SNAPSHOT_VERSION,
+                "key": key,
+                "byteorder": sys.byteorder,
+                "itemsizes": [getattr(self, name).itemsize for name in SNAPSHOT_COLUMNS],
+                "sizes": [len(blob) for blob in blobs],
+                "n_foods": len(self.food_ids),
+                "categories": self.categories,
+            }
+        ).encode("utf-8")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile("wb", dir=path.parent, suffix=".tmp", delete=False) as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack("<Q", len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(bytes(-f.tell() % 8))
+                f.write(blob)
+        os.replace(f.name, path)
+
+    @classmethod
+    def read_snapshot(cls, path: Path, key: Mapping[str, Any]) -> Optional["FoodStore"]:
+        """
+        Loads a store from a snapshot file, or returns None if there is none or it was written for a different key.
+        """
+        try:
+            with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(
+                mm
+            ) as buffer:
+                return cls._from_snapshot(buffer, key)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError, struct.error):
+            # e.g. an empty, truncated or otherwise broken file
+            return None
+
+    @classmethod
+    def _from_snapshot(cls, buffer: memoryview, key: Mapping[str, Any]) -> Optional["FoodStore"]:
+        if buffer[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        (header_size,) = struct.unpack_from("<Q", buffer, len(SNAPSHOT_MAGIC))
+        position = len(SNAPSHOT_MAGIC) + 8
+        header = json.loads(bytes(buffer[position : position + header_size]))
+        position += header_size
+        store = cls()
+        if (
+            header["version"] != SNAPSHOT_VERSION
+            or header["key"] != key
+            or header["byteorder"] != sys.byteorder
+            or header["itemsizes"] != [getattr(store, name).itemsize for name in SNAPSHOT_COLUMNS]
+        ):
+            return None
+
+        sections = []
+        for size in header["sizes"]:
+            position += -position % 8
+            if position + size > len(buffer):
+                raise ValueError("truncated snapshot")
+            sections.append((position, position + size))
+            position += size
+
+        for name, (start, end) in zip(SNAPSHOT_COLUMNS, sections):
+            column = array(getattr(store, name).typecode)
+            with buffer[start:end] as section:
+                column.frombytes(section)
+            setattr(store, name, column)
+        store.diet_category_codes = array("b", store.saved_diet_category_codes)
+        start, end = sections[len(SNAPSHOT_COLUMNS)]
+        with buffer[start:end] as section:
+            store.descriptions = str(section, "utf-8").split("\0") if header["n_foods"] else []
+        store.categories = header["categories"]
+        store._category_codes_by_name = {category: code for code, category in enumerate(store.categories)}
+        if not len(store.food_ids) == len(store.descriptions) == len(store.ingredient_offsets) - 1:
+            raise ValueError("inconsistent snapshot")
+        return store
@@ -0,0 +1,227 @@
+from array import array
+from bisect import bisect_left
+from typing import Container, Iterable, List, Mapping, Optional, Set, Tuple
+
+from food_categorizer.food_store import FoodStore
+from food_categorizer.models import Food
+
+
+class IngredientGraph:
+    """
+    Graph of foods and the ingredients they are made of, built once from a food store.
+
+    Edges point from a food to its ingredients. Ingredients that have no entry in the food store are left out, just
+    like the categorizer ignores them.
+
+    Foods are numbered by their position in ascending order of IDs. Edges and reverse edges are both kept in compressed
+    sparse row form, i.e. the ingredients of the food at position i are at positions
+    `ingredient_positions[ingredient_offsets[i]:ingredient_offsets[i + 1]]` and the foods containing it are at positions
+    `parent_positions[parent_offsets[i]:parent_offsets[i + 1]]`. Traversals only touch these flat arrays.
+    """
+
+    def __init__(self, food_store: Mapping[int, Food]):
+        if isinstance(food_store, FoodStore):
+            # the store already keeps its ingredients in this form, only with IDs instead of positions
+            self.food_ids = food_store.food_ids
+            ingredient_offsets, ingredient_ids = food_store.ingredient_offsets, food_store.ingredient_ids
+        else:
+            self.food_ids = array("q", sorted(food_store))
+            ingredient_offsets, ingredient_ids = array("q", [0]), array("q")
+            for food_id in self.food_ids:
+                ingredient_ids.extend(food_store[food_id].ingredients)
+                ingredient_offsets.append(len(ingredient_ids))
+        n_foods = len(self.food_ids)
+
+        self.ingredient_offsets = array("q", [0])
+        self.ingredient_positions = array("q")
+        # number of parents per food, shifted by one so it can be turned into offsets in place
+        parent_offsets = array("q", bytes(8 * (n_foods + 1)))
+        for position in range(n_foods):
+            for i in range(ingredient_offsets[position], ingredient_offsets[position + 1]):
+                ingredient_position = self.position(ingredient_ids[i])
+                if ingredient_position is not None:
+                    self.ingredient_positions.append(ingredient_position)
+                    parent_offsets[ingredient_position + 1] += 1
+            self.ingredient_offsets.append(len(self.ingredient_positions))
+
+        # reverse edges, sorted into place by counting
+        for position in range(n_foods):
+            parent_offsets[position + 1] += parent_offsets[position]
+        self.parent_offsets = parent_offsets
+        self.parent_positions = array("q", bytes(8 * len(self.ingredient_positions)))
+        next_slots = parent_offsets[:-1]
+        for position in range(n_foods):
+            for i in range(self.ingredient_offsets[position], self.ingredient_offsets[position + 1]):
+                ingredient_position = self.ingredient_positions[i]
+                self.parent_positions[next_slots[ingredient_position]] = position
+                next_slots[ingredient_position] += 1
+
+        # scratch space of strongly_connected_components
+        self._indices: Optional[array] = None
+        self._lowlinks: Optional[array] = None
+        self._on_stack: Optional[bytearray] = None
+        self._n_visited = 0
+
+    def __len__(self):
+        return len(self.food_ids)
+
+    def __contains__(self, food_id):
+        return self.position(food_id) is not None
+
+    def position(self, food_id: int) -> Optional[int]:
+        i = bisect_left(self.food_ids, food_id)
+        if i < len(self.food_ids) and self.food_ids[i] == food_id:
+            return i
+        return None
+
+    def _position_of(self, food_id: int) -> int:
+        position = self.position(food_id)
+        if position is None:
+            raise KeyError(food_id)
+        return position
+
+    def ingredients(self, food_id: int) -> List[int]:
+        """
+        Returns the IDs of the ingredients of a food that are part of the graph.
+        """
+        position = self._position_of(food_id)
+        return [
+            self.food_ids[self.ingredient_positions[i]]
+            for i in range(self.ingredient_offsets[position], self.ingredient_offsets[position + 1])
+        ]
+
+    def dependents(self, food_ids: Iterable[int]) -> Set[int]:
+        """
+        Returns the given foods along with all foods that contain any of them, directly or indirectly.
+        """
+        found = bytearray(len(self.food_ids))
+        todo = []
+        for food_id in food_ids:
+            position = self.position(food_id)
+            if position is not None and not found[position]:
+                found[position] = 1
+                todo.append(position)
+        found_ids = {self.food_ids[position] for position in todo}
+        while todo:
+            position = todo.pop()
+            for i in range(self.parent_offsets[position], self.parent_offsets[position + 1]):
+                parent_position = self.parent_positions[i]
+                if not found[parent_position]:
+                    found[parent_position] = 1
+                    found_ids.add(self.food_ids[parent_position])
+                    todo.append(parent_position)
+        return found_ids
+
+    def connected_components(self) -> List[List[int]]:
+        """
+        Returns groups of foods that are connected by ingredient relations in either direction.
+
+        Foods in different groups neither contain each other nor share any ingredients, so each group can be
+        categorized on its own.
+        """
+        components = []
+        seen = bytearray(len(self.food_ids))
+        for root_position in range(len(self.food_ids)):
+            if seen[root_position]:
+                continue
+            seen[root_position] = 1
+            component = [self.food_ids[root_position]]
+            todo = [root_position]
+            while todo:
+                position = todo.pop()
+                for offsets, neighbor_positions in (
+                    (self.ingredient_offsets, self.ingredient_positions),
+                    (self.parent_offsets, self.parent_positions),
+                ):
+                    for i in range(offsets[position], offsets[position + 1]):
+                        neighbor_position = neighbor_positions[i]
+                        if not seen[neighbor_position]:
+                            seen[neighbor_position] = 1
+                            component.append(self.food_ids[neighbor_position])
+                            todo.append(neighbor_position)
+            components.append(component)
+        return components
+
+    def strongly_connected_components(
+        self,
+        root_ids: Iterable[int],
+        skip_ids: Container[int] = (),
+    ) -> List[List[int]]:
+        """
+        Returns the strongly connected components reachable from the given foods, ingredients first.
+
+        Every component comes after all components containing its ingredients, so a component can be processed as soon
+        as it is returned. Foods in `skip_ids` are treated as if they weren't part of the graph. This is Tarjan's
+        algorithm with an explicit stack instead of recursion, so the size of a recipe graph isn't limited by the
+        interpreter's recursion limit.
+        """
+        if self._indices is None:
+            # allocated once and shared by all calls, as most calls only visit a handful of foods
+            self._indices = array("q", [-1]) * len(self.food_ids)
+            self._lowlinks = array("q", bytes(8 * len(self.food_ids)))
+            self._on_stack = bytearray(len(self.food_ids))
+        indices, lowlinks, on_stack = self._indices, self._lowlinks, self._on_stack
+        # indices keep counting up across calls, so foods with an index below this haven't been visited by this call
+        first_index = n_visited = self._n_visited
+        stack: List[int] = []
+        components: List[List[int]] = []
+
+        try:
+            for root_id in root_ids:
+                if root_id in skip_ids:
+                    continue
+                root_position = self._position_of(root_id)
+                if indices[root_position] >= first_index:
+                    continue
+                # each entry is a food and the offset of the next ingredient to look at
+                work: List[Tuple[int, int]] = [(root_position, self.ingredient_offsets[root_position])]
+                while work:
+                    position, i = work[-1]
+                    if i == self.ingredient_offsets[position]:
+                        indices[position] = lowlinks[position] = n_visited
+                        n_visited += 1
+                        stack.append(position)
+                        on_stack[position] = 1
+                    end = self.ingredient_offsets[position + 1]
+                    while i < end:
+                        ingredient_position = self.ingredient_positions[i]
+                        i += 1
+                        if self.food_ids[ingredient_position] in skip_ids:
+                            continue
+                        if indices[ingredient_position] < first_index:
+                            work[-1] = (position, i)
+                            work.append((ingredient_position, self.ingredient_offsets[ingredient_position]))
+                            break
+                        if on_stack[ingredient_position]:
+                            lowlinks[position] = min(lowlinks[position], indices[ingredient_position])
+                    else:
+                        work.pop()
+                        if lowlinks[position] == indices[position]:
+                            component = []
+                            while True:
+                                member_position = stack.pop()
+                                on_stack[member_position] = 0
+                                component.append(self.food_ids[member_position])
+                                if member_position == position:
+                                    break
+                            components.append(component)
+                        if work:
+                            parent_position = work[-1][0]
+                            lowlinks[parent_position] = min(lowlinks[parent_position], lowlinks[position])
+        finally:
+            self._n_visited = n_visited
+            for position in stack:
+                on_stack[position] = 0
+        return components
+
+    def is_cycle(self, component: List[int]) -> bool:
+        """
+        Whether a strongly connected component is an ingredient cycle, i.e. has more than one member or is a food that
+        is an ingredient of itself.
+        """
+        return len(component) > 1 or component[0] in self.ingredients(component[0])
+
+    def find_cycles(self) -> List[List[int]]:
+        return [
+            component for component in self.strongly_connected_components(self.food_ids) if self.is_cycle(component)
+        ]
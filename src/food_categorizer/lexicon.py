@@ -0,0 +1,384 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import threading
+import tomllib
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional, Set, Type
+
+from food_categorizer.category_masks import (
+    build_token_mask_to_diet_category,
+    mask_of,
+    members_of,
+)
+from food_categorizer.models import DietCategory, TokenCategory
+from food_categorizer.utils import (
+    MaxiMunchTokenFinder,
+    TokenFinder,
+    TrieTokenFinder,
+    default_cache_dir,
+)
+
+# Bump this whenever the compiled form changes or the decision logic in category_masks changes, as neither is
+# covered by the lexicon hash.
+LEXICON_ARTIFACT_VERSION = 1
+MAX_LEXICON_ARTIFACTS = 4
+
+# both find exactly the same tokens, but the trie-based one doesn't get slower as the number of tokens grows
+TOKEN_FINDER_CLASSES: Dict[str, Type[TokenFinder]] = {
+    "regex": MaxiMunchTokenFinder,
+    "trie": TrieTokenFinder,
+}
+DEFAULT_TOKEN_FINDER = "trie"
+
+CategoriesToTokens = Mapping[TokenCategory, Set[str]]
+NullificationMappings = Mapping[TokenCategory, Mapping[TokenCategory, TokenCategory]]
+
+
+# many descriptions are repeated verbatim or only differ in case, so results are cached per normalized description
+DESCRIPTION_CACHE_SIZE = 2**16
+
+
+@dataclass
+class CompiledLexicon:
+    """
+    Everything the description-based heuristic needs, precomputed from a token lexicon.
+
+    Each compiled lexicon has its own description cache, so replacing a lexicon also replaces its cached results.
+    """
+
+    lexicon_hash: str
+    # inverted index of the lexicon: each token's TokenCategory mask
+    token_masks: Dict[str, int]
+    token_finder: TokenFinder
+    # mask of the token categories found in a description (before nullification) to the resulting diet category
+    mask_to_diet_category: List[DietCategory]
+
+    def __post_init__(self):
+        self.categorize_cached = lru_cache(maxsize=DESCRIPTION_CACHE_SIZE)(self.categorize)
+
+    def __getstate__(self) -> Dict:
+        # the cache can't be pickled, e.g. to pass the lexicon to worker processes, which start with an empty one
+        state = self.__dict__.copy()
+        del state["categorize_cached"]
+        return state
+
+    def __setstate__(self, state: Dict):
+        self.__dict__.update(state)
+        self.__post_init__()
+
+    def categorize(self, normalized_description: str) -> DietCategory:
+        return self.mask_to_diet_category[self.token_finder.find_mask(normalized_description)]
+
+
+def get_token_masks(categories_to_tokens: CategoriesToTokens) -> Dict[str, int]:
+    token_masks: Dict[str, int] = {}
+    for token_category, tokens in categories_to_tokens.items():
+        for token in tokens:
+            token_masks[token] = token_masks.get(token, 0) | token_category.mask
+    return token_masks
+
+
+def hash_lexicon(
+    categories_to_tokens: CategoriesToTokens,
+    nullification_mappings: NullificationMappings,
+    token_finder_name: str,
+) -> str:
+    lexicon_json = json.dumps(
+        {
+            "version": LEXICON_ARTIFACT_VERSION,
+            "token_finder": token_finder_name,
+            "categories_to_tokens": {
+                token_category.value: sorted(tokens) for token_category, tokens in categories_to_tokens.items()
+            },
+            "nullification_mappings": {
+                nullification_category.value: {k.value: v.value for k, v in mapping.items()}
+                for nullification_category, mapping in nullification_mappings.items()
+            },
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(lexicon_json.encode("utf-8")).hexdigest()
+
+
+def _nullify(
+    found_token_categories: Set[TokenCategory],
+    nullification_mappings: NullificationMappings,
+) -> Set[TokenCategory]:
+    for nullification_category in [TokenCategory.NULLIFIES_OMNI, TokenCategory.NULLIFIES_OMNI_AND_VEGETARIAN]:
+        if nullification_category not in found_token_categories:
+            continue
+        nullification_mapping = nullification_mappings[nullification_category]
+        found_token_categories = {
+            token_category
+            for token_category in {
+                (
+                    token_category
+                    if token_category not in nullification_mapping
+                    else nullification_mapping[token_category]
+                )
+                for token_category in found_token_categories
+            }
+            if token_category is not None
+        }
+    return found_token_categories
+
+
+def compile_lexicon(
+    categories_to_tokens: CategoriesToTokens,
+    nullification_mappings: NullificationMappings,
+    token_finder_name: str = DEFAULT_TOKEN_FINDER,
+) -> CompiledLexicon:
+    token_masks = get_token_masks(categories_to_tokens)
+    for token in token_masks:
+        if not token or token != token.strip():
+            raise ValueError(f"tokens must not be empty or begin or end with whitespace: {token!r}")
+    token_mask_to_diet_category = build_token_mask_to_diet_category()
+    return CompiledLexicon(
+        lexicon_hash=hash_lexicon(categories_to_tokens, nullification_mappings, token_finder_name),
+        token_masks=token_masks,
+        token_finder=TOKEN_FINDER_CLASSES[token_finder_name](token_masks, token_masks),
+        # the nullification step, precomputed for every possible combination of token categories and followed by the
+        # final decision
+        mask_to_diet_category=[
+            token_mask_to_diet_category[mask_of(_nullify(members_of(TokenCategory, mask), nullification_mappings))]
+            for mask in range(1 << len(TokenCategory))
+        ],
+    )
+
+
+def get_categories_to_tokens(token_masks: Mapping[str, int]) -> Dict[TokenCategory, Set[str]]:
+    """
+    Turns the inverted index of a lexicon back into the lexicon, leaving out token categories without tokens.
+    """
+    categories_to_tokens: Dict[TokenCategory, Set[str]] = {}
+    for token, mask in token_masks.items():
+        for token_category in members_of(TokenCategory, mask):
+            categories_to_tokens.setdefault(token_category, set()).add(token)
+    return categories_to_tokens
+
+
+def _load_data_file(path: Path) -> dict:
+    with path.open("rb") as f:
+        if path.suffix == ".toml":
+            return tomllib.load(f)
+        return json.load(f)
+
+
+def _parse_categories_to_tokens(data: Mapping[str, List[str]], path: Path) -> Dict[TokenCategory, Set[str]]:
+    if not isinstance(data, Mapping):
+        raise ValueError(f"lexicon file {str(path)!r} must map token category names to lists of tokens")
+    categories_to_tokens = {}
+    for name, tokens in data.items():
+        try:
+            token_category = TokenCategory(name)
+        except ValueError:
+            raise ValueError(f"unknown token category in lexicon file {str(path)!r}: {name!r}") from None
+        if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+            raise ValueError(f"tokens of {name!r} in lexicon file {str(path)!r} must be a list of strings")
+        for token in tokens:
+            if not token or token != token.strip():
+                raise ValueError(
+                    f"token {token!r} of {name!r} in lexicon file {str(path)!r} must not be empty or begin or end with "
+                    "whitespace"
+                )
+        categories_to_tokens[token_category] = {token.lower() for token in tokens}
+    return categories_to_tokens
+
+
+def load_lexicon_file(path: Path) -> Dict[TokenCategory, Set[str]]:
+    """
+    Loads a lexicon from a JSON or TOML file mapping TokenCategory names to lists of tokens.
+    """
+    return _parse_categories_to_tokens(_load_data_file(path), path)
+
+
+@dataclass
+class LexiconDiff:
+    """
+    Tokens to add to and remove from token categories of a lexicon.
+    """
+
+    added: Dict[TokenCategory, Set[str]]
+    removed: Dict[TokenCategory, Set[str]]
+
+    def apply(self, categories_to_tokens: CategoriesToTokens) -> Dict[TokenCategory, Set[str]]:
+        """
+        Returns a copy of the lexicon with the diff applied. Removing tokens that aren't in the lexicon does nothing.
+        """
+        changed_categories_to_tokens = {
+            token_category: set(tokens) for token_category, tokens in categories_to_tokens.items()
+        }
+        for token_category, tokens in self.added.items():
+            changed_categories_to_tokens.setdefault(token_category, set()).update(tokens)
+        for token_category, tokens in self.removed.items():
+            changed_categories_to_tokens.get(token_category, set()).difference_update(tokens)
+        return changed_categories_to_tokens
+
+
+def load_lexicon_diff_file(path: Path) -> LexiconDiff:
+    """
+    Loads a lexicon diff from a JSON or TOML file with an "add" and/or a "remove" table, each mapping TokenCategory
+    names to lists of tokens like a lexicon file.
+    """
+    data = _load_data_file(path)
+    if not isinstance(data, Mapping):
+        raise ValueError(f'lexicon diff file {str(path)!r} must have an "add" and/or a "remove" table')
+    unknown_keys = set(data) - {"add", "remove"}
+    if unknown_keys:
+        raise ValueError(f"unknown keys in lexicon diff file {str(path)!r}: {', '.join(sorted(unknown_keys))}")
+    return LexiconDiff(
+        added=_parse_categories_to_tokens(data.get("add", {}), path),
+        removed=_parse_categories_to_tokens(data.get("remove", {}), path),
+    )
+
+
+def save_lexicon_file(categories_to_tokens: CategoriesToTokens, path: Path):
+    """
+    Writes a lexicon to a JSON file that `load_lexicon_file` can read.
+    """
+    data = {token_category.value: sorted(tokens) for token_category, tokens in categories_to_tokens.items()}
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+
+class LexiconFileWatcher(threading.Thread):
+    """
+    Background thread that polls a lexicon file and recompiles it whenever it changes.
+
+    The new lexicon is only handed to `on_reload` once it is fully compiled, so callers can swap it in atomically. If
+    the file can't be loaded (e.g. because it is only partially written), the current lexicon is kept until the next
+    change.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        on_reload: Callable[[CompiledLexicon], None],
+        nullification_mappings: NullificationMappings,
+        token_finder_name: str = DEFAULT_TOKEN_FINDER,
+        interval: float = 1.0,
+    ):
+        super().__init__(name=f"LexiconFileWatcher({path})", daemon=True)
+        self.path = path
+        self.on_reload = on_reload
+        self.nullification_mappings = nullification_mappings
+        self.token_finder_name = token_finder_name
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last_stat = self._stat()
+
+    def _stat(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            current_stat = self._stat()
+            if current_stat is None or current_stat == self._last_stat:
+                continue
+            self._last_stat = current_stat
+            try:
+                lexicon = load_or_compile_lexicon(
+                    load_lexicon_file(self.path),
+                    self.nullification_mappings,
+                    self.token_finder_name,
+                )
+            except Exception as e:
+                # whatever is wrong with the file, the thread must keep running to pick up the next change
+                logging.warning("Keeping current lexicon, could not load %s: %s", self.path, e)
+                continue
+            logging.info("Reloaded lexicon from %s", self.path)
+            self.on_reload(lexicon)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def default_artifact_dir() -> Path:
+    return default_cache_dir()
+
+
+def _artifact_path(artifact_dir: Path, lexicon_hash: str) -> Path:
+    return artifact_dir / f"lexicon-v{LEXICON_ARTIFACT_VERSION}-{lexicon_hash}.pickle"
+
+
+def save_lexicon_artifact(lexicon: CompiledLexicon, artifact_dir: Path) -> Path:
+    """
+    Writes the compiled lexicon to the artifact directory, removing the oldest artifacts of other lexicons.
+    """
+    artifact_dir.mkdir(parents=True, exist_ok=True)
+    path = _artifact_path(artifact_dir, lexicon.lexicon_hash)
+    diet_categories = list(DietCategory)
+    data = {
+        "version": LEXICON_ARTIFACT_VERSION,
+        "lexicon_hash": lexicon.lexicon_hash,
+        "token_masks": lexicon.token_masks,
+        "token_finder": lexicon.token_finder,
+        # indices instead of enum members, which are much slower to unpickle
+        "mask_to_diet_category": bytes(diet_categories.index(category) for category in lexicon.mask_to_diet_category),
+    }
+    with tempfile.NamedTemporaryFile("wb", dir=artifact_dir, suffix=".tmp", delete=False) as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f.name, path)
+    # artifacts of other lexicons are only loaded if their lexicon is used again, so keep just the newest few
+    artifact_paths = sorted(artifact_dir.glob("lexicon-*.pickle"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old_path in artifact_paths[MAX_LEXICON_ARTIFACTS:]:
+        old_path.unlink(missing_ok=True)
+    return path
+
+
+def load_lexicon_artifact(artifact_dir: Path, lexicon_hash: str) -> Optional[CompiledLexicon]:
+    """
+    Loads the compiled lexicon with the given hash, or returns None if there is no valid artifact for it.
+    """
+    try:
+        with _artifact_path(artifact_dir, lexicon_hash).open("rb") as f:
+            data = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logging.debug("Ignoring unreadable lexicon artifact: %s", e)
+        return None
+    if data.get("version") != LEXICON_ARTIFACT_VERSION or data.get("lexicon_hash") != lexicon_hash:
+        return None
+    diet_categories = list(DietCategory)
+    return CompiledLexicon(
+        lexicon_hash=lexicon_hash,
+        token_masks=data["token_masks"],
+        token_finder=data["token_finder"],
+        mask_to_diet_category=[diet_categories[i] for i in data["mask_to_diet_category"]],
+    )
+
+
+def load_or_compile_lexicon(
+    categories_to_tokens: CategoriesToTokens,
+    nullification_mappings: NullificationMappings,
+    token_finder_name: str = DEFAULT_TOKEN_FINDER,
+    artifact_dir: Optional[Path] = None,
+) -> CompiledLexicon:
+    """
+    Loads the compiled lexicon from its artifact, (re)building the artifact first if it is missing or stale.
+    """
+    if artifact_dir is None:
+        artifact_dir = default_artifact_dir()
+    lexicon_hash = hash_lexicon(categories_to_tokens, nullification_mappings, token_finder_name)
+    lexicon = load_lexicon_artifact(artifact_dir, lexicon_hash)
+    if lexicon is None:
+        lexicon = compile_lexicon(categories_to_tokens, nullification_mappings, token_finder_name)
+        try:
+            save_lexicon_artifact(lexicon, artifact_dir)
+        except OSError as e:
+            # not being able to cache it is no reason to fail
+            logging.debug("Could not save lexicon artifact: %s", e)
+    return lexicon
@@ -0,0 +1,282 @@
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+from array import array
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.description_based_categorizer import normalize_description
+from food_categorizer.food_store import FoodStore
+from food_categorizer.ingredient_graph import IngredientGraph
+from food_categorizer.lexicon import CompiledLexicon
+from food_categorizer.models import DietCategory
+from food_categorizer.utils import StageTimings, default_cache_dir
+
+# Bump this whenever the layout of the token index changes
+TOKEN_INDEX_VERSION = 1
+
+
+def token_index_path(database_path: str) -> Path:
+    """
+    Path of the token index of the foods in a database, in the cache directory.
+    """
+    path_hash = hashlib.sha256(str(Path(database_path).resolve()).encode("utf-8")).hexdigest()[:16]
+    return default_cache_dir() / f"token-index-{path_hash}.pickle"
+
+
+def hash_food_data(food_store: FoodStore) -> str:
+    """
+    Hashes what the token index is built from, i.e. the descriptions and ingredients of all foods but not their diet
+    categories, so the index stays valid when only the categories are written back.
+    """
+    food_data_hash = hashlib.blake2b(digest_size=16)
+    for column in (food_store.food_ids, food_store.ingredient_offsets, food_store.ingredient_ids):
+        food_data_hash.update(column.tobytes())
+    food_data_hash.update("\0".join(food_store.descriptions).encode("utf-8", "surrogatepass"))
+    return food_data_hash.hexdigest()
+
+
+@dataclass
+class TokenIndex:
+    """
+    Which foods each token of a lexicon is found in, along with the ingredient graph of the foods.
+
+    Foods with the same normalized description share one entry: the foods with description i are
+    `description_food_ids[description_offsets[i]:description_offsets[i + 1]]`. The graph's reverse edges give the foods
+    containing each food, so the foods affected by a change can be found without going through all foods.
+    """
+
+    food_data_hash: str
+    lexicon_hash: str
+    # distinct normalized descriptions
+    descriptions: List[str]
+    description_offsets: array
+    description_food_ids: array
+    # token to the indices of the descriptions it is found in
+    descriptions_by_token: Dict[str, array]
+    ingredient_graph: IngredientGraph
+
+    @classmethod
+    def build(cls, food_store: FoodStore, lexicon: CompiledLexicon) -> "TokenIndex":
+        description_indices: Dict[str, int] = {}
+        food_description_indices = array("q")
+        for description in food_store.descriptions:
+            food_description_indices.append(
+                description_indices.setdefault(normalize_description(description), len(description_indices))
+            )
+        descriptions = list(description_indices)
+
+        # foods grouped by description, sorted into place by counting
+        description_offsets = array("q", bytes(8 * (len(descriptions) + 1)))
+        for i in food_description_indices:
+            description_offsets[i + 1] += 1
+        for i in range(len(descriptions)):
+            description_offsets[i + 1] += description_offsets[i]
+        description_food_ids = array("q", bytes(8 * len(food_description_indices)))
+        next_slots = description_offsets[:-1]
+        for food_id, i in zip(food_store.food_ids, food_description_indices):
+            description_food_ids[next_slots[i]] = food_id
+            next_slots[i] += 1
+
+        descriptions_by_token: Dict[str, array] = {}
+        for i, description in enumerate(descriptions):
+            for token in set(lexicon.token_finder.find_all(description)):
+                descriptions_by_token.setdefault(token, array("q")).append(i)
+
+        return cls(
+            food_data_hash=hash_food_data(food_store),
+            lexicon_hash=lexicon.lexicon_hash,
+            descriptions=descriptions,
+            description_offsets=description_offsets,
+            description_food_ids=description_food_ids,
+            descriptions_by_token=descriptions_by_token,
+            ingredient_graph=IngredientGraph(food_store),
+        )
+
+    def food_ids(self, description_indices: Iterable[int]) -> List[int]:
+        return [
+            food_id
+            for i in description_indices
+            for food_id in self.description_food_ids[self.description_offsets[i] : self.description_offsets[i + 1]]
+        ]
+
+    def candidate_descriptions(self, lexicon: CompiledLexicon, changed_lexicon: CompiledLexicon) -> Set[int]:
+        """
+        Returns the indices of all descriptions whose tokens might be found differently with the changed lexicon.
+
+        Tokens only make a difference where they are found. A token that was removed or moved to other categories
+        only changes descriptions it was found in before. An added token can only be found in descriptions containing
+        it, though it might take the place of tokens that were found there before, so those are searched for it.
+        """
+        changed_tokens = {
+            token
+            for token in lexicon.token_masks.keys() | changed_lexicon.token_masks.keys()
+            if lexicon.token_masks.get(token) != changed_lexicon.token_masks.get(token)
+        }
+        candidates: Set[int] = set()
+        for token in changed_tokens & lexicon.token_masks.keys():
+            candidates.update(self.descriptions_by_token.get(token, ()))
+        added_tokens = changed_tokens - lexicon.token_masks.keys()
+        if added_tokens:
+            candidates.update(
+                i
+                for i, description in enumerate(self.descriptions)
+                if any(token in description for token in added_tokens)
+            )
+        return candidates
+
+
+def save_token_index(token_index: TokenIndex, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=path.parent, suffix=".tmp", delete=False) as f:
+        pickle.dump((TOKEN_INDEX_VERSION, token_index), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f.name, path)
+
+
+def load_token_index(path: Path, food_data_hash: str, lexicon_hash: str) -> Optional[TokenIndex]:
+    """
+    Loads the token index at `path`, or returns None if there is none or it was built from other foods or another
+    lexicon.
+    """
+    try:
+        with path.open("rb") as f:
+            version, token_index = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, TypeError, pickle.UnpicklingError, EOFError, AttributeError, ImportError) as e:
+        logging.debug("Ignoring unreadable token index: %s", e)
+        return None
+    if (
+        version != TOKEN_INDEX_VERSION
+        or token_index.food_data_hash != food_data_hash
+        or token_index.lexicon_hash != lexicon_hash
+    ):
+        return None
+    return token_index
+
+
+def load_or_build_token_index(database_path: str, food_store: FoodStore, lexicon: CompiledLexicon) -> TokenIndex:
+    """
+    Loads the token index of the foods in a database, (re)building it first if it is missing or stale.
+    """
+    path = token_index_path(database_path)
+    token_index = load_token_index(path, hash_food_data(food_store), lexicon.lexicon_hash)
+    if token_index is None:
+        print("Building token index... ", end="", flush=True)
+        token_index = TokenIndex.build(food_store, lexicon)
+        try:
+            save_token_index(token_index, path)
+        except OSError as e:
+            # not being able to cache it is no reason to fail
+            logging.debug("Could not save token index: %s", e)
+        print("done")
+    return token_index
+
+
+@dataclass
+class CategoryChange:
+    food_id: int
+    fdc_id: int
+    description: str
+    diet_category: Optional[DietCategory]
+    changed_diet_category: DietCategory
+
+
+@dataclass
+class LexiconImpact:
+    """
+    How the categories of foods would change with a changed lexicon.
+    """
+
+    # foods whose description might be categorized differently
+    n_candidate_foods: int = 0
+    # foods whose description is categorized differently
+    n_changed_description_foods: int = 0
+    # those foods along with the foods containing them
+    n_recategorized_foods: int = 0
+    changes: List[CategoryChange] = field(default_factory=list)
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict:
+        """
+        Returns the impact in a form that can be dumped as JSON.
+        """
+        return {
+            "n_candidate_foods": self.n_candidate_foods,
+            "n_changed_description_foods": self.n_changed_description_foods,
+            "n_recategorized_foods": self.n_recategorized_foods,
+            "n_changes": len(self.changes),
+            "changes": [
+                {
+                    "food_id": change.food_id,
+                    "fdc_id": change.fdc_id,
+                    "description": change.description,
+                    "diet_category": change.diet_category.name if change.diet_category is not None else None,
+                    "changed_diet_category": change.changed_diet_category.name,
+                }
+                for change in self.changes
+            ],
+            "timings": self.timings,
+        }
+
+
+def find_lexicon_impact(
+    categorizer: Categorizer,
+    token_index: TokenIndex,
+    lexicon: CompiledLexicon,
+    timings: Optional[StageTimings] = None,
+) -> LexiconImpact:
+    """
+    Finds the foods whose category changes if the categorizer's lexicon is used instead of `lexicon`, given that the
+    categories in the categorizer's food store are the current ones.
+
+    Only foods whose description is categorized differently and the foods containing them are recategorized, all
+    other foods keep their current category.
+    """
+    if timings is None:
+        timings = StageTimings()
+    impact = LexiconImpact(timings=timings.seconds)
+    food_store = categorizer.food_store
+
+    with timings.stage("find_candidates"):
+        candidate_descriptions = token_index.candidate_descriptions(lexicon, categorizer.lexicon)
+        changed_descriptions = [
+            i
+            for i in sorted(candidate_descriptions)
+            if lexicon.categorize(token_index.descriptions[i])
+            != categorizer.lexicon.categorize(token_index.descriptions[i])
+        ]
+        impact.n_candidate_foods = len(token_index.food_ids(candidate_descriptions))
+        changed_description_ids = token_index.food_ids(changed_descriptions)
+        impact.n_changed_description_foods = len(changed_description_ids)
+
+    with timings.stage("recategorize"):
+        # only the affected foods and their ingredients are looked at, so there's no need to go through all foods
+        ingredient_graph = categorizer.ingredient_graph
+        affected_ids = ingredient_graph.dependents(changed_description_ids)
+        needed_ids = affected_ids.union(*(ingredient_graph.ingredients(food_id) for food_id in affected_ids))
+        previous_categories_by_id = {
+            food_id: food_store[food_id].diet_category
+            for food_id in needed_ids
+            if food_store[food_id].diet_category is not None
+        }
+        categories_by_id = categorizer.recategorize(changed_description_ids, previous_categories_by_id)
+        impact.n_recategorized_foods = len(categories_by_id)
+        for food_id, category in sorted(categories_by_id.items()):
+            previous_category = previous_categories_by_id.get(food_id)
+            if category != previous_category:
+                food = food_store[food_id]
+                impact.changes.append(
+                    CategoryChange(
+                        food_id=food_id,
+                        fdc_id=food.fdc_id,
+                        description=food.description,
+                        diet_category=previous_category,
+                        changed_diet_category=category,
+                    )
+                )
+    return impact
@@ -1,7 +1,11 @@
 from argparse import ArgumentParser
+from pathlib import Path
 
+from food_categorizer.app.build_lexicon import main as build_lexicon_main
+from food_categorizer.app.evaluate import main as evaluate_main
 from food_categorizer.app.generate import main as generate_main
 from food_categorizer.app.input_reference_samples import main as input_ref_main
+from food_categorizer.app.what_if import main as what_if_main
 
 
 def main():
@@ -9,16 +13,89 @@ def main():
     subparsers = parser.add_subparsers()
 
     generate_parser = subparsers.add_parser("generate", help="Generate vegattributes JSON")
+    generate_parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=(
+            "only recategorize foods without a category, whose reference sample disagrees with their category or that "
+            "were changed by `create_sqllite_db.py --upsert`, along with the foods containing them (removed reference "
+            "samples are not detected)"
+        ),
+    )
+    generate_parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of processes to categorize foods with, 0 to use all CPUs (default: 1)",
+    )
+    generate_parser.add_argument(
+        "--metrics-json",
+        type=Path,
+        metavar="PATH",
+        help="write the wall time and throughput of each stage to this JSON file",
+    )
     generate_parser.set_defaults(func=generate_main)
 
     input_ref_parser = subparsers.add_parser("input-ref", help="Interactively input reference data")
     input_ref_parser.set_defaults(func=input_ref_main)
 
+    build_lexicon_parser = subparsers.add_parser(
+        "build-lexicon",
+        help="Precompile the token lexicon into its on-disk artifact (otherwise done on first use)",
+    )
+    build_lexicon_parser.add_argument(
+        "--export",
+        type=Path,
+        metavar="PATH",
+        help=(
+            "also write the built-in lexicon to this JSON file, which can then be edited and used instead of it by "
+            "pointing FOOD_CATEGORIZER_LEXICON to it"
+        ),
+    )
+    build_lexicon_parser.set_defaults(func=build_lexicon_main)
+
+    evaluate_parser = subparsers.add_parser(
+        "evaluate",
+        help="Score the heuristics against the reference samples and print the results as JSON",
+    )
+    evaluate_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        metavar="PATH",
+        help="write the JSON to this file instead of stdout",
+    )
+    evaluate_parser.set_defaults(func=evaluate_main)
+
+    what_if_parser = subparsers.add_parser(
+        "what-if",
+        help=(
+            "Print the foods whose category would change if the lexicon were changed, as JSON, without changing "
+            "anything (compares against the categories in the database, so run `generate` with the current lexicon "
+            "first)"
+        ),
+    )
+    what_if_parser.add_argument(
+        "diff",
+        type=Path,
+        help=(
+            'JSON or TOML file with an "add" and/or a "remove" table mapping token category names to lists of tokens, '
+            'e.g. {"add": {"SUGGESTS_OMNI": ["anchovy"]}}'
+        ),
+    )
+    what_if_parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        metavar="PATH",
+        help="write the JSON to this file instead of stdout",
+    )
+    what_if_parser.set_defaults(func=what_if_main)
+
     args = parser.parse_args()
     if hasattr(args, "func"):
-        # If we would need Arguments ("parser.add_argument") for the function, we can collect them like this:
-        # **{k: v for k, v in vars(args).items() if k != "func"}
-        args.func()
+        args.func(**{k: v for k, v in vars(args).items() if k != "func"})
     else:
         print('You need to specify one option')
 
@@ -1,11 +1,11 @@
 from dataclasses import dataclass, field
 from enum import auto
-from typing import Dict, List, Self
+from typing import Dict, List, Optional, Self
 
-from food_categorizer.utils import AutoStrEnum
+from food_categorizer.utils import BitMaskEnum
 
 
-class TokenCategory(AutoStrEnum):
+class TokenCategory(BitMaskEnum):
     # "dummy" to block false positives, see below
     BLOCK = auto()
 
@@ -23,7 +23,7 @@ class TokenCategory(AutoStrEnum):
     SUGGESTS_OMNI = auto()
 
 
-class DietCategory(AutoStrEnum):
+class DietCategory(BitMaskEnum):
     VEGAN = auto()
     VEGAN_OR_VEGETARIAN = auto()
     VEGETARIAN = auto()
@@ -37,10 +37,10 @@ class DietCategory(AutoStrEnum):
 @dataclass
 class Food:
     food_id: int
-    fdc_id: int
+    fdc_id: Optional[int]
     description: str
     category: str
-    diet_category: DietCategory
+    diet_category: Optional[DietCategory]
     ingredients: List[int] = field(default_factory=list)
 
 
@@ -54,7 +54,7 @@ class ReferenceSample:
     @classmethod
     def from_dict(cls, data: Dict) -> Self:
         return cls(
-            food_id=data['food_id'],
+            food_id=int(data['food_id']),
             expected_diet_category=DietCategory(data['expected_diet_category']),
             category=data['category'],
             description=data['description'],
@@ -0,0 +1,107 @@
+import heapq
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Deque, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.description_based_categorizer import get_compiled_lexicon
+from food_categorizer.lexicon import CompiledLexicon
+from food_categorizer.models import DietCategory, Food, ReferenceSample
+from food_categorizer.reference_sample_store import ReferenceSampleStore
+from food_categorizer.utils import ProgressReporter
+
+# more batches than workers so that one big batch doesn't keep all other workers waiting
+BATCHES_PER_JOB = 4
+# batches submitted ahead of the results, so only a few batches' foods are copied for the workers at a time
+QUEUED_BATCHES_PER_JOB = 2
+
+# lexicon of the categorizer being run in parallel, set once in each worker process
+_worker_lexicon: Optional[CompiledLexicon] = None
+
+
+class _ReferenceSamplesSubset(ReferenceSampleStore):
+    """
+    Stand-in for the reference sample store in worker processes, which can't share the open file. Only keeps the
+    samples in memory.
+    """
+
+    def __init__(self, reference_samples_by_id: Mapping[int, ReferenceSample]):
+        super().__init__()
+        self._samples_by_id = dict(reference_samples_by_id)
+
+    def read_all_reference_samples(self) -> Iterator[ReferenceSample]:
+        return iter(self._index().values())
+
+    def write_reference_samples(self, samples: Sequence[ReferenceSample]):
+        pass
+
+    def commit(self):
+        pass
+
+
+def _init_worker(lexicon: CompiledLexicon):
+    global _worker_lexicon
+    _worker_lexicon = lexicon
+
+
+def _categorize_batch(
+    food_store: Mapping[int, Food],
+    reference_samples_by_id: Dict[int, ReferenceSample],
+) -> Tuple[Dict[int, DietCategory], List[List[int]]]:
+    categorizer = Categorizer(
+        ref_store=_ReferenceSamplesSubset(reference_samples_by_id), food_store=food_store, lexicon=_worker_lexicon
+    )
+    return categorizer.categorize_all(), categorizer.cycles
+
+
+def _split_into_batches(components: List[List[int]], n_batches: int) -> List[List[int]]:
+    """
+    Distributes components over batches of roughly equal size, largest components first.
+    """
+    batches: List[List[int]] = [[] for _ in range(n_batches)]
+    batch_sizes = [(0, i) for i in range(n_batches)]
+    for component in sorted(components, key=len, reverse=True):
+        size, i = heapq.heappop(batch_sizes)
+        batches[i].extend(component)
+        heapq.heappush(batch_sizes, (size + len(component), i))
+    return [batch for batch in batches if batch]
+
+
+def categorize_all_in_parallel(
+    categorizer: Categorizer,
+    jobs: int,
+    progress: Optional[ProgressReporter] = None,
+) -> Dict[int, DietCategory]:
+    """
+    Like `Categorizer.categorize_all`, but categorizes independent parts of the ingredient graph in `jobs` worker
+    processes. The results are the same as those of the serial version and end up in the given categorizer. `progress`
+    is updated whenever a batch is done.
+    """
+    components = categorizer.ingredient_graph.connected_components()
+    batches = _split_into_batches(components, jobs * BATCHES_PER_JOB)
+    # workers would fall back to the global lexicon otherwise, which isn't set up in spawned processes
+    lexicon = categorizer.lexicon if categorizer.lexicon is not None else get_compiled_lexicon()
+
+    def collect(future: Future):
+        categories_by_id, cycles = future.result()
+        categorizer.categories_by_id.update(categories_by_id)
+        categorizer.cycles.extend(cycles)
+        if progress is not None:
+            progress.update(len(categorizer.categories_by_id))
+
+    # results are collected in the order of the batches, as the cycles would come out in another order otherwise
+    pending: Deque[Future] = deque()
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(lexicon,)) as executor:
+        for batch in batches:
+            food_store = {food_id: categorizer.food_store[food_id] for food_id in batch}
+            reference_samples_by_id = {
+                food_id: categorizer.reference_samples_by_id[food_id]
+                for food_id in batch
+                if food_id in categorizer.reference_samples_by_id
+            }
+            pending.append(executor.submit(_categorize_batch, food_store, reference_samples_by_id))
+            if len(pending) >= jobs * QUEUED_BATCHES_PER_JOB:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    return categorizer.categories_by_id
@@ -0,0 +1,92 @@
+import time
+from abc import ABC, abstractmethod
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, KeysView, Mapping, Optional, Sequence
+
+from food_categorizer.models import ReferenceSample
+
+
+class ReferenceSampleStore(ABC):
+    """
+    Reference samples with an in-memory index by food ID.
+
+    The index is built by reading all samples once, on first use, and is kept in sync by `append_reference_samples`.
+    Lookups after that don't touch the underlying file, so the store assumes it is the only one writing to it. If a
+    food has several samples, the last one counts.
+
+    Appended samples are committed to the underlying storage in groups, once `flush_every` samples are pending or
+    `flush_interval` seconds have passed since the last commit, and always when the store is closed. There is no timer
+    though: the interval is only checked when a sample is appended, so samples appended before the writer goes idle
+    stay pending until the next append, `flush()` or closing the store.
+    """
+
+    def __init__(self, flush_every: int = 1, flush_interval: Optional[float] = None):
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._samples_by_id: Optional[Dict[int, ReferenceSample]] = None
+        self._n_unflushed = 0
+        self._last_flush_time = time.monotonic()
+
+    @abstractmethod
+    def read_all_reference_samples(self) -> Iterator[ReferenceSample]:
+        """
+        Reads all reference samples from the underlying storage.
+        """
+
+    @abstractmethod
+    def write_reference_samples(self, samples: Sequence[ReferenceSample]):
+        """
+        Adds reference samples to the underlying storage, without committing them or updating the index.
+        """
+
+    @abstractmethod
+    def commit(self):
+        """
+        Makes sure all written reference samples are stored.
+        """
+
+    def append_reference_samples(self, samples: Iterable[ReferenceSample]):
+        """
+        Appends many reference samples at once, which are committed together.
+        """
+        samples = list(samples)
+        self.write_reference_samples(samples)
+        self._n_unflushed += len(samples)
+        if self._samples_by_id is not None:
+            self._samples_by_id.update((sample.food_id, sample) for sample in samples)
+        if self._n_unflushed >= self.flush_every or (
+            self.flush_interval is not None and time.monotonic() - self._last_flush_time >= self.flush_interval
+        ):
+            self.flush()
+
+    def append_reference_sample(self, sample: ReferenceSample):
+        self.append_reference_samples([sample])
+
+    def flush(self):
+        if self._n_unflushed:
+            self.commit()
+            self._n_unflushed = 0
+        self._last_flush_time = time.monotonic()
+
+    def _index(self) -> Dict[int, ReferenceSample]:
+        if self._samples_by_id is None:
+            self._samples_by_id = {sample.food_id: sample for sample in self.read_all_reference_samples()}
+        return self._samples_by_id
+
+    def get(self, food_id: int) -> Optional[ReferenceSample]:
+        return self._index().get(food_id)
+
+    def __contains__(self, food_id: int) -> bool:
+        return food_id in self._index()
+
+    def __len__(self) -> int:
+        return len(self._index())
+
+    def get_all_mapped_by_ids(self) -> Mapping[int, ReferenceSample]:
+        """
+        Returns a read-only view of the index, which reflects later appends.
+        """
+        return MappingProxyType(self._index())
+
+    def get_all_ids(self) -> KeysView[int]:
+        return self._index().keys()
@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+from os import PathLike, environ
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from food_categorizer.reference_sample_store import ReferenceSampleStore
+from food_categorizer.reference_samples_csv import DEFAULT_RS_PATH, ReferenceSamplesCsv
+from food_categorizer.reference_samples_sqlite import ReferenceSamplesSqlite
+
+SQLITE_SUFFIXES = {".db", ".sqlite", ".sqlite3"}
+
+
+def reference_samples_path() -> Path:
+    """
+    Path of the reference samples, which is $FOOD_CATEGORIZER_REFERENCE_SAMPLES if that is set.
+    """
+    return Path(environ.get("FOOD_CATEGORIZER_REFERENCE_SAMPLES") or DEFAULT_RS_PATH)
+
+
+@contextmanager
+def open_reference_samples(
+    path: Optional[Union[PathLike, str]] = None,
+    create=False,
+    flush_every: int = 1,
+    flush_interval: Optional[float] = None,
+    fsync: bool = False,
+) -> Iterator[ReferenceSampleStore]:
+    """
+    Opens the reference samples at the given path (or `reference_samples_path()`), stored in an SQLite database if it
+    has one of `SQLITE_SUFFIXES` and in a CSV file otherwise.
+
+    `fsync` only applies to CSV files, as SQLite syncs every commit to disk anyway.
+    """
+    path = Path(path) if path is not None else reference_samples_path()
+    if path.suffix in SQLITE_SUFFIXES:
+        ref_store_context = ReferenceSamplesSqlite.from_path(
+            path, create=create, flush_every=flush_every, flush_interval=flush_interval
+        )
+    else:
+        ref_store_context = ReferenceSamplesCsv.from_path(
+            path, create=create, flush_every=flush_every, flush_interval=flush_interval, fsync=fsync
+        )
+    with ref_store_context as ref_store:
+        yield ref_store
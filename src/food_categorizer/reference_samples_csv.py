@@ -1,14 +1,81 @@
 import csv
+import logging
+import os
 from contextlib import contextmanager
 from os import PathLike
-from typing import Generator, Iterable, Iterator, Mapping, Optional, Self, Union
+from pathlib import Path
+from typing import Generator, Iterator, Optional, Self, Sequence, Union
 
 from food_categorizer.models import ReferenceSample
+from food_categorizer.reference_sample_store import ReferenceSampleStore
 
 DEFAULT_RS_PATH = 'reference_samples.csv'
 
+FIELDNAMES = ['food_id', 'expected_diet_category', 'category', 'description']
 
-class ReferenceSamplesCsv:
+# number of bytes read at a time when looking for the end of the last complete line
+TAIL_CHUNK_SIZE = 4096
+
+
+def _is_complete_line(line: bytes, is_header: bool) -> bool:
+    """
+    Whether a line is a complete header or a complete and valid reference sample.
+    """
+    try:
+        rows = list(csv.reader([line.decode("utf-8")]))
+    except (UnicodeDecodeError, csv.Error):
+        return False
+    if len(rows) != 1 or len(rows[0]) != len(FIELDNAMES):
+        return False
+    if is_header:
+        return rows[0] == FIELDNAMES
+    try:
+        ReferenceSample.from_dict(dict(zip(FIELDNAMES, rows[0])))
+    except ValueError:
+        return False
+    return True
+
+
+def repair_torn_last_line(path: Union[PathLike, str, bytes], keep_complete_line: bool = False) -> int:
+    """
+    Makes sure the last line of a reference samples file is terminated by a newline, so that appending doesn't continue
+    it. Returns the number of bytes cut off.
+
+    Rows are always written along with their newline, so a last line without one was cut off by a crash while writing
+    it and is removed, even if what is left of it happens to be a valid row. With `keep_complete_line`, e.g. for files
+    edited by hand, a last line that is a complete header or valid row gets the missing newline instead.
+    """
+    with open(path, "rb+") as file:
+        size = file.seek(0, os.SEEK_END)
+        end = size
+        while end > 0:
+            start = max(0, end - TAIL_CHUNK_SIZE)
+            file.seek(start)
+            chunk = file.read(end - start)
+            if end == size and chunk.endswith(b"\n"):
+                return 0
+            newline_pos = chunk.rfind(b"\n")
+            if newline_pos != -1:
+                end = start + newline_pos + 1
+                break
+            end = start
+        if end == size:
+            return 0
+        file.seek(end)
+        if keep_complete_line and _is_complete_line(file.read(size - end), is_header=end == 0):
+            file.write(b"\n")
+            logging.info("Added missing newline at the end of %s", path)
+            removed = 0
+        else:
+            file.truncate(end)
+            logging.warning("Removed incomplete last line (%d bytes) from %s", size - end, path)
+            removed = size - end
+        file.flush()
+        os.fsync(file.fileno())
+    return removed
+
+
+class ReferenceSamplesCsv(ReferenceSampleStore):
     """
     CSV file containing reference samples.
     """
@@ -18,8 +85,15 @@ class ReferenceSamplesCsv:
         file,
         csv_reader: Optional[csv.DictReader] = None,
         csv_writer: Optional[csv.DictWriter] = None,
+        flush_every: int = 1,
+        flush_interval: Optional[float] = None,
+        fsync: bool = False,
     ):
+        super().__init__(flush_every=flush_every, flush_interval=flush_interval)
         self.file = file
+        self.fsync = fsync
+        # whether the file position is known to be at the end, so appending doesn't need to seek there first
+        self._at_end = False
         self.csv_reader = csv_reader
         self.csv_writer = csv_writer
 
@@ -29,17 +103,28 @@ class ReferenceSamplesCsv:
         cls,
         path: Union[PathLike, str, bytes],
         create=False,
+        flush_every: int = 1,
+        flush_interval: Optional[float] = None,
+        fsync: bool = False,
+        keep_complete_last_line: bool = False,
     ) -> Iterator[Self]:
         """
         Opens CSV file for reading and/or writing depending on the given mode.
+
+        Appended samples are flushed to the file as configured by `flush_every` and `flush_interval` (see
+        `ReferenceSampleStore`), and also synced to disk if `fsync` is set. A torn last line left behind by a crash
+        while writing is removed first, unless `keep_complete_last_line` is set and it is a valid row (see
+        `repair_torn_last_line`).
         """
         mode = "a+" if create else "r+"
+        if Path(path).is_file():
+            repair_torn_last_line(path, keep_complete_line=keep_complete_last_line)
         with open(path, mode, encoding='utf-8') as file:
             csv_writer = None
             if any(m in mode for m in "wa+"):
                 csv_writer = csv.DictWriter(
                     file,
-                    ['food_id', 'expected_diet_category', 'category', 'description'],
+                    FIELDNAMES,
                     lineterminator="\n",
                 )
 
@@ -50,20 +135,43 @@ class ReferenceSamplesCsv:
             if csv_reader is None and csv_writer is None:
                 raise ValueError("invalid mode: {repr(mode)}")
 
-            result_store = cls(file=file, csv_reader=csv_reader, csv_writer=csv_writer)
+            result_store = cls(
+                file=file,
+                csv_reader=csv_reader,
+                csv_writer=csv_writer,
+                flush_every=flush_every,
+                flush_interval=flush_interval,
+                fsync=fsync,
+            )
             if create:
                 result_store.write_header_if_empty()
-            yield result_store
+            try:
+                yield result_store
+            finally:
+                result_store.flush()
 
     def _reset_and_write_header(self):
         assert self.csv_writer is not None
         self.file.seek(0)
         self.file.truncate()
         self.csv_writer.writeheader()
+        self._samples_by_id = None
+        self._at_end = True
 
     def write_reference_sample(self, sample: ReferenceSample):
+        self.write_reference_samples([sample])
+
+    def write_reference_samples(self, samples: Sequence[ReferenceSample]):
         assert self.csv_writer is not None
-        self.csv_writer.writerow(sample.as_dict())
+        if not self._at_end:
+            self.file.seek(0, 2)  # set cursor to end of file
+            self._at_end = True
+        self.csv_writer.writerows(sample.as_dict() for sample in samples)
+
+    def commit(self):
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
 
     def write_header_if_empty(self):
         if self._is_empty():
@@ -76,24 +184,16 @@ class ReferenceSamplesCsv:
         if not self.file.read(1):
             is_empty = True
         self.file.seek(orig_pos)
+        self._at_end = False
         return is_empty
 
-    def append_reference_sample(self, d: ReferenceSample):
-        assert self.csv_writer is not None
-        self.file.seek(0, 2)  # set cursor to end of file
-        self.write_reference_sample(d)
-
     def read_all_reference_samples(self) -> Generator[ReferenceSample, None, None]:
         """
         Read all reference sample dicts from the beginning to the end of the file.
         """
         assert self.csv_reader is not None
         self.file.seek(0)
-        for row in self.csv_reader:
+        self._at_end = False
+        # a fresh reader is needed each time, otherwise the header would be read as a row after seeking back
+        for row in csv.DictReader(self.file):
             yield ReferenceSample.from_dict(row)
-
-    def get_all_mapped_by_ids(self) -> Mapping[int, ReferenceSample]:
-        return {sample.food_id: sample for sample in self.read_all_reference_samples()}
-
-    def get_all_ids(self) -> Iterable[int]:
-        return (sample.food_id for sample in self.read_all_reference_samples())
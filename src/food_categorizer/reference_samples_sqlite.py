@@ -0,0 +1,90 @@
+import sqlite3
+from contextlib import contextmanager
+from os import PathLike
+from pathlib import Path
+from typing import Iterator, Optional, Self, Sequence, Union
+
+from food_categorizer.models import DietCategory, ReferenceSample
+from food_categorizer.reference_sample_store import ReferenceSampleStore
+
+DEFAULT_RS_TABLE = 'ReferenceSamples'
+
+
+class ReferenceSamplesSqlite(ReferenceSampleStore):
+    """
+    Table of an SQLite database containing reference samples, with one sample per food.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        table: str = DEFAULT_RS_TABLE,
+        flush_every: int = 1,
+        flush_interval: Optional[float] = None,
+    ):
+        super().__init__(flush_every=flush_every, flush_interval=flush_interval)
+        self.conn = conn
+        self.table = table
+
+    @classmethod
+    @contextmanager
+    def from_path(
+        cls,
+        path: Union[PathLike, str],
+        create=False,
+        table: str = DEFAULT_RS_TABLE,
+        flush_every: int = 1,
+        flush_interval: Optional[float] = None,
+    ) -> Iterator[Self]:
+        """
+        Opens the database, creating it and the table if `create` is set. Appended samples are committed in
+        transactions as configured by `flush_every` and `flush_interval` (see `ReferenceSampleStore`).
+        """
+        if not create and not Path(path).is_file():
+            raise FileNotFoundError(f"no such reference samples database: {str(path)!r}")
+        conn = sqlite3.connect(path)
+        try:
+            result_store = cls(conn, table, flush_every=flush_every, flush_interval=flush_interval)
+            if create:
+                result_store.create_table_if_missing()
+            try:
+                yield result_store
+            finally:
+                result_store.flush()
+        finally:
+            conn.close()
+
+    def create_table_if_missing(self):
+        with self.conn:
+            self.conn.execute(f'''
+CREATE TABLE IF NOT EXISTS {self.table} (
+    food_id INTEGER PRIMARY KEY,
+    expected_diet_category TEXT,
+    category TEXT,
+    description TEXT
+)
+''')
+
+    def read_all_reference_samples(self) -> Iterator[ReferenceSample]:
+        rows = self.conn.execute(
+            f'SELECT food_id, expected_diet_category, category, description FROM {self.table} ORDER BY rowid'
+        )
+        for food_id, expected_diet_category, category, description in rows:
+            yield ReferenceSample(
+                food_id=food_id,
+                expected_diet_category=DietCategory(expected_diet_category),
+                category=category,
+                description=description,
+            )
+
+    def write_reference_samples(self, samples: Sequence[ReferenceSample]):
+        self.conn.executemany(
+            f'''
+INSERT OR REPLACE INTO {self.table} (food_id, expected_diet_category, category, description)
+VALUES (:food_id, :expected_diet_category, :category, :description)
+''',
+            (sample.as_dict() for sample in samples),
+        )
+
+    def commit(self):
+        self.conn.commit()
@@ -1,10 +1,29 @@
 import os
 import random
 import re
+import sys
+import time
+from contextlib import contextmanager
 from dataclasses import asdict
 from enum import Enum
+from pathlib import Path
 from textwrap import wrap
-from typing import Any, Callable, List, Optional, Sequence, TypeVar
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    TextIO,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 T = TypeVar("T")
 
@@ -15,21 +34,110 @@ def get_fdc_app_details_url(fdc_id: int):
     return f"{FDC_APP_DETAILS_BASE_URL}{fdc_id}"
 
 
+def _environ_path(name: str) -> Optional[Path]:
+    value = os.environ.get(name)
+    return Path(value) if value else None
+
+
+def default_cache_dir() -> Path:
+    cache_dir = _environ_path("FOOD_CATEGORIZER_CACHE_DIR")
+    if cache_dir is not None:
+        return cache_dir
+    return (_environ_path("XDG_CACHE_HOME") or Path.home() / ".cache") / "food-categorizer"
+
+
 class AutoStrEnum(Enum):
     @staticmethod
     def _generate_next_value_(name, start, count, last_values):
         return name
 
 
+class BitMaskEnum(AutoStrEnum):
+    """
+    Enum whose members each have their own bit in `mask`, so sets of members can be represented as integers.
+    """
+
+    def __init__(self, *args):
+        self.mask = 1 << len(type(self).__members__)
+
+
 class MaxiMunchTokenFinder:
-    def __init__(self, tokens):
+    def __init__(self, tokens: Iterable[str], token_masks: Optional[Mapping[str, int]] = None):
         self.regex = re.compile(
             "(" + "|".join(re.escape(token) for token in sorted(tokens, key=len, reverse=True)) + ")"
         )
+        self.token_masks = token_masks or {}
 
-    def find_all(self, s: str):
+    def find_all(self, s: str) -> List[str]:
         return self.regex.findall(s)
 
+    def find_mask(self, s: str) -> int:
+        """
+        Returns the bitwise OR of the masks of all tokens found in `s`. Tokens without a mask count as 0.
+        """
+        mask = 0
+        for token in self.regex.findall(s):
+            mask |= self.token_masks.get(token, 0)
+        return mask
+
+
+class TrieTokenFinder:
+    """
+    Finds the same tokens as `MaxiMunchTokenFinder`, i.e. the longest token starting at the leftmost position, then the
+    longest one after it and so on, by walking a trie of all tokens instead of trying each token in turn. The cost per
+    position only depends on the length of the longest token, not on the number of tokens.
+    """
+
+    # key under which nodes store the token ending there along with its mask
+    _TOKEN = None
+
+    def __init__(self, tokens: Iterable[str], token_masks: Optional[Mapping[str, int]] = None):
+        token_masks = token_masks or {}
+        self.root: dict = {}
+        for token in tokens:
+            node = self.root
+            for char in token:
+                node = node.setdefault(char, {})
+            node[self._TOKEN] = (token, token_masks.get(token, 0))
+
+    def _find_all_with_masks(self, s: str) -> List[Tuple[str, int]]:
+        found = []
+        root = self.root
+        token_key = self._TOKEN
+        n = len(s)
+        i = 0
+        while i < n:
+            node = root.get(s[i])
+            token_and_mask = None
+            j = i
+            while node is not None:
+                j += 1
+                token_and_mask = node.get(token_key, token_and_mask)
+                if j == n:
+                    break
+                node = node.get(s[j])
+            if token_and_mask is None:
+                i += 1
+            else:
+                found.append(token_and_mask)
+                i += len(token_and_mask[0])
+        return found
+
+    def find_all(self, s: str) -> List[str]:
+        return [token for token, _ in self._find_all_with_masks(s)]
+
+    def find_mask(self, s: str) -> int:
+        """
+        Returns the bitwise OR of the masks of all tokens found in `s`. Tokens without a mask count as 0.
+        """
+        mask = 0
+        for _, token_mask in self._find_all_with_masks(s):
+            mask |= token_mask
+        return mask
+
+
+TokenFinder = Union[MaxiMunchTokenFinder, TrieTokenFinder]
+
 
 def select_n_random(
     items: Sequence[T],
@@ -59,6 +167,108 @@ def select_n_random(
     return selected
 
 
+class ReservoirSampler(Generic[T]):
+    """
+    Selects n random items from a stream of unknown length, keeping no more than n items in memory.
+    """
+
+    def __init__(self, n: int):
+        self.n = n
+        self.n_seen = 0
+        self.items: List[T] = []
+
+    def add(self, item: T):
+        self.n_seen += 1
+        if len(self.items) < self.n:
+            self.items.append(item)
+        else:
+            i = random.randrange(self.n_seen)
+            if i < self.n:
+                self.items[i] = item
+
+    def select(self, pad: Optional[Callable[[], T]] = None) -> List[T]:
+        if len(self.items) < self.n:
+            if pad is None:
+                raise ValueError("not enough items in given sequence")
+            return self.items + [pad() for _ in range(self.n - len(self.items))]
+        return list(self.items)
+
+
+class StageTimings:
+    """
+    Wall-clock seconds spent in named stages, in the order the stages were first entered, along with the number of
+    items each stage processed where that is known.
+    """
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self.n_items: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+
+    def add_items(self, name: str, n_items: int):
+        self.n_items[name] = self.n_items.get(name, 0) + n_items
+
+    def as_dict(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Returns the seconds, number of items and items per second of each stage in a form that can be dumped as JSON.
+        """
+        stages = {}
+        for name, seconds in self.seconds.items():
+            n_items = self.n_items.get(name)
+            stages[name] = {
+                "seconds": seconds,
+                "n_items": n_items,
+                "items_per_second": n_items / seconds if n_items is not None and seconds > 0 else None,
+            }
+        return stages
+
+
+class ProgressReporter:
+    """
+    Shows how far along a loop is as a percentage at the end of the current terminal line.
+
+    `update` can be called on every iteration of a hot loop, as the percentage is only redrawn every `interval` seconds.
+    Nothing is written if the stream isn't a terminal, e.g. when the output is redirected to a file.
+    """
+
+    def __init__(self, total: int, stream: Optional[TextIO] = None, interval: float = 0.25):
+        self.total = total
+        self.stream = sys.stdout if stream is None else stream
+        self.interval = interval
+        self.enabled = self.stream.isatty()
+        self._next_refresh = 0.0
+        self._shown = False
+
+    def update(self, n_done: int):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        if now < self._next_refresh:
+            return
+        self._next_refresh = now + self.interval
+        percentage = n_done / self.total * 100 if self.total else 100.0
+        # overwrite the previous percentage, which is always four characters wide
+        self.stream.write(("\b" * 4 if self._shown else "") + f"{percentage:>3.0f}%")
+        self.stream.flush()
+        self._shown = True
+
+    def finish(self):
+        """
+        Removes the percentage again.
+        """
+        if self._shown:
+            self.stream.write("\b" * 4 + " " * 4 + "\b" * 4)
+            self.stream.flush()
+            self._shown = False
+
+
 def print_as_table(rows, column_width=None):
     try:
         terminal_width = os.get_terminal_size().columns
@@ -0,0 +1,59 @@
+from pathlib import Path
+from typing import List, Mapping
+
+import pytest
+
+from food_categorizer.food_store import FoodStore
+from food_categorizer.models import Food
+from food_categorizer.reference_samples import open_reference_samples
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path: Path, monkeypatch) -> Path:
+    cache_dir = tmp_path / "cache"
+    monkeypatch.setenv("FOOD_CATEGORIZER_CACHE_DIR", str(cache_dir))
+    return cache_dir
+
+
+def make_food(food_id, description, ingredients=()) -> Food:
+    return Food(
+        food_id=food_id,
+        fdc_id=food_id * 10,
+        description=description,
+        category="Somesuch and other miscellany",
+        diet_category=None,
+        ingredients=list(ingredients),
+    )
+
+
+def make_food_store(foods, columnar=True) -> Mapping[int, Food]:
+    if not columnar:
+        return {food.food_id: food for food in foods}
+    store = FoodStore()
+    for food in sorted(foods, key=lambda food: food.food_id):
+        store.append(food.food_id, food.fdc_id, food.description, food.category, food.diet_category, food.ingredients)
+    return store
+
+
+@pytest.fixture
+def foods() -> List[Food]:
+    return [
+        make_food(1, "Milk, NFS"),
+        make_food(2, "Flour, wheat"),
+        make_food(3, "Chicken, raw"),
+        make_food(4, "Pancake", ingredients=[1, 2]),
+        make_food(5, "Pancake with chicken", ingredients=[4, 3]),
+        make_food(6, "Stack of pancakes", ingredients=[4, 4, 1]),
+        make_food(7, "Mystery dish", ingredients=[999]),
+    ]
+
+
+@pytest.fixture(params=["dict", "columnar"])
+def food_store(request, foods) -> Mapping[int, Food]:
+    return make_food_store(foods, columnar=request.param == "columnar")
+
+
+@pytest.fixture(params=["reference_samples.csv", "reference_samples.db"])
+def ref_store(request, tmp_path: Path):
+    with open_reference_samples(tmp_path / request.param, create=True) as ref_store:
+        yield ref_store
@@ -0,0 +1,128 @@
+from unittest.mock import patch
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.models import DietCategory, ReferenceSample
+
+from .conftest import make_food
+
+
+def test_categorize_all(food_store, ref_store):
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    categories = categorizer.categorize_all()
+    assert categories == {
+        1: DietCategory.VEGETARIAN,
+        2: DietCategory.VEGAN,
+        3: DietCategory.OMNI,
+        4: DietCategory.VEGETARIAN,
+        5: DietCategory.OMNI,
+        6: DietCategory.VEGETARIAN,
+        7: DietCategory.UNCATEGORIZED,
+    }
+
+
+def test_categorize_all_categorizes_each_food_once(food_store, ref_store):
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    with patch.object(categorizer, "_categorize_uncached", wraps=categorizer._categorize_uncached) as mock_categorize:
+        categorizer.categorize_all()
+    categorized_ids = [call.args[0].food_id for call in mock_categorize.call_args_list]
+    assert sorted(categorized_ids) == sorted(food_store)
+
+
+def test_foods_in_dependency_order(food_store, ref_store):
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    positions = {food.food_id: i for i, food in enumerate(categorizer.foods_in_dependency_order())}
+    assert sorted(positions) == sorted(food_store)
+    for food in food_store.values():
+        for ingredient_id in food.ingredients:
+            if ingredient_id in food_store:
+                assert positions[ingredient_id] < positions[food.food_id]
+
+
+def test_reference_sample_overrides_ingredient(food_store, ref_store):
+    ref_store.append_reference_sample(
+        ReferenceSample(
+            food_id=1,
+            expected_diet_category=DietCategory.VEGAN,
+            category="Milk",
+            description="Milk, NFS",
+        )
+    )
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    categories = categorizer.categorize_all()
+    assert categories[1] == DietCategory.VEGAN
+    assert categories[4] == DietCategory.VEGAN
+    assert categories[6] == DietCategory.VEGAN
+
+
+def test_ingredient_cycle(ref_store):
+    food_store = {
+        food.food_id: food
+        for food in [
+            make_food(1, "Chicken, raw"),
+            make_food(2, "Sauce A", ingredients=[3]),
+            make_food(3, "Sauce B", ingredients=[2, 1]),
+            make_food(4, "Dish with sauce", ingredients=[2]),
+            make_food(5, "Self-referencing apple", ingredients=[5]),
+        ]
+    }
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    categories = categorizer.categorize_all()
+    assert categories == {
+        1: DietCategory.OMNI,
+        2: DietCategory.OMNI,
+        3: DietCategory.OMNI,
+        4: DietCategory.OMNI,
+        5: DietCategory.VEGAN,
+    }
+    assert sorted(sorted(cycle) for cycle in categorizer.cycles) == [[2, 3], [5]]
+    assert sorted(sorted(cycle) for cycle in categorizer.ingredient_graph.find_cycles()) == [[2, 3], [5]]
+
+
+def test_deep_ingredient_chain_does_not_recurse(ref_store):
+    depth = 50_000
+    food_store = {1: make_food(1, "Milk, NFS")}
+    for food_id in range(2, depth + 1):
+        food_store[food_id] = make_food(food_id, "Something", ingredients=[food_id - 1])
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    assert categorizer.categorize(food_store[depth]) == DietCategory.VEGETARIAN
+    assert len(categorizer.categories_by_id) == depth
+
+
+def test_recategorize(food_store, ref_store):
+    previous_categories = Categorizer(ref_store=ref_store, food_store=food_store).categorize_all()
+    ref_store.append_reference_sample(
+        ReferenceSample(
+            food_id=1,
+            expected_diet_category=DietCategory.VEGAN,
+            category="Milk",
+            description="Milk, NFS",
+        )
+    )
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    with patch.object(categorizer, "_categorize_uncached", wraps=categorizer._categorize_uncached) as mock_categorize:
+        recategorized = categorizer.recategorize([1], previous_categories)
+    assert recategorized == {
+        1: DietCategory.VEGAN,
+        4: DietCategory.VEGAN,
+        5: DietCategory.OMNI,
+        6: DietCategory.VEGAN,
+    }
+    assert sorted(call.args[0].food_id for call in mock_categorize.call_args_list) == [1, 4, 5, 6]
+    all_categories = Categorizer(ref_store=ref_store, food_store=food_store).categorize_all()
+    assert {**previous_categories, **recategorized} == all_categories
+
+
+def test_ingredient_based_heuristic_uses_cached_categories(food_store, ref_store):
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    categorizer.categorize_all()
+    with patch.object(categorizer, "categorize", wraps=categorizer.categorize) as mock_categorize:
+        assert categorizer.ingredient_based_heuristic_categorize(food_store[5]) == DietCategory.OMNI
+        assert categorizer.ingredient_based_heuristic_categorize(food_store[6]) == DietCategory.VEGETARIAN
+    mock_categorize.assert_not_called()
+
+
+def test_ingredient_based_heuristic_for_food_not_in_store(food_store, ref_store):
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    food = make_food(100, "Something new", ingredients=[3, 2, 999])
+    assert categorizer.ingredient_based_heuristic_categorize(food) == DietCategory.OMNI
+    assert categorizer.categorize(food) == DietCategory.OMNI
@@ -0,0 +1,37 @@
+from food_categorizer.category_masks import (
+    INPUT_FOOD_MASK_TO_DIET_CATEGORY,
+    build_token_mask_to_diet_category,
+    mask_of,
+    members_of,
+)
+from food_categorizer.models import DietCategory, TokenCategory
+
+
+def test_masks_are_distinct_bits():
+    for enum_cls in [DietCategory, TokenCategory]:
+        assert mask_of(enum_cls) == (1 << len(enum_cls)) - 1
+        for category in enum_cls:
+            assert members_of(enum_cls, category.mask) == {category}
+
+
+def test_input_food_mask_to_diet_category():
+    assert INPUT_FOOD_MASK_TO_DIET_CATEGORY[0] == DietCategory.UNCATEGORIZED
+    assert INPUT_FOOD_MASK_TO_DIET_CATEGORY[mask_of([DietCategory.VEGAN])] == DietCategory.VEGAN
+    assert (
+        INPUT_FOOD_MASK_TO_DIET_CATEGORY[mask_of([DietCategory.VEGAN, DietCategory.VEGETARIAN])]
+        == DietCategory.VEGETARIAN
+    )
+    assert (
+        INPUT_FOOD_MASK_TO_DIET_CATEGORY[mask_of([DietCategory.VEGAN_OR_OMNI, DietCategory.VEGETARIAN])]
+        == DietCategory.VEGETARIAN_OR_OMNI
+    )
+    assert INPUT_FOOD_MASK_TO_DIET_CATEGORY[mask_of(DietCategory)] == DietCategory.OMNI
+
+
+def test_token_mask_to_diet_category():
+    TOKEN_MASK_TO_DIET_CATEGORY = build_token_mask_to_diet_category()
+    assert TOKEN_MASK_TO_DIET_CATEGORY[mask_of([TokenCategory.BLOCK])] == DietCategory.UNCATEGORIZED
+    assert (
+        TOKEN_MASK_TO_DIET_CATEGORY[mask_of([TokenCategory.SUGGESTS_VEGAN, TokenCategory.SUGGESTS_VEGAN_OR_VEGETARIAN])]
+        == DietCategory.VEGAN_OR_VEGETARIAN
+    )
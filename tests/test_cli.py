@@ -1,3 +1,4 @@
+from pathlib import Path
 from unittest.mock import patch
 
 import pytest
@@ -15,7 +16,7 @@ def test_cli_help_doesnt_crash():
         assert exc_info.value.args[0] == 0
 
 
-@pytest.mark.parametrize("command", ["generate", "input-ref"])
+@pytest.mark.parametrize("command", ["generate", "input-ref", "build-lexicon", "evaluate"])
 def test_cli_dispatch(command):
     """
     Test that dispatching to handler functions works.
@@ -27,3 +28,13 @@ def test_cli_dispatch(command):
             main()
         mock_command_handler.assert_called_once()
         assert exc_info.value.args[0] == 0
+
+
+def test_cli_dispatch_what_if():
+    with patch("sys.argv", ["food-categorizer", "what-if", "diff.json"]), patch(
+        "food_categorizer.main.what_if_main", autospec=True
+    ) as mock_command_handler:
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+        mock_command_handler.assert_called_once_with(diff=Path("diff.json"), output=None)
+        assert exc_info.value.args[0] == 0
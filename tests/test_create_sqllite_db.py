@@ -0,0 +1,329 @@
+import importlib.util
+import io
+import json
+import multiprocessing
+import pickle
+import sqlite3
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+SCRIPT_PATH = Path(__file__).parents[1] / "create_sqllite_db.py"
+
+
+@pytest.fixture(scope="module")
+def create_sqllite_db():
+    spec = importlib.util.spec_from_file_location("create_sqllite_db", SCRIPT_PATH)
+    module = importlib.util.module_from_spec(spec)
+    # row batches are pickled by worker processes, which needs the module to be importable by name
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    yield module
+    del sys.modules[spec.name]
+
+
+def make_item(food_id_key, food_id, description, nutrient_ids=(), ingredient_codes=()):
+    return {
+        food_id_key: food_id,
+        "fdcId": food_id * 10,
+        "description": description,
+        "foodCategory": {"description": "Some category"},
+        "wweiaFoodCategory": {"wweiaFoodCategoryDescription": "Some survey category"},
+        "foodNutrients": [
+            {
+                "amount": 1.5 * nutrient_id,
+                "nutrient": {
+                    "id": nutrient_id,
+                    "name": f"Nutrient {nutrient_id}",
+                    "rank": nutrient_id,
+                    "unitName": "g",
+                },
+            }
+            for nutrient_id in nutrient_ids
+        ],
+        "inputFoods": [{"ingredientCode": code, "amount": 10.0} for code in ingredient_codes]
+        + [{"ingredientDescription": "no code"}],
+    }
+
+
+@pytest.fixture
+def fooddata_dir(tmp_path, monkeypatch, create_sqllite_db):
+    datasets = [
+        (
+            create_sqllite_db.SURVEY_FOOD,
+            [
+                make_item("foodCode", 1, "Pancake", nutrient_ids=[1, 2], ingredient_codes=[2, 3]),
+                make_item("foodCode", 4, "Stack of pancakes", ingredient_codes=[1, 1]),
+            ],
+        ),
+        (
+            create_sqllite_db.SR_LEGACY_FOOD,
+            [
+                make_item("ndbNumber", 2, "Milk, NFS", nutrient_ids=[2, 3]),
+                # already in the survey foods, which take precedence
+                make_item("ndbNumber", 1, "Pancake from another dataset", nutrient_ids=[1]),
+            ],
+        ),
+        (create_sqllite_db.FOUNDATION_FOOD, [make_item("ndbNumber", 3, "Flour, wheat", nutrient_ids=[3])]),
+    ]
+    for food_file, items in datasets:
+        with (tmp_path / food_file.file_path).open("w", encoding="utf-8") as f:
+            json.dump({food_file.list_name: items}, f, indent=1)
+    monkeypatch.delenv("FOODDATA_DIR", raising=False)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def dump_database(database_path):
+    conn = sqlite3.connect(database_path)
+    tables = {
+        table: sorted(conn.execute(f"SELECT * FROM {table}").fetchall(), key=repr)
+        for table in ["Food", "FoodNutrition", "FoodIngredients", "Nutritions"]
+    }
+    conn.close()
+    return tables
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1000])
+def test_json_stream_reader(create_sqllite_db, chunk_size):
+    data = {
+        "before": {"nested": [1, 2.5, "x"]},
+        "Items": [{"a": 1}, [], "string with \"escapes\" and ünïcödé", 12345, -1.5e3, None, True],
+        "after": 123,
+    }
+    reader = create_sqllite_db.JsonStreamReader(io.StringIO(json.dumps(data, indent=2)), chunk_size=chunk_size)
+    assert list(reader.iter_array_in_object("Items")) == data["Items"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7])
+def test_json_stream_reader_with_numbers_split_between_chunks(create_sqllite_db, chunk_size):
+    items = [0.1, 12.5, -2.5e10, 1e-07, 0, -17, [3.25, {"x": 6.0e2}], 100]
+    # without whitespace, numbers end right where the next value begins
+    text = json.dumps({"Items": items}, separators=(",", ":"))
+    reader = create_sqllite_db.JsonStreamReader(io.StringIO(text), chunk_size=chunk_size)
+    assert list(reader.iter_array_in_object("Items")) == items
+
+
+@pytest.mark.parametrize("text", ['{}', '{"Other": [1]}', '{"Items": []}'])
+def test_json_stream_reader_without_items(create_sqllite_db, text):
+    reader = create_sqllite_db.JsonStreamReader(io.StringIO(text), chunk_size=2)
+    assert list(reader.iter_array_in_object("Items")) == []
+
+
+@pytest.mark.parametrize("text", ['{"Items": [1, 2', '{"Items": [1 2]}', '[1, 2]'])
+def test_json_stream_reader_rejects_invalid_json(create_sqllite_db, text):
+    reader = create_sqllite_db.JsonStreamReader(io.StringIO(text), chunk_size=2)
+    with pytest.raises(json.JSONDecodeError):
+        list(reader.iter_array_in_object("Items"))
+
+
+@pytest.mark.parametrize("jobs", [1, 2, 3])
+def test_main(create_sqllite_db, fooddata_dir, jobs):
+    create_sqllite_db.main(jobs=jobs)
+    tables = dump_database(fooddata_dir / create_sqllite_db.DATABASE_PATH)
+    assert tables["Food"] == [
+        (1, 10, "Pancake", "Some survey category", None),
+        (2, 20, "Milk, NFS", "Some category", None),
+        (3, 30, "Flour, wheat", "Some category", None),
+        (4, 40, "Stack of pancakes", "Some survey category", None),
+    ]
+    assert tables["FoodIngredients"] == [(1, 2, 10.0), (1, 3, 10.0), (4, 1, 10.0), (4, 1, 10.0)]
+    assert tables["FoodNutrition"] == [(1, 1, 1.5), (1, 2, 3.0), (2, 2, 3.0), (2, 3, 4.5), (3, 3, 4.5)]
+    assert tables["Nutritions"] == [(1, "Nutrient 1", 1, "g"), (2, "Nutrient 2", 2, "g"), (3, "Nutrient 3", 3, "g")]
+
+
+def test_parallel_import_writes_rows_in_order(create_sqllite_db, fooddata_dir):
+    def dump_rows():
+        conn = sqlite3.connect(fooddata_dir / create_sqllite_db.DATABASE_PATH)
+        rows = [conn.execute(f"SELECT rowid, * FROM {table} ORDER BY rowid").fetchall() for table in ["FoodNutrition"]]
+        conn.close()
+        return rows
+
+    create_sqllite_db.main()
+    expected_rows = dump_rows()
+    create_sqllite_db.main(force=True, jobs=3)
+    assert dump_rows() == expected_rows
+
+
+def test_parallel_import_with_spawn(create_sqllite_db, fooddata_dir, monkeypatch):
+    # the default start method on macOS and Windows, which pickles everything sent to the worker processes
+    monkeypatch.setattr(create_sqllite_db, "multiprocessing", multiprocessing.get_context("spawn"))
+    create_sqllite_db.main(jobs=2)
+    tables = dump_database(fooddata_dir / create_sqllite_db.DATABASE_PATH)
+    assert [row[0] for row in tables["Food"]] == [1, 2, 3, 4]
+
+
+def test_food_data_files_can_be_pickled(create_sqllite_db):
+    for food_file in create_sqllite_db.FOOD_DATA_FILES:
+        assert pickle.loads(pickle.dumps(food_file)) == food_file
+
+
+def test_parallel_import_fails_if_a_file_is_invalid(create_sqllite_db, fooddata_dir):
+    (fooddata_dir / create_sqllite_db.SR_LEGACY_FOOD.file_path).write_text('{"SRLegacyFoods": [{', encoding="utf-8")
+    with pytest.raises(RuntimeError, match="sr_legacy"):
+        create_sqllite_db.main(jobs=3)
+
+
+def test_drop_foods(create_sqllite_db):
+    batch = create_sqllite_db.RowBatch(
+        foods=[(1, 10, "a", "c"), (2, 20, "b", "c")],
+        food_nutritions=[(1, 7, 1.0), (1, 8, 2.0), (2, 8, 3.0)],
+        food_ingredients=[(1, 2, 5.0), (2, 3, 5.0)],
+        nutritions={7: (7, "N7", 7, "g"), 8: (8, "N8", 8, "g")},
+        import_states=[(1, 10, b"1"), (2, 20, b"2")],
+    )
+    assert create_sqllite_db.drop_foods(batch, {3}) is batch
+    assert create_sqllite_db.drop_foods(batch, {1}) == (
+        [(2, 20, "b", "c")],
+        [(2, 8, 3.0)],
+        [(2, 3, 5.0)],
+        {8: (8, "N8", 8, "g")},
+        [(2, 20, b"2")],
+    )
+
+
+def zip_food_data_files(create_sqllite_db, fooddata_dir, archive_dir):
+    archive_dir.mkdir(exist_ok=True)
+    for food_file in create_sqllite_db.FOOD_DATA_FILES:
+        json_path = fooddata_dir / food_file.file_path
+        with zipfile.ZipFile(archive_dir / food_file.zip_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            # some archives keep the JSON file in a folder
+            archive.write(json_path, f"some folder/{food_file.file_path}")
+        json_path.unlink()
+
+
+def test_main_from_archives(create_sqllite_db, fooddata_dir, monkeypatch):
+    create_sqllite_db.main()
+    expected_tables = dump_database(fooddata_dir / create_sqllite_db.DATABASE_PATH)
+    (fooddata_dir / create_sqllite_db.DATABASE_PATH).unlink()
+
+    zip_food_data_files(create_sqllite_db, fooddata_dir, fooddata_dir / "fooddata")
+    monkeypatch.setenv("FOODDATA_DIR", "fooddata")
+    create_sqllite_db.main()
+    assert dump_database(fooddata_dir / create_sqllite_db.DATABASE_PATH) == expected_tables
+
+
+def test_main_skips_unchanged_files(create_sqllite_db, fooddata_dir, capsys):
+    create_sqllite_db.main()
+    database_path = fooddata_dir / create_sqllite_db.DATABASE_PATH
+    conn = sqlite3.connect(database_path)
+    conn.execute("UPDATE Food SET diet_category = 'vegan'")
+    conn.commit()
+    conn.close()
+    capsys.readouterr()
+
+    create_sqllite_db.main()
+    assert "up to date" in capsys.readouterr().out
+    assert {row[4] for row in dump_database(database_path)["Food"]} == {"vegan"}
+
+    create_sqllite_db.main(force=True)
+    assert {row[4] for row in dump_database(database_path)["Food"]} == {None}
+
+
+def test_main_rebuilds_changed_files_only_with_force(create_sqllite_db, fooddata_dir, capsys):
+    create_sqllite_db.main()
+    foundation_path = fooddata_dir / create_sqllite_db.FOUNDATION_FOOD.file_path
+    items = [make_item("ndbNumber", 5, "Sugar", nutrient_ids=[3])]
+    foundation_path.write_text(json.dumps({create_sqllite_db.FOUNDATION_FOOD.list_name: items}), encoding="utf-8")
+    database_path = fooddata_dir / create_sqllite_db.DATABASE_PATH
+    capsys.readouterr()
+
+    with pytest.raises(SystemExit):
+        create_sqllite_db.main()
+    assert "FoundationFoods differ" in capsys.readouterr().out
+    assert [row[0] for row in dump_database(database_path)["Food"]] == [1, 2, 3, 4]
+
+    create_sqllite_db.main(force=True)
+    assert [row[0] for row in dump_database(database_path)["Food"]] == [1, 2, 4, 5]
+
+
+def test_checksum_mismatch(create_sqllite_db, fooddata_dir):
+    food_file = create_sqllite_db.FoodDataFile(
+        file_path=create_sqllite_db.FOUNDATION_FOOD.file_path,
+        list_name=create_sqllite_db.FOUNDATION_FOOD.list_name,
+        food_id_key="ndbNumber",
+        description_lambda=lambda item: item["description"],
+        sha256="0" * 64,
+    )
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        food_file.checksum()
+
+
+def write_food_data_file(fooddata_dir, food_file, items):
+    (fooddata_dir / food_file.file_path).write_text(json.dumps({food_file.list_name: items}), encoding="utf-8")
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_main_upsert(create_sqllite_db, fooddata_dir, jobs):
+    database_path = fooddata_dir / create_sqllite_db.DATABASE_PATH
+    create_sqllite_db.main()
+    conn = sqlite3.connect(database_path)
+    conn.execute("UPDATE Food SET diet_category = 'vegan'")
+    conn.commit()
+    conn.close()
+
+    write_food_data_file(
+        fooddata_dir,
+        create_sqllite_db.SR_LEGACY_FOOD,
+        [
+            make_item("ndbNumber", 2, "Milk, whole", nutrient_ids=[2, 4]),
+            make_item("ndbNumber", 1, "Pancake from another dataset", nutrient_ids=[1]),
+            make_item("ndbNumber", 5, "Sugar", ingredient_codes=[2]),
+        ],
+    )
+    # the flour the pancake is made of is gone
+    write_food_data_file(fooddata_dir, create_sqllite_db.FOUNDATION_FOOD, [])
+    create_sqllite_db.main(force=True, upsert=True, jobs=jobs)
+    tables = dump_database(database_path)
+    conn = sqlite3.connect(database_path)
+    changed_food_ids = [row[0] for row in conn.execute("SELECT food_id FROM ChangedFoods ORDER BY food_id")]
+    conn.close()
+
+    assert tables["Food"] == [
+        (1, 10, "Pancake", "Some survey category", "vegan"),
+        (2, 20, "Milk, whole", "Some category", None),
+        (4, 40, "Stack of pancakes", "Some survey category", "vegan"),
+        (5, 50, "Sugar", "Some category", None),
+    ]
+    assert changed_food_ids == [1, 2, 5]
+
+    # apart from the diet categories, the same as building it from scratch
+    database_path.rename(fooddata_dir / "upserted.db")
+    create_sqllite_db.main()
+    expected_tables = dump_database(database_path)
+    tables["Food"] = [row[:4] + (None,) for row in tables["Food"]]
+    assert tables == expected_tables
+
+
+def test_main_upsert_updates_changed_nutritions(create_sqllite_db, fooddata_dir):
+    database_path = fooddata_dir / create_sqllite_db.DATABASE_PATH
+    create_sqllite_db.main()
+
+    # only the unit changes, the foods' own rows stay the same
+    milk = make_item("ndbNumber", 2, "Milk, NFS", nutrient_ids=[2, 3])
+    for food_nutrient in milk["foodNutrients"]:
+        food_nutrient["nutrient"]["unitName"] = "mg"
+    write_food_data_file(
+        fooddata_dir,
+        create_sqllite_db.SR_LEGACY_FOOD,
+        [milk, make_item("ndbNumber", 1, "Pancake from another dataset", nutrient_ids=[1])],
+    )
+    create_sqllite_db.main(force=True, upsert=True)
+    tables = dump_database(database_path)
+
+    # nutrient 2 is first seen in the survey foods, which didn't change
+    assert tables["Nutritions"] == [
+        (1, "Nutrient 1", 1, "g"),
+        (2, "Nutrient 2", 2, "g"),
+        (3, "Nutrient 3", 3, "mg"),
+    ]
+    database_path.rename(fooddata_dir / "upserted.db")
+    create_sqllite_db.main()
+    assert tables == dump_database(database_path)
+
+
+def test_main_upsert_without_database(create_sqllite_db, fooddata_dir):
+    create_sqllite_db.main(upsert=True)
+    assert len(dump_database(fooddata_dir / create_sqllite_db.DATABASE_PATH)["Food"]) == 4
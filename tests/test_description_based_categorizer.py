@@ -0,0 +1,47 @@
+import pytest
+
+from food_categorizer.description_based_categorizer import (
+    all_tokens,
+    description_based_heuristic_categorize,
+    description_based_heuristic_categorize_many,
+    description_cache_info,
+    get_compiled_lexicon,
+    token_masks,
+)
+from food_categorizer.models import DietCategory
+from food_categorizer.utils import MaxiMunchTokenFinder
+
+
+@pytest.mark.parametrize(
+    "description,expected",
+    [
+        ("Apple, raw", DietCategory.VEGAN),
+        ("Milk, NFS", DietCategory.VEGETARIAN),
+        ("Chicken, raw", DietCategory.OMNI),
+        ("Meatless chicken nuggets", DietCategory.VEGAN_OR_VEGETARIAN),
+        ("Vegan cheese", DietCategory.VEGAN),
+        ("Fat free something", DietCategory.UNCATEGORIZED),
+        ("", DietCategory.UNCATEGORIZED),
+    ],
+)
+def test_description_based_heuristic_categorize(description, expected):
+    assert description_based_heuristic_categorize(description) == expected
+    regex_finder = MaxiMunchTokenFinder(all_tokens, token_masks)
+    assert description_based_heuristic_categorize(description, token_finder=regex_finder) == expected
+
+
+def test_description_based_heuristic_categorize_many():
+    descriptions = ["Apple, raw", "apple, raw ", "Chicken, raw", "APPLE, RAW", "Milk, NFS"]
+    get_compiled_lexicon().categorize_cached.cache_clear()
+    assert description_based_heuristic_categorize_many(descriptions) == [
+        DietCategory.VEGAN,
+        DietCategory.VEGAN,
+        DietCategory.OMNI,
+        DietCategory.VEGAN,
+        DietCategory.VEGETARIAN,
+    ]
+    cache_info = description_cache_info()
+    assert cache_info.misses == 3
+    assert cache_info.hits == 0
+    description_based_heuristic_categorize("  apple, RAW")
+    assert description_cache_info().hits == 1
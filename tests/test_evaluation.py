@@ -0,0 +1,98 @@
+import json
+from contextlib import nullcontext
+from unittest.mock import patch
+
+from food_categorizer.app.evaluate import main
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.evaluation import Mismatch, evaluate_reference_samples
+from food_categorizer.models import DietCategory, ReferenceSample
+
+from .conftest import make_food, make_food_store
+
+
+def make_reference_sample(food, expected_diet_category) -> ReferenceSample:
+    return ReferenceSample(
+        food_id=food.food_id,
+        expected_diet_category=expected_diet_category,
+        category=food.category,
+        description=food.description,
+    )
+
+
+def test_evaluate_reference_samples(food_store, ref_store):
+    ref_store.append_reference_samples(
+        [
+            make_reference_sample(food_store[1], DietCategory.VEGETARIAN),
+            make_reference_sample(food_store[3], DietCategory.OMNI),
+            # the milk in it counts as vegetarian, so this one is wrong
+            make_reference_sample(food_store[4], DietCategory.VEGAN),
+            ReferenceSample(food_id=999, expected_diet_category=DietCategory.VEGAN, category="", description=""),
+        ]
+    )
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    evaluation = evaluate_reference_samples(categorizer)
+
+    assert evaluation.n_samples == 3
+    assert evaluation.n_correct == 2
+    assert evaluation.accuracy == 2 / 3
+    assert evaluation.missing_food_ids == [999]
+    assert evaluation.mismatches == [
+        Mismatch(
+            food_id=4,
+            fdc_id=40,
+            description="Pancake",
+            expected_diet_category=DietCategory.VEGAN,
+            predicted_diet_category=DietCategory.VEGETARIAN,
+        )
+    ]
+    assert evaluation.confusion_matrix[DietCategory.VEGAN][DietCategory.VEGETARIAN] == 1
+    assert evaluation.confusion_matrix[DietCategory.OMNI][DietCategory.OMNI] == 1
+    assert sum(n for row in evaluation.confusion_matrix.values() for n in row.values()) == 3
+    assert set(evaluation.timings) == {"categorize_ingredients", "categorize_samples"}
+
+
+def test_evaluate_main(food_store, ref_store, tmp_path, capsys):
+    ref_store.append_reference_sample(make_reference_sample(food_store[3], DietCategory.OMNI))
+    output_path = tmp_path / "evaluation.json"
+    with patch("food_categorizer.app.evaluate.load_food_data", return_value=food_store), patch(
+        "food_categorizer.app.evaluate.open_reference_samples", side_effect=lambda path: nullcontext(ref_store)
+    ):
+        main()
+        evaluation = json.loads(capsys.readouterr().out)
+        main(output=output_path)
+    written_evaluation = json.loads(output_path.read_text())
+    assert {**written_evaluation, "timings": None} == {**evaluation, "timings": None}
+    assert evaluation["accuracy"] == 1.0
+    assert evaluation["confusion_matrix"]["OMNI"]["OMNI"] == 1
+    assert list(evaluation["timings"]) == [
+        "load_foods",
+        "load_reference_samples",
+        "categorize_ingredients",
+        "categorize_samples",
+    ]
+
+
+def test_evaluate_reference_samples_with_self_loop(ref_store):
+    food_store = make_food_store([make_food(1, "Chicken, raw"), make_food(2, "Stew", ingredients=[1, 2])])
+    ref_store.append_reference_sample(make_reference_sample(food_store[2], DietCategory.VEGAN))
+    evaluation = evaluate_reference_samples(Categorizer(ref_store=ref_store, food_store=food_store))
+    assert evaluation.n_samples == 1
+    assert evaluation.n_correct == 0
+    assert evaluation.mismatches[0].predicted_diet_category == DietCategory.OMNI
+
+
+def test_evaluate_reference_samples_in_cycle(ref_store):
+    food_store = make_food_store(
+        [
+            make_food(1, "Apple"),
+            make_food(2, "Sauce A", ingredients=[1, 3]),
+            make_food(3, "Sauce B", ingredients=[2]),
+        ]
+    )
+    # as the label of sauce A would otherwise make sauce B omni and sauce B would make sauce A omni in turn
+    ref_store.append_reference_sample(make_reference_sample(food_store[2], DietCategory.OMNI))
+    categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    assert categorizer.categorize_all()[3] == DietCategory.OMNI
+    evaluation = evaluate_reference_samples(categorizer)
+    assert evaluation.n_correct == 0
+    assert evaluation.mismatches[0].predicted_diet_category == DietCategory.VEGAN
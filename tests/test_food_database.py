@@ -0,0 +1,137 @@
+import sqlite3
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from food_categorizer.food_database import (
+    count_foods_by_diet_category,
+    iter_food_chunks,
+    iter_foods,
+    iter_foods_in_diet_category,
+    load_food_data,
+    read_changed_food_ids,
+    snapshot_path,
+    update_diet_category,
+)
+from food_categorizer.models import DietCategory
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = tmp_path / "food_data.db"
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE Food (
+            food_id INTEGER PRIMARY KEY, fdc_id INTEGER, description TEXT, category TEXT, diet_category TEXT
+        );
+        CREATE TABLE FoodIngredients (food_id INTEGER, ingredient_id INTEGER, amount REAL);
+        INSERT INTO Food VALUES (3, 30, 'Chicken, raw', 'Poultry', 'OMNI');
+        INSERT INTO Food VALUES (1, 10, 'Milk, NFS', 'Milk', NULL);
+        INSERT INTO Food VALUES (2, 20, 'Pancake', 'Baked goods', 'VEGAN');
+        INSERT INTO FoodIngredients VALUES (2, 1, 50.0);
+        INSERT INTO FoodIngredients VALUES (9, 1, 1.0);
+        INSERT INTO FoodIngredients VALUES (2, 999, NULL);
+        ''')
+    conn.commit()
+    conn.close()
+    return path
+
+
+def read_diet_categories(database_path):
+    with sqlite3.connect(database_path) as conn:
+        return dict(conn.execute('SELECT food_id, diet_category FROM Food'))
+
+
+def test_load_food_data(database_path):
+    food_store = load_food_data(database_path)
+    assert list(food_store) == [1, 2, 3]
+    assert food_store[1].diet_category is None
+    assert food_store[2].ingredients == [1, 999]
+    assert food_store[3].diet_category == DietCategory.OMNI
+
+
+def test_update_diet_category_writes_changed_rows_only(database_path):
+    food_store = load_food_data(database_path)
+    food_store[1].diet_category = DietCategory.VEGETARIAN
+    food_store[2].diet_category = DietCategory.VEGETARIAN
+    food_store[3].diet_category = DietCategory.OMNI
+    assert update_diet_category(database_path, food_store) == 2
+    assert read_diet_categories(database_path) == {1: 'VEGETARIAN', 2: 'VEGETARIAN', 3: 'OMNI'}
+    assert update_diet_category(database_path, food_store) == 0
+
+
+def test_update_diet_category_leaves_rollback_journal_mode(database_path):
+    food_store = load_food_data(database_path)
+    food_store[1].diet_category = DietCategory.VEGETARIAN
+    update_diet_category(database_path, food_store)
+    conn = sqlite3.connect(f'file:{database_path}?mode=ro', uri=True)
+    assert conn.execute('PRAGMA journal_mode').fetchone() == ('delete',)
+    conn.close()
+    assert not Path(f'{database_path}-wal').exists()
+
+
+def test_update_diet_category_clears_changed_foods(database_path):
+    assert read_changed_food_ids(database_path) == set()
+    with sqlite3.connect(database_path) as conn:
+        conn.execute('CREATE TABLE ChangedFoods (food_id INTEGER PRIMARY KEY)')
+        conn.executemany('INSERT INTO ChangedFoods VALUES (?)', [(1,), (2,)])
+    conn.close()
+    changed_food_ids = read_changed_food_ids(database_path)
+    assert changed_food_ids == {1, 2}
+
+    food_store = load_food_data(database_path)
+    food_store[1].diet_category = DietCategory.VEGAN
+    with sqlite3.connect(database_path) as conn:
+        # changed again in the meantime
+        conn.execute('INSERT INTO ChangedFoods VALUES (3)')
+    conn.close()
+    assert update_diet_category(database_path, food_store, changed_food_ids) == 1
+    assert read_changed_food_ids(database_path) == {3}
+
+
+def test_iter_food_chunks(database_path):
+    chunks = list(iter_food_chunks(database_path, chunk_size=2))
+    assert [[food.food_id for food in chunk] for chunk in chunks] == [[1, 2], [3]]
+    assert [food.ingredients for food in iter_foods(database_path, chunk_size=1)] == [[], [1, 999], []]
+    assert [food.as_food() for food in load_food_data(database_path).values()] == list(iter_foods(database_path))
+
+
+def test_foods_by_diet_category(database_path):
+    assert count_foods_by_diet_category(database_path) == {None: 1, DietCategory.OMNI: 1, DietCategory.VEGAN: 1}
+    assert list(iter_foods_in_diet_category(database_path, DietCategory.VEGAN)) == [(20, 'Pancake')]
+    assert list(iter_foods_in_diet_category(database_path, DietCategory.VEGETARIAN)) == []
+
+
+def test_load_food_data_without_fdc_id(database_path):
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("INSERT INTO Food VALUES (4, NULL, 'Homemade soup', 'Soups', NULL)")
+    conn.close()
+    food_store = load_food_data(database_path)
+    assert food_store[4].fdc_id is None
+    assert food_store[3].fdc_id == 30
+    # also when loaded from the snapshot
+    assert load_food_data(database_path)[4].fdc_id is None
+
+
+def test_load_food_data_uses_snapshot(database_path):
+    assert not snapshot_path(database_path).exists()
+    food_store = load_food_data(database_path)
+    assert snapshot_path(database_path).exists()
+    with patch("sqlite3.connect") as connect:
+        assert [food.as_food() for food in load_food_data(database_path).values()] == [
+            food.as_food() for food in food_store.values()
+        ]
+    connect.assert_not_called()
+
+
+def test_snapshot_is_invalidated_by_changes(database_path):
+    food_store = load_food_data(database_path)
+    food_store[1].diet_category = DietCategory.VEGETARIAN
+    update_diet_category(database_path, food_store)
+    assert load_food_data(database_path)[1].diet_category == DietCategory.VEGETARIAN
+
+    with sqlite3.connect(database_path) as conn:
+        conn.execute("UPDATE Food SET description = 'Whole milk, not skimmed in any way' WHERE food_id = 1")
+    conn.close()
+    assert load_food_data(database_path)[1].description == 'Whole milk, not skimmed in any way'
@@ -0,0 +1,112 @@
+import math
+import pickle
+
+import pytest
+
+from food_categorizer.food_store import FoodStore
+from food_categorizer.models import DietCategory, Food
+
+from .conftest import make_food, make_food_store
+
+
+@pytest.fixture
+def foods():
+    return [
+        make_food(3, "Chicken, raw"),
+        make_food(1, "Milk, NFS"),
+        make_food(4, "Pancake", ingredients=[1, 2]),
+        make_food(2, "Flour, wheat"),
+    ]
+
+
+def test_behaves_like_dict(foods):
+    store = make_food_store(foods)
+    by_id = make_food_store(foods, columnar=False)
+    assert len(store) == 4
+    assert list(store) == [1, 2, 3, 4]
+    assert 2 in store and 5 not in store
+    assert store.get(5) is None
+    with pytest.raises(KeyError):
+        store[5]
+    for food_id, view in store.items():
+        assert view.as_food() == by_id[food_id]
+    assert [view.description for view in store.values()] == ["Milk, NFS", "Flour, wheat", "Chicken, raw", "Pancake"]
+    assert store[4].ingredients == [1, 2]
+
+
+def test_categories_are_interned(foods):
+    store = make_food_store(foods)
+    assert store.categories == ["Somesuch and other miscellany"]
+    assert list(store.category_codes) == [0, 0, 0, 0]
+
+
+def test_diet_category_is_written_through(foods):
+    store = make_food_store(foods)
+    assert store[3].diet_category is None
+    store[3].diet_category = DietCategory.OMNI
+    assert store[3].diet_category == DietCategory.OMNI
+    store[3].diet_category = None
+    assert store[3].diet_category is None
+
+
+def test_views_pickle_as_foods(foods):
+    store = make_food_store(foods)
+    store[4].diet_category = DietCategory.VEGETARIAN
+    food = pickle.loads(pickle.dumps(store[4]))
+    assert type(food) is Food
+    assert food == store[4].as_food()
+    assert food.diet_category == DietCategory.VEGETARIAN
+
+
+def test_foods_must_be_appended_in_order(foods):
+    store = make_food_store(foods)
+    with pytest.raises(ValueError):
+        store.append(2, 20, "Flour, wheat", None, None, [])
+
+
+def test_from_records_merges_ingredients():
+    food_records = [
+        (1, 10, "Milk, NFS", "Milk", "VEGETARIAN"),
+        (2, 20, "Flour, wheat", "Flour", None),
+        (4, 40, "Pancake", "Baked goods", None),
+    ]
+    ingredient_records = [
+        (0, 1, 5.0),
+        (2, 1, None),
+        (3, 1, 1.0),
+        (4, 1, 100.0),
+        (4, 2, 50.0),
+        (4, 999, None),
+        (5, 4, 1.0),
+    ]
+    store = FoodStore.from_records(iter(food_records), iter(ingredient_records))
+    assert [store[food_id].ingredients for food_id in store] == [[], [1], [1, 2, 999]]
+    assert store[1].diet_category == DietCategory.VEGETARIAN
+    assert store.categories == ["Milk", "Flour", "Baked goods"]
+    amounts = list(store.ingredients_with_amounts(4))
+    assert amounts[:2] == [(1, 100.0), (2, 50.0)]
+    assert amounts[2][0] == 999 and math.isnan(amounts[2][1])
+
+
+def test_snapshot_round_trip(foods, tmp_path):
+    store = make_food_store(foods)
+    store[1].diet_category = DietCategory.VEGETARIAN
+    store.mark_diet_categories_saved()
+    # not saved yet, so not part of the snapshot
+    store[2].diet_category = DietCategory.VEGAN
+    path = tmp_path / "store.snapshot"
+    store.write_snapshot(path, {"size": 1})
+
+    loaded = FoodStore.read_snapshot(path, {"size": 1})
+    assert [food.as_food() for food in loaded.values()][2:] == [food.as_food() for food in store.values()][2:]
+    assert loaded[1].diet_category == DietCategory.VEGETARIAN
+    assert loaded[2].diet_category is None
+    assert list(loaded.changed_diet_categories()) == []
+    assert loaded.categories == store.categories
+
+    assert FoodStore.read_snapshot(path, {"size": 2}) is None
+    assert FoodStore.read_snapshot(tmp_path / "missing.snapshot", {"size": 1}) is None
+    path.write_bytes(path.read_bytes()[:-10])
+    assert FoodStore.read_snapshot(path, {"size": 1}) is None
+    path.write_bytes(b"")
+    assert FoodStore.read_snapshot(path, {"size": 1}) is None
@@ -0,0 +1,29 @@
+from food_categorizer.ingredient_graph import IngredientGraph
+
+
+def test_edges(food_store):
+    graph = IngredientGraph(food_store)
+    assert len(graph) == 7
+    assert 7 in graph and 999 not in graph
+    assert graph.ingredients(6) == [4, 4, 1]
+    # dangling ingredients are left out
+    assert graph.ingredients(7) == []
+
+
+def test_dependents(food_store):
+    graph = IngredientGraph(food_store)
+    assert graph.dependents([1]) == {1, 4, 5, 6}
+    assert graph.dependents([3, 999]) == {3, 5}
+    assert graph.dependents([]) == set()
+
+
+def test_connected_components(food_store):
+    graph = IngredientGraph(food_store)
+    assert sorted(sorted(component) for component in graph.connected_components()) == [[1, 2, 3, 4, 5, 6], [7]]
+
+
+def test_strongly_connected_components(food_store):
+    graph = IngredientGraph(food_store)
+    assert graph.strongly_connected_components([5]) == [[1], [2], [4], [3], [5]]
+    assert graph.strongly_connected_components([5], skip_ids={4}) == [[3], [5]]
+    assert graph.find_cycles() == []
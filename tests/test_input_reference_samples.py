@@ -0,0 +1,34 @@
+from food_categorizer.app.input_reference_samples import print_ingredients
+
+from .conftest import make_food, make_food_store
+
+
+def test_print_ingredients(foods, capsys):
+    food_store = make_food_store(foods)
+    print_ingredients(food_store, food_store[6])
+    assert capsys.readouterr().out.splitlines() == [
+        "  Pancake (FDC ID: 40)",
+        "    Milk, NFS (FDC ID: 10)",
+        "    Flour, wheat (FDC ID: 20)",
+        "  Pancake (FDC ID: 40)",
+        "    Milk, NFS (FDC ID: 10)",
+        "    Flour, wheat (FDC ID: 20)",
+        "  Milk, NFS (FDC ID: 10)",
+    ]
+
+
+def test_print_ingredients_with_cycle(capsys):
+    food_store = make_food_store(
+        [
+            make_food(1, "Sauce A", ingredients=[2]),
+            make_food(2, "Sauce B", ingredients=[1, 2, 3]),
+            make_food(3, "Salt"),
+        ]
+    )
+    print_ingredients(food_store, food_store[1])
+    assert capsys.readouterr().out.splitlines() == [
+        "  Sauce B (FDC ID: 20)",
+        "    Sauce A (FDC ID: 10) [ingredient cycle]",
+        "    Sauce B (FDC ID: 20) [ingredient cycle]",
+        "    Salt (FDC ID: 30)",
+    ]
@@ -0,0 +1,166 @@
+import json
+import os
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from food_categorizer import lexicon
+from food_categorizer.description_based_categorizer import (
+    categories_to_tokens,
+    description_based_heuristic_categorize,
+    get_compiled_lexicon,
+    nullification_mappings,
+    set_compiled_lexicon,
+    use_lexicon_file,
+)
+from food_categorizer.lexicon import (
+    CompiledLexicon,
+    LexiconDiff,
+    compile_lexicon,
+    get_categories_to_tokens,
+    get_token_masks,
+    load_lexicon_diff_file,
+    load_lexicon_file,
+    load_or_compile_lexicon,
+    save_lexicon_file,
+)
+from food_categorizer.models import DietCategory, TokenCategory
+
+
+def assert_same_lexicon(a: CompiledLexicon, b: CompiledLexicon):
+    assert a.lexicon_hash == b.lexicon_hash
+    assert a.token_masks == b.token_masks
+    assert a.mask_to_diet_category == b.mask_to_diet_category
+    assert type(a.token_finder) is type(b.token_finder)
+
+
+def test_load_or_compile_lexicon(tmp_path: Path):
+    compiled = load_or_compile_lexicon(categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    assert len(list(tmp_path.glob("lexicon-*.pickle"))) == 1
+
+    with patch.object(lexicon, "compile_lexicon", wraps=compile_lexicon) as mock_compile:
+        loaded = load_or_compile_lexicon(categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    mock_compile.assert_not_called()
+    assert_same_lexicon(loaded, compiled)
+    assert loaded.categorize("chicken, raw") == DietCategory.OMNI
+
+
+def test_load_or_compile_lexicon_rebuilds_stale_artifact(tmp_path: Path):
+    load_or_compile_lexicon(categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    changed_categories_to_tokens = {
+        **categories_to_tokens,
+        TokenCategory.SUGGESTS_OMNI: categories_to_tokens[TokenCategory.SUGGESTS_OMNI] | {"xyzzy"},
+    }
+    changed = load_or_compile_lexicon(changed_categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    assert changed.categorize("xyzzy") == DietCategory.OMNI
+    assert len(list(tmp_path.glob("lexicon-*.pickle"))) == 2
+
+
+def test_load_or_compile_lexicon_ignores_corrupt_artifact(tmp_path: Path):
+    compiled = load_or_compile_lexicon(categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    (artifact_path,) = tmp_path.glob("lexicon-*.pickle")
+    artifact_path.write_bytes(b"garbage")
+    loaded = load_or_compile_lexicon(categories_to_tokens, nullification_mappings, artifact_dir=tmp_path)
+    assert_same_lexicon(loaded, compiled)
+
+
+def test_load_lexicon_file(tmp_path: Path):
+    json_path = tmp_path / "lexicon.json"
+    save_lexicon_file(categories_to_tokens, json_path)
+    assert load_lexicon_file(json_path) == categories_to_tokens
+
+    toml_path = tmp_path / "lexicon.toml"
+    toml_path.write_text('SUGGESTS_VEGAN = ["Apple", "pear"]\nSUGGESTS_OMNI = ["beef"]\n')
+    assert load_lexicon_file(toml_path) == {
+        TokenCategory.SUGGESTS_VEGAN: {"apple", "pear"},
+        TokenCategory.SUGGESTS_OMNI: {"beef"},
+    }
+
+    toml_path.write_text('SUGGESTS_NOTHING = ["apple"]\n')
+    with pytest.raises(ValueError):
+        load_lexicon_file(toml_path)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"SUGGESTS_VEGAN": ["apple "]},
+        {"SUGGESTS_VEGAN": [""]},
+        {"SUGGESTS_VEGAN": "apple"},
+        {"SUGGESTS_VEGAN": ["apple", 1]},
+        ["apple"],
+    ],
+    ids=["whitespace", "empty", "not-a-list", "not-a-string", "not-an-object"],
+)
+def test_load_lexicon_file_rejects_invalid_lexicon(tmp_path: Path, data):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps(data))
+    with pytest.raises(ValueError):
+        load_lexicon_file(path)
+
+
+def test_compile_lexicon_rejects_tokens_with_whitespace():
+    with pytest.raises(ValueError):
+        compile_lexicon({TokenCategory.SUGGESTS_VEGAN: {" apple"}}, nullification_mappings)
+
+
+def test_use_lexicon_file_with_hot_reload(tmp_path: Path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"SUGGESTS_VEGAN": ["xyzzy"]}))
+    previous_lexicon = get_compiled_lexicon()
+    with patch.dict(os.environ, {"FOOD_CATEGORIZER_CACHE_DIR": str(tmp_path / "cache")}):
+        watcher = use_lexicon_file(path, watch=True, interval=0.01)
+        try:
+            assert description_based_heuristic_categorize("Xyzzy") == DietCategory.VEGAN
+            lexicon_before_reload = get_compiled_lexicon()
+
+            # a partially written file is ignored, as are invalid ones
+            path.write_text('{"SUGGESTS_OMNI": ["xyz')
+            time.sleep(0.1)
+            assert get_compiled_lexicon() is lexicon_before_reload
+            path.write_text(json.dumps({"SUGGESTS_OMNI": ["xyzzy "]}))
+            time.sleep(0.1)
+            assert get_compiled_lexicon() is lexicon_before_reload
+            assert watcher.is_alive()
+
+            path.write_text(json.dumps({"SUGGESTS_OMNI": ["xyzzy"]}))
+            for _ in range(200):
+                if get_compiled_lexicon() is not lexicon_before_reload:
+                    break
+                time.sleep(0.01)
+            assert description_based_heuristic_categorize("Xyzzy") == DietCategory.OMNI
+            # the replaced lexicon still works for anyone who was using it
+            assert lexicon_before_reload.categorize("xyzzy") == DietCategory.VEGAN
+        finally:
+            watcher.stop()
+            set_compiled_lexicon(previous_lexicon)
+
+
+def test_load_lexicon_diff_file(tmp_path: Path):
+    path = tmp_path / "diff.toml"
+    path.write_text(
+        '[add]\nSUGGESTS_OMNI = ["Xyzzy"]\n\n[remove]\nSUGGESTS_OMNI = ["chicken"]\nBLOCK = ["not a token"]\n'
+    )
+    lexicon_diff = load_lexicon_diff_file(path)
+    assert lexicon_diff == LexiconDiff(
+        added={TokenCategory.SUGGESTS_OMNI: {"xyzzy"}},
+        removed={TokenCategory.SUGGESTS_OMNI: {"chicken"}, TokenCategory.BLOCK: {"not a token"}},
+    )
+    changed_categories_to_tokens = lexicon_diff.apply(categories_to_tokens)
+    assert changed_categories_to_tokens[TokenCategory.SUGGESTS_OMNI] == (
+        categories_to_tokens[TokenCategory.SUGGESTS_OMNI] - {"chicken"} | {"xyzzy"}
+    )
+    assert changed_categories_to_tokens[TokenCategory.BLOCK] == categories_to_tokens[TokenCategory.BLOCK]
+    assert "chicken" in categories_to_tokens[TokenCategory.SUGGESTS_OMNI]
+    assert get_categories_to_tokens(get_token_masks(changed_categories_to_tokens)) == {
+        token_category: tokens for token_category, tokens in changed_categories_to_tokens.items() if tokens
+    }
+
+
+def test_load_lexicon_diff_file_rejects_unknown_keys(tmp_path: Path):
+    path = tmp_path / "diff.json"
+    path.write_text(json.dumps({"add": {}, "replace": {}}))
+    with pytest.raises(ValueError, match="replace"):
+        load_lexicon_diff_file(path)
@@ -0,0 +1,107 @@
+from unittest.mock import patch
+
+import pytest
+
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.description_based_categorizer import (
+    categories_to_tokens,
+    nullification_mappings,
+)
+from food_categorizer.lexicon import LexiconDiff, compile_lexicon
+from food_categorizer.lexicon_impact import (
+    TokenIndex,
+    find_lexicon_impact,
+    load_or_build_token_index,
+)
+from food_categorizer.models import DietCategory, TokenCategory
+
+from .conftest import make_food_store
+
+
+@pytest.mark.parametrize(
+    "lexicon_diff",
+    [
+        LexiconDiff(added={TokenCategory.SUGGESTS_OMNI: {"mystery"}}, removed={}),
+        LexiconDiff(added={}, removed={token_category: {"milk"} for token_category in TokenCategory}),
+        # found instead of "chicken", which is shorter
+        LexiconDiff(added={TokenCategory.SUGGESTS_VEGAN: {"chicken, raw"}}, removed={}),
+    ],
+    ids=["add", "remove", "add-overlapping"],
+)
+def test_find_lexicon_impact(foods, ref_store, lexicon_diff):
+    food_store = make_food_store(foods)
+    lexicon = compile_lexicon(categories_to_tokens, nullification_mappings)
+    changed_lexicon = compile_lexicon(lexicon_diff.apply(categories_to_tokens), nullification_mappings)
+    for food_id, category in Categorizer(ref_store, food_store, lexicon=lexicon).categorize_all().items():
+        food_store[food_id].diet_category = category
+    expected_changes = {
+        food_id: category
+        for food_id, category in Categorizer(ref_store, food_store, lexicon=changed_lexicon).categorize_all().items()
+        if category != food_store[food_id].diet_category
+    }
+    assert expected_changes
+
+    token_index = TokenIndex.build(food_store, lexicon)
+    categorizer = Categorizer(
+        ref_store, food_store, lexicon=changed_lexicon, ingredient_graph=token_index.ingredient_graph
+    )
+    impact = find_lexicon_impact(categorizer, token_index, lexicon)
+
+    assert {change.food_id: change.changed_diet_category for change in impact.changes} == expected_changes
+    assert all(change.diet_category == food_store[change.food_id].diet_category for change in impact.changes)
+    # only foods that might be affected are looked at
+    assert impact.n_recategorized_foods < len(food_store)
+    assert set(impact.timings) == {"find_candidates", "recategorize"}
+
+
+def test_find_lexicon_impact_reports_nothing_for_unrelated_tokens(foods, ref_store):
+    food_store = make_food_store(foods)
+    lexicon = compile_lexicon(categories_to_tokens, nullification_mappings)
+    changed_lexicon = compile_lexicon(
+        {
+            **categories_to_tokens,
+            TokenCategory.SUGGESTS_OMNI: categories_to_tokens[TokenCategory.SUGGESTS_OMNI] | {"xyzzy"},
+        },
+        nullification_mappings,
+    )
+    token_index = TokenIndex.build(food_store, lexicon)
+    impact = find_lexicon_impact(Categorizer(ref_store, food_store, lexicon=changed_lexicon), token_index, lexicon)
+    assert impact.n_candidate_foods == 0
+    assert impact.changes == []
+
+
+def test_token_index(foods):
+    food_store = make_food_store(foods)
+    token_index = TokenIndex.build(food_store, compile_lexicon(categories_to_tokens, nullification_mappings))
+    assert token_index.descriptions == [food.description.lower() for food in foods]
+    assert token_index.food_ids(token_index.descriptions_by_token["chicken"]) == [3, 5]
+    assert token_index.food_ids(token_index.descriptions_by_token["milk"]) == [1]
+    assert token_index.ingredient_graph.dependents([1]) == {1, 4, 5, 6}
+
+
+def test_load_or_build_token_index(foods, tmp_path):
+    food_store = make_food_store(foods)
+    database_path = str(tmp_path / "food_data.db")
+    lexicon = compile_lexicon(categories_to_tokens, nullification_mappings)
+    with patch.object(TokenIndex, "build", wraps=TokenIndex.build) as mock_build:
+        load_or_build_token_index(database_path, food_store, lexicon)
+        assert mock_build.call_count == 1
+        token_index = load_or_build_token_index(database_path, food_store, lexicon)
+        assert mock_build.call_count == 1
+        assert token_index.food_ids(token_index.descriptions_by_token["chicken"]) == [3, 5]
+
+        # categories aren't part of the index
+        food_store[3].diet_category = DietCategory.OMNI
+        load_or_build_token_index(database_path, food_store, lexicon)
+        assert mock_build.call_count == 1
+
+        food_store.descriptions[food_store.position(1)] = "Oat milk"
+        token_index = load_or_build_token_index(database_path, food_store, lexicon)
+        assert mock_build.call_count == 2
+        assert "oat milk" in token_index.descriptions_by_token
+
+        changed_lexicon = compile_lexicon(
+            {**categories_to_tokens, TokenCategory.SUGGESTS_VEGAN: {"wheat"}}, nullification_mappings
+        )
+        load_or_build_token_index(database_path, food_store, changed_lexicon)
+        assert mock_build.call_count == 3
@@ -0,0 +1,55 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+import pytest
+
+from food_categorizer import parallel
+from food_categorizer.categorizer import Categorizer
+from food_categorizer.description_based_categorizer import (
+    categories_to_tokens,
+    nullification_mappings,
+)
+from food_categorizer.lexicon import LexiconDiff, compile_lexicon
+from food_categorizer.models import DietCategory, ReferenceSample, TokenCategory
+from food_categorizer.parallel import categorize_all_in_parallel
+
+from .conftest import make_food, make_food_store
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+def test_categorize_all_in_parallel(foods, ref_store, columnar):
+    foods += [
+        make_food(8, "Sauce A", ingredients=[9]),
+        make_food(9, "Sauce B, with cheese", ingredients=[8]),
+    ]
+    food_store = make_food_store(foods, columnar=columnar)
+    ref_store.append_reference_sample(
+        ReferenceSample(
+            food_id=2,
+            expected_diet_category=DietCategory.VEGAN_OR_OMNI,
+            category="Flour",
+            description="Flour, wheat",
+        )
+    )
+    serial_categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    parallel_categorizer = Categorizer(ref_store=ref_store, food_store=food_store)
+    assert categorize_all_in_parallel(parallel_categorizer, jobs=2) == serial_categorizer.categorize_all()
+    assert parallel_categorizer.cycles == serial_categorizer.cycles
+
+
+@pytest.mark.parametrize("start_method", ["fork", "spawn"])
+def test_categorize_all_in_parallel_with_lexicon(foods, ref_store, monkeypatch, start_method):
+    # flour made from chicken, as far as the description goes
+    lexicon = compile_lexicon(
+        LexiconDiff(added={TokenCategory.SUGGESTS_OMNI: {"flour"}}, removed={}).apply(categories_to_tokens),
+        nullification_mappings,
+    )
+    monkeypatch.setattr(
+        parallel, "ProcessPoolExecutor", partial(ProcessPoolExecutor, mp_context=get_context(start_method))
+    )
+    food_store = make_food_store(foods)
+    serial_categories = Categorizer(ref_store=ref_store, food_store=food_store, lexicon=lexicon).categorize_all()
+    assert serial_categories != Categorizer(ref_store=ref_store, food_store=food_store).categorize_all()
+    parallel_categorizer = Categorizer(ref_store=ref_store, food_store=food_store, lexicon=lexicon)
+    assert categorize_all_in_parallel(parallel_categorizer, jobs=2) == serial_categories
@@ -0,0 +1,183 @@
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from food_categorizer import reference_samples_csv
+from food_categorizer.models import DietCategory, ReferenceSample
+from food_categorizer.reference_samples import open_reference_samples
+from food_categorizer.reference_samples_csv import (
+    ReferenceSamplesCsv,
+    repair_torn_last_line,
+)
+from food_categorizer.reference_samples_sqlite import ReferenceSamplesSqlite
+
+
+def make_reference_sample(food_id, expected_diet_category=DietCategory.VEGAN) -> ReferenceSample:
+    return ReferenceSample(
+        food_id=food_id,
+        expected_diet_category=expected_diet_category,
+        category="Somesuch and other miscellany",
+        description=f"Food {food_id}",
+    )
+
+
+def test_index_is_kept_in_sync_with_appends(ref_store):
+    ref_store.append_reference_sample(make_reference_sample(1))
+    with patch.object(type(ref_store), "read_all_reference_samples", autospec=True) as read_all:
+        read_all.side_effect = lambda store: iter([make_reference_sample(1)])
+        samples_by_id = ref_store.get_all_mapped_by_ids()
+        assert 1 in ref_store and 2 not in ref_store
+
+        ref_store.append_reference_sample(make_reference_sample(2))
+        ref_store.append_reference_sample(make_reference_sample(1, DietCategory.OMNI))
+        assert set(ref_store.get_all_ids()) == {1, 2}
+        assert len(ref_store) == 2
+        assert ref_store.get(1).expected_diet_category == DietCategory.OMNI
+        assert samples_by_id[2] == make_reference_sample(2)
+    read_all.assert_called_once()
+
+
+@pytest.mark.parametrize("file_name", ["reference_samples.csv", "reference_samples.db"])
+def test_reference_samples_are_persisted(tmp_path: Path, file_name):
+    with open_reference_samples(tmp_path / file_name, create=True) as ref_store:
+        ref_store.append_reference_sample(make_reference_sample(2))
+        ref_store.append_reference_sample(make_reference_sample(1))
+        ref_store.append_reference_sample(make_reference_sample(2, DietCategory.OMNI))
+    with open_reference_samples(tmp_path / file_name) as ref_store:
+        assert dict(ref_store.get_all_mapped_by_ids()) == {
+            1: make_reference_sample(1),
+            2: make_reference_sample(2, DietCategory.OMNI),
+        }
+
+
+@pytest.mark.parametrize(
+    ("file_name", "store_class"),
+    [
+        ("samples.csv", ReferenceSamplesCsv),
+        ("samples.db", ReferenceSamplesSqlite),
+        ("samples.sqlite", ReferenceSamplesSqlite),
+    ],
+)
+def test_open_reference_samples_from_environment(tmp_path: Path, monkeypatch, file_name, store_class):
+    monkeypatch.setenv("FOOD_CATEGORIZER_REFERENCE_SAMPLES", str(tmp_path / file_name))
+    with open_reference_samples(create=True) as ref_store:
+        assert type(ref_store) is store_class
+    assert (tmp_path / file_name).is_file()
+
+
+@pytest.mark.parametrize("file_name", ["missing.csv", "missing.db"])
+def test_open_missing_reference_samples(tmp_path: Path, file_name):
+    with pytest.raises(FileNotFoundError):
+        with open_reference_samples(tmp_path / file_name):
+            pass
+
+
+def read_committed_food_ids(path: Path):
+    # through a separate connection or file, i.e. what would survive if the process died now
+    with open_reference_samples(path) as ref_store:
+        return sorted(ref_store.get_all_ids())
+
+
+@pytest.mark.parametrize("file_name", ["reference_samples.csv", "reference_samples.db"])
+def test_group_commit(tmp_path: Path, file_name):
+    path = tmp_path / file_name
+    with open_reference_samples(path, create=True, flush_every=3) as ref_store:
+        ref_store.append_reference_sample(make_reference_sample(1))
+        ref_store.append_reference_sample(make_reference_sample(2))
+        assert read_committed_food_ids(path) == []
+        ref_store.append_reference_sample(make_reference_sample(3))
+        assert read_committed_food_ids(path) == [1, 2, 3]
+        ref_store.append_reference_sample(make_reference_sample(4))
+        ref_store.flush_interval = 0
+        ref_store.append_reference_sample(make_reference_sample(5))
+        assert read_committed_food_ids(path) == [1, 2, 3, 4, 5]
+        ref_store.flush_interval = None
+        ref_store.append_reference_sample(make_reference_sample(6))
+    # closing commits the rest
+    assert read_committed_food_ids(path) == [1, 2, 3, 4, 5, 6]
+
+
+@pytest.mark.parametrize("file_name", ["reference_samples.csv", "reference_samples.db"])
+def test_append_reference_samples(tmp_path: Path, file_name):
+    path = tmp_path / file_name
+    samples = [make_reference_sample(food_id) for food_id in range(1000)]
+    with open_reference_samples(path, create=True, fsync=True) as ref_store:
+        assert len(ref_store) == 0
+        ref_store.append_reference_samples(samples)
+        assert len(ref_store) == 1000
+        assert read_committed_food_ids(path) == list(range(1000))
+    with open_reference_samples(path) as ref_store:
+        assert list(ref_store.get_all_mapped_by_ids().values()) == samples
+
+
+def test_torn_last_line_is_removed_on_open(tmp_path: Path):
+    path = tmp_path / "reference_samples.csv"
+    with open_reference_samples(path, create=True) as ref_store:
+        ref_store.append_reference_sample(make_reference_sample(1))
+    with path.open("a", encoding="utf-8") as f:
+        f.write("2,VEG")
+    with open_reference_samples(path, create=True) as ref_store:
+        assert list(ref_store.get_all_ids()) == [1]
+        ref_store.append_reference_sample(make_reference_sample(3))
+    with open_reference_samples(path) as ref_store:
+        assert list(ref_store.get_all_ids()) == [1, 3]
+
+
+@pytest.mark.parametrize(("keep_complete_last_line", "expected_ids"), [(False, [1, 7]), (True, [1, 6, 7])])
+def test_unterminated_valid_last_line_on_open(tmp_path: Path, keep_complete_last_line, expected_ids):
+    path = tmp_path / "reference_samples.csv"
+    with open_reference_samples(path, create=True) as ref_store:
+        ref_store.append_reference_sample(make_reference_sample(1))
+    # could as well be a description cut off at a word boundary
+    with path.open("a", encoding="utf-8") as f:
+        f.write("6,OMNI,B,hand-edited")
+    with ReferenceSamplesCsv.from_path(path, create=True, keep_complete_last_line=keep_complete_last_line) as ref_store:
+        assert list(ref_store.get_all_ids()) == expected_ids[:-1]
+        ref_store.append_reference_sample(make_reference_sample(7))
+    with open_reference_samples(path) as ref_store:
+        assert list(ref_store.get_all_ids()) == expected_ids
+
+
+@pytest.mark.parametrize(
+    ("content", "expected_content"),
+    [
+        (b"", b""),
+        (b"header\n", b"header\n"),
+        (b"head", b""),
+        (b"header\nrow 1\nrow 2 is torn", b"header\nrow 1\n"),
+        (b"header\n" + b"x" * 100, b"header\n"),
+        (b"header\n6,OMNI,B", b"header\n"),
+        (b"header\n6,OMNIVORE,B,hand-edited", b"header\n"),
+        (b"header\n6,OMNI,B,hand-edited", b"header\n"),
+    ],
+)
+def test_repair_torn_last_line(tmp_path: Path, monkeypatch, content, expected_content):
+    monkeypatch.setattr(reference_samples_csv, "TAIL_CHUNK_SIZE", 8)
+    path = tmp_path / "file.csv"
+    path.write_bytes(content)
+    assert repair_torn_last_line(path) == max(0, len(content) - len(expected_content))
+    assert path.read_bytes() == expected_content
+
+
+@pytest.mark.parametrize(
+    ("content", "expected_content"),
+    [
+        (b"header\nrow 1\nrow 2 is torn", b"header\nrow 1\n"),
+        (b"header\n6,OMNI,B", b"header\n"),
+        (b"header\n6,OMNIVORE,B,hand-edited", b"header\n"),
+        # complete rows (or headers) that are only missing the newline are kept
+        (b"header\n6,OMNI,B,hand-edited", b"header\n6,OMNI,B,hand-edited\n"),
+        (b'header\n6,OMNI,B,"quoted, with comma"', b'header\n6,OMNI,B,"quoted, with comma"\n'),
+        (
+            b"food_id,expected_diet_category,category,description",
+            b"food_id,expected_diet_category,category,description\n",
+        ),
+    ],
+)
+def test_repair_torn_last_line_keeping_complete_line(tmp_path: Path, monkeypatch, content, expected_content):
+    monkeypatch.setattr(reference_samples_csv, "TAIL_CHUNK_SIZE", 8)
+    path = tmp_path / "file.csv"
+    path.write_bytes(content)
+    assert repair_torn_last_line(path, keep_complete_line=True) == max(0, len(content) - len(expected_content))
+    assert path.read_bytes() == expected_content
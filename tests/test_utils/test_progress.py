@@ -0,0 +1,44 @@
+import io
+from unittest.mock import patch
+
+from food_categorizer.utils import ProgressReporter, StageTimings
+
+
+class FakeTerminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_progress_reporter_is_silent_without_terminal():
+    stream = io.StringIO()
+    progress = ProgressReporter(100, stream=stream)
+    for i in range(100):
+        progress.update(i)
+    progress.finish()
+    assert stream.getvalue() == ""
+
+
+def test_progress_reporter_throttles_updates():
+    stream = FakeTerminal()
+    progress = ProgressReporter(100, stream=stream, interval=1.0)
+    with patch("food_categorizer.utils.time.monotonic", side_effect=[10.0, 10.5, 10.9, 11.0, 11.2]):
+        for i in range(5):
+            progress.update(i * 20)
+    assert stream.getvalue() == "  0%" + "\b" * 4 + " 60%"
+    progress.finish()
+    assert stream.getvalue().endswith("\b" * 4 + " " * 4 + "\b" * 4)
+
+
+def test_stage_timings():
+    timings = StageTimings()
+    with patch("food_categorizer.utils.time.perf_counter", side_effect=[1.0, 3.0, 5.0, 5.5]):
+        with timings.stage("load"):
+            pass
+        with timings.stage("stats"):
+            pass
+    timings.add_items("load", 100)
+    assert timings.seconds == {"load": 2.0, "stats": 0.5}
+    assert timings.as_dict() == {
+        "load": {"seconds": 2.0, "n_items": 100, "items_per_second": 50.0},
+        "stats": {"seconds": 0.5, "n_items": None, "items_per_second": None},
+    }
@@ -1,4 +1,6 @@
-from food_categorizer.utils import select_n_random
+import pytest
+
+from food_categorizer.utils import ReservoirSampler, select_n_random
 
 
 def test_select_n_random():
@@ -19,3 +21,23 @@ def test_select_n_random_with_criterion():
     assert len(set(selected)) == n
     assert all(s in l for s in selected)
     assert all(criterion(s) for s in selected)
+
+
+def test_reservoir_sampler():
+    n = 10
+    sampler = ReservoirSampler(n)
+    for i in range(100):
+        sampler.add(i)
+    selected = sampler.select()
+    assert len(selected) == n
+    assert len(set(selected)) == n
+    assert all(0 <= s < 100 for s in selected)
+
+
+def test_reservoir_sampler_pads():
+    sampler = ReservoirSampler(5)
+    for i in range(3):
+        sampler.add(i)
+    assert sampler.select(pad=lambda: -1) == [0, 1, 2, -1, -1]
+    with pytest.raises(ValueError):
+        sampler.select()
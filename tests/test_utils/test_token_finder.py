@@ -0,0 +1,50 @@
+import random
+
+import pytest
+
+from food_categorizer.description_based_categorizer import all_tokens
+from food_categorizer.utils import MaxiMunchTokenFinder, TrieTokenFinder
+
+
+@pytest.mark.parametrize(
+    "s,expected",
+    [
+        ("", []),
+        ("apple", ["apple"]),
+        ("pineapple juice", ["pineapple", "juice"]),
+        ("app", []),
+        ("applesauce", ["apples"]),
+        ("apple sauce", ["apple sauce"]),
+        ("apples, apple", ["apples", "apple"]),
+    ],
+)
+def test_trie_token_finder(s, expected):
+    finder = TrieTokenFinder(["apple", "apples", "pineapple", "pine", "juice", "sauce", "apple sauce"])
+    assert finder.find_all(s) == expected
+
+
+def test_trie_token_finder_matches_regex_token_finder():
+    regex_finder = MaxiMunchTokenFinder(all_tokens)
+    trie_finder = TrieTokenFinder(all_tokens)
+    random.seed(0)
+    fragments = sorted(all_tokens) + [" ", ", ", "-", "x", "s", "ed"]
+    for _ in range(2000):
+        s = "".join(random.choice(fragments) for _ in range(random.randint(0, 8)))
+        # also cut tokens in half to hit partial matches
+        s = s[random.randint(0, 3) :]
+        assert trie_finder.find_all(s) == regex_finder.find_all(s), s
+
+
+def test_find_mask():
+    token_masks = {"apple": 0b01, "apples": 0b01, "beef": 0b10}
+    for finder_class in [MaxiMunchTokenFinder, TrieTokenFinder]:
+        finder = finder_class(token_masks, token_masks)
+        assert finder.find_mask("") == 0
+        assert finder.find_mask("apples") == 0b01
+        assert finder.find_mask("apple with beef") == 0b11
+
+
+@pytest.mark.parametrize("finder_class", [MaxiMunchTokenFinder, TrieTokenFinder])
+def test_find_mask_without_token_masks(finder_class):
+    assert finder_class(["apple", "beef"]).find_mask("apple with beef") == 0
+    assert finder_class(["apple", "beef"], {"beef": 0b10}).find_mask("apple with beef") == 0b10